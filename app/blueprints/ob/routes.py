@@ -1,6 +1,11 @@
-from flask import render_template, jsonify
+import hmac
+import math
+from flask import render_template, jsonify, request, Response
 from app.blueprints.ob import ob_bp
-from app.config import CONFIG
+from app.config import ADMIN_TOKEN, CONFIG, HISTORY_INTERVAL
+from app.services import websocket_service
+from app.services.metrics import profiler, registry
+from app.services import payload_cache
 
 @ob_bp.route('/')
 def index():
@@ -9,3 +14,144 @@ def index():
 @ob_bp.route('/api/config')
 def get_config():
     return jsonify(CONFIG)
+
+@ob_bp.route('/api/publisher_metrics')
+def get_publisher_metrics():
+    return jsonify(websocket_service.get_publisher_metrics())
+
+@ob_bp.route('/metrics')
+def get_metrics():
+    # Prometheus文本格式
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@ob_bp.route('/debug/profiler', methods=['GET', 'POST'])
+def toggle_profiler():
+    # POST action=start开始采样(可选interval秒)，POST action=stop停止；GET只查看状态，返回折叠栈，可直接生成火焰图
+    action = request.values.get('action')
+    if action is not None and request.method != 'POST':
+        return jsonify({'error': 'start/stop需要使用POST请求'}), 405, {'Allow': 'POST'}
+    if action == 'start':
+        profiler.start(request.values.get('interval', type=float))
+    elif action == 'stop':
+        profiler.stop()
+    elif action is not None:
+        return jsonify({'error': f'不支持的操作 {action}'}), 400
+    if action == 'start' or (action is None and profiler.is_running()):
+        return jsonify({'running': profiler.is_running(), 'interval': profiler.interval, 'samples': profiler.samples})
+    return Response(profiler.report(request.values.get('limit', type=int)), mimetype='text/plain')
+
+@ob_bp.route('/api/history')
+def get_history():
+    # 参数: symbol, market, start/end（毫秒时间戳，可选）, resolution（降采样的秒数，可选，不小于采样间隔）
+    symbol = request.args.get('symbol', 'BTC')
+    market = request.args.get('market', 'spot')
+    resolution = request.args.get('resolution')
+    if resolution is not None:
+        try:
+            resolution = float(resolution)
+        except ValueError:
+            resolution = math.nan
+        if not math.isfinite(resolution) or resolution < HISTORY_INTERVAL:
+            return jsonify({'error': f'resolution必须是不小于采样间隔{HISTORY_INTERVAL:g}秒的数值'}), 400
+    history = websocket_service.get_history(
+        symbol, market,
+        request.args.get('start', type=int),
+        request.args.get('end', type=int),
+        resolution
+    )
+    if history is None:
+        return jsonify({'error': f'没有 {symbol} {market} 的历史数据'}), 404
+    return jsonify(history)
+
+@ob_bp.route('/api/depth/<symbol>')
+def get_depth(symbol):
+    # 当前各市场的档位数据，同一版本只编码一次；支持If-None-Match(304)和gzip，format=msgpack返回MessagePack
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'msgpack'):
+        return jsonify({'error': f'不支持的格式 {fmt}'}), 400
+    if fmt == 'msgpack' and payload_cache.msgpack is None:
+        return jsonify({'error': '服务端没有安装msgpack'}), 406
+    payload = websocket_service.get_depth_payload(symbol)
+    if payload is None:
+        return jsonify({'error': f'没有交易对 {symbol}'}), 404
+    etag = f"{payload.etag}-{fmt}"
+    mimetype = 'application/msgpack' if fmt == 'msgpack' else 'application/json'
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        compress = 'gzip' in request.accept_encodings
+        response = Response(payload.body(fmt, compress), mimetype=mimetype)
+        if compress:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag, weak=True)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def require_admin():
+    """
+    检查管理接口令牌，通过时返回None，否则返回错误响应
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({'error': '管理接口未启用，需要设置环境变量OB_ADMIN_TOKEN'}), 403
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        return jsonify({'error': '令牌无效'}), 401
+    return None
+
+def parse_market_config(markets):
+    """
+    把请求中的 {market: {step: threshold}} 转为CONFIG格式，JSON中的步长是字符串，转为数值
+    """
+    if not isinstance(markets, dict) or not markets:
+        raise ValueError('markets必须是非空对象')
+    market_config = {}
+    for market, steps in markets.items():
+        if not isinstance(steps, dict) or not steps:
+            raise ValueError(f'{market} 的步长必须是非空对象')
+        market_config[market] = {}
+        for step, threshold in steps.items():
+            try:
+                step = float(step)
+                threshold = float(threshold)
+            except (TypeError, ValueError):
+                raise ValueError(f'{market} 的步长和阈值必须是数值')
+            if not (math.isfinite(step) and step > 0 and math.isfinite(threshold) and threshold > 0):
+                raise ValueError(f'{market} 的步长和阈值必须是正数')
+            market_config[market][int(step) if step.is_integer() else step] = threshold
+    return market_config
+
+@ob_bp.route('/api/symbols', methods=['POST'])
+def add_symbol():
+    # 运行时添加交易对，需要管理令牌；请求体 {"symbol": "SOLUSDT", "markets": {"spot": {"1": 500}}}
+    denied = require_admin()
+    if denied:
+        return denied
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('symbol'), str) or not body['symbol']:
+        return jsonify({'error': '请求体需要symbol和markets'}), 400
+    symbol = body['symbol'].upper()
+    if symbol in CONFIG:
+        return jsonify({'error': f'交易对 {symbol} 已存在'}), 409
+    try:
+        websocket_service.add_symbol(symbol, parse_market_config(body.get('markets')))
+    except (ValueError, RuntimeError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'symbol': symbol, 'markets': CONFIG[symbol]}), 201
+
+@ob_bp.route('/api/symbols/<symbol>', methods=['DELETE'])
+def remove_symbol(symbol):
+    # 运行时移除交易对，需要管理令牌；symbol可以是BTC或BTCUSDT
+    denied = require_admin()
+    if denied:
+        return denied
+    symbol = symbol.upper()
+    if symbol not in CONFIG and symbol + 'USDT' in CONFIG:
+        symbol += 'USDT'
+    if symbol not in CONFIG:
+        return jsonify({'error': f'没有交易对 {symbol}'}), 404
+    try:
+        websocket_service.remove_symbol(symbol)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'symbol': symbol, 'removed': True})
@@ -1,3 +1,5 @@
+import os
+
 CONFIG = {
     'BTCUSDT': {
         'futures': {10:150,20: 300, 50: 500},
@@ -13,4 +15,83 @@ CONFIG = {
 BINANCE_WS_URL = {
     'spot': 'wss://stream.binance.com:443/ws',
     'futures': 'wss://fstream.binance.com/ws'
-}
\ No newline at end of file
+}
+
+# 币安REST深度快照URL
+BINANCE_REST_URL = {
+    'spot': 'https://api.binance.com/api/v3/depth',
+    'futures': 'https://fapi.binance.com/fapi/v1/depth'
+}
+
+# 深度快照档数
+SNAPSHOT_LIMIT = 1000
+
+# 每个步长在当前价上下各计算的档位数量
+LEVEL_COUNT = 2
+
+# 推送线程节拍（秒）
+PUSH_INTERVAL = 0.1
+
+# 每个市场接收队列的最大长度，超出时丢弃消息并由同步状态机重新同步
+RECEIVE_QUEUE_SIZE = 10000
+
+# 深度数据流后缀，如 btcusdt@depth
+DEPTH_STREAM = '@depth'
+
+# 每个WebSocket连接订阅的最大数据流数量，超出时为该市场新建连接
+STREAMS_PER_CONNECTION = 50
+
+# 每个连接分片同时保持的冗余连接数，多条连接的同一条增量按更新ID只处理最先到达的一份，
+# 单条连接断开时其他连接继续提供行情，不需要重新同步
+FEED_REDUNDANCY = 1
+
+# 接收模式：'thread' 在后台线程的事件循环中接收；'process' 每个连接分片一个接收进程，通过共享内存发布订单簿
+INGEST_MODE = 'thread'
+
+# 多进程模式下每个订单簿在共享内存中保存的档数（每边）
+SHARED_BOOK_LEVELS = 1000
+
+# 原始行情录制文件路径，None表示不录制（仅thread接收模式）
+CAPTURE_PATH = None
+
+# 订单簿默认保留策略：('percent', 0.5) 只保留距当前价0.5%以内的挂单；
+# ('levels', 5000) 每边最多保留5000档；('full', None) 保留全部深度
+DEFAULT_RETENTION = ('percent', 0.5)
+
+# 按交易对覆盖保留策略，如 {'BTCUSDT': ('full', None)}
+RETENTION = {}
+
+# 每个交易对和市场的最小价格变动单位，订单簿内部以整数tick保存价格；
+# 可以小于交易所实际的最小变动单位，但不能更大，且CONFIG中的步长必须是它的整数倍
+TICK_SIZE = {
+    'BTCUSDT': {'futures': 0.01, 'spot': 0.01},
+    'ETHUSDT': {'futures': 0.01, 'spot': 0.01}
+}
+
+# 未在TICK_SIZE中配置的交易对使用的最小价格变动单位
+DEFAULT_TICK_SIZE = 0.00000001
+
+# 机器学习特征采集的Parquet输出目录，None表示不采集（需要numpy和pyarrow）
+FEATURE_CAPTURE_DIR = None
+
+# 特征采集间隔（秒）和标签的预测时长（秒）
+FEATURE_INTERVAL = 1.0
+FEATURE_HORIZON = 300
+
+# 未来收益率超过该比例标记为涨(1)，低于其相反数标记为跌(-1)
+FEATURE_LABEL_THRESHOLD = 0.001
+
+# 档位历史的采样间隔（秒）和保留时长（秒），需要numpy
+HISTORY_INTERVAL = 1.0
+HISTORY_SECONDS = 21600
+
+# 大额挂单提醒：挂单量达到CONFIG阈值并持续ALERT_DEBOUNCE秒后提醒，
+# 降到阈值*ALERT_CLEAR_RATIO以下才解除，同一区间ALERT_COOLDOWN秒内不重复提醒
+ALERT_ENABLED = True
+ALERT_CLEAR_RATIO = 0.8
+ALERT_DEBOUNCE = 1.0
+ALERT_COOLDOWN = 60.0
+
+# 管理接口（运行时增删交易对）的令牌，请求需带 Authorization: Bearer <令牌>；
+# 从环境变量OB_ADMIN_TOKEN读取，未设置时管理接口关闭
+ADMIN_TOKEN = os.environ.get('OB_ADMIN_TOKEN')
@@ -0,0 +1,126 @@
+import math
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+# 价格除以步长时的容差，避免浮点误差把边界上的价格分到相邻区间
+BUCKET_EPSILON = 1e-9
+
+# 挂单量低于阈值的该百分比时背景完全透明，之后线性加深，达到阈值时不透明
+OPACITY_START = 35
+
+
+def ask_bucket(price, step):
+    """
+    卖单区间编号k，区间为 [k*step, (k+1)*step)
+    """
+    return math.floor(price / step + BUCKET_EPSILON)
+
+
+def bid_bucket(price, step):
+    """
+    买单区间编号k，区间为 (k*step, (k+1)*step]
+    """
+    return math.ceil(price / step - BUCKET_EPSILON) - 1
+
+
+def read_bucket_levels(ask_totals, bid_totals, ask_start, bid_start, step, level_count):
+    """
+    从按步长划分的区间挂单量中取出当前价上下各level_count档
+
+    ask_start/bid_start为包含当前价的卖单/买单区间编号；卖单档位价格为区间上沿，买单为区间下沿
+    """
+    ask_levels = []
+    for i in range(level_count):
+        ask_levels.append({
+            'price': (ask_start + i + 1) * step,
+            'quantity': ask_totals.get(ask_start + i, 0.0)
+        })
+    bid_levels = []
+    for i in range(level_count):
+        bid_levels.append({
+            'price': (bid_start - i) * step,
+            'quantity': bid_totals.get(bid_start - i, 0.0)
+        })
+    return {'ask_levels': ask_levels, 'bid_levels': bid_levels}
+
+
+def build_cumulative(orders, descending=False):
+    """
+    把 [[price, quantity], ...] 转为升序价格列表和前缀和（首项为0）
+    """
+    if descending:
+        orders = orders[::-1]
+    prices = [order[0] for order in orders]
+    cumulative = [0.0]
+    cumulative.extend(accumulate(order[1] for order in orders))
+    return prices, cumulative
+
+
+def aggregate_levels(bids, asks, current_price, steps, level_count):
+    """
+    由最优价优先的 [[price, quantity], ...] 计算所有步长的档位区间挂单量
+
+    区间按步长的整数倍划分，与OrderBook中增量维护的区间一致（边界同样带BUCKET_EPSILON容差），
+    每个区间用前缀和加二分查找求和
+    """
+    ask_prices, ask_cumulative = build_cumulative(asks)
+    bid_prices, bid_cumulative = build_cumulative(bids, descending=True)
+    levels = {}
+    for step in steps:
+        ask_start = ask_bucket(current_price, step)
+        bid_start = bid_bucket(current_price, step)
+        ask_totals = {}
+        bid_totals = {}
+        for i in range(level_count):
+            index = ask_start + i
+            lower = bisect_left(ask_prices, (index - BUCKET_EPSILON) * step)
+            upper = bisect_left(ask_prices, (index + 1 - BUCKET_EPSILON) * step)
+            ask_totals[index] = ask_cumulative[upper] - ask_cumulative[lower]
+            index = bid_start - i
+            lower = bisect_right(bid_prices, (index + BUCKET_EPSILON) * step)
+            upper = bisect_right(bid_prices, (index + 1 + BUCKET_EPSILON) * step)
+            bid_totals[index] = bid_cumulative[upper] - bid_cumulative[lower]
+        levels[step] = read_bucket_levels(ask_totals, bid_totals, ask_start, bid_start, step, level_count)
+    return levels
+
+
+def step_decimals(step):
+    """
+    步长的小数位数，用于格式化档位价格，如 10 -> 0，0.5 -> 1
+    """
+    text = repr(float(step))
+    if 'e' in text:
+        return max(0, -int(text.split('e')[1]))
+    return len(text.split('.')[1].rstrip('0'))
+
+
+def build_render_rows(step_levels, step, threshold, previous=None):
+    """
+    把单个步长的档位转换为页面直接显示的行 [价格, 数量, 背景透明度]
+
+    卖单和买单都按价格从高到低排列，价格和数量已格式化为字符串，透明度由挂单量占阈值的百分比计算；
+    previous为上次的 (档位, 显示行)，价格和挂单量都没变的档位沿用上次的行，只格式化有变化的档位
+    """
+    price_format = '%.' + str(step_decimals(step)) + 'f'
+
+    def render_side(levels, old_levels, old_rows):
+        rows = []
+        for index, level in enumerate(levels):
+            if index < len(old_levels) and old_levels[index] == level:
+                rows.append(old_rows[index])
+                continue
+            quantity = level['quantity']
+            percentage = quantity / threshold * 100 if threshold else 100.0
+            opacity = 0.0
+            if percentage >= OPACITY_START:
+                opacity = 1.0 if percentage >= 100 else round((percentage - OPACITY_START) / (100 - OPACITY_START), 3)
+            rows.append([price_format % level['price'], '%.2f' % quantity, opacity])
+        return rows
+
+    old_levels, old_rows = previous if previous else ({'ask_levels': (), 'bid_levels': ()}, None)
+    ask_rows = render_side(step_levels['ask_levels'], old_levels['ask_levels'],
+                           old_rows['ask_rows'][::-1] if old_rows else ())
+    bid_rows = render_side(step_levels['bid_levels'], old_levels['bid_levels'],
+                           old_rows['bid_rows'] if old_rows else ())
+    ask_rows.reverse()
+    return {'ask_rows': ask_rows, 'bid_rows': bid_rows}
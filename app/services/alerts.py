@@ -0,0 +1,140 @@
+import heapq
+import time
+from app.config import CONFIG
+
+SIDES = (('ask', 'ask_levels'), ('bid', 'bid_levels'))
+MARKET_NAMES = {'spot': '现货', 'futures': '合约'}
+SIDE_NAMES = {'ask': '卖单', 'bid': '买单'}
+
+
+class AlertEngine:
+    def __init__(self, clear_ratio=0.8, debounce=1.0, cooldown=60.0):
+        """
+        大额挂单提醒：区间挂单量达到CONFIG中对应步长的阈值时触发
+
+        只检查档位有变化的步长，每个步长最多level_count*2个区间；挂单量需持续debounce秒
+        不低于阈值才触发，降到阈值*clear_ratio以下才解除，同一区间触发后cooldown秒内不重复提醒
+        """
+        self.clear_ratio = clear_ratio
+        self.debounce = debounce
+        self.cooldown = cooldown
+        # (symbol, market, step) -> 上次检查的档位
+        self.last_levels = {}
+        # (symbol, market, step) -> 上次检查时显示范围内的区间
+        self.visible = {}
+        # 区间 (symbol, market, step, side, price) -> [首次达到阈值的时间, 挂单量]
+        self.pending = {}
+        # 已触发且未解除的区间
+        self.active = set()
+        # 区间 -> 上次提醒时间
+        self.fired_at = {}
+        # 按到期时间排序的 (debounce到期时间, 首次达到阈值的时间, 区间) 和 (冷却结束时间, 提醒时间, 区间)，
+        # flush只取出已到期的项；区间状态变化后旧的项留在堆中，取出时与当前状态不符则跳过
+        self.debounce_heap = []
+        self.cooldown_heap = []
+
+    def evaluate(self, symbol, market, levels, now=None):
+        """
+        检查一个市场的最新档位，更新各区间状态；提醒由flush发出
+        """
+        if now is None:
+            now = time.monotonic()
+        thresholds = CONFIG.get(symbol, {}).get(market, {})
+        for step, step_levels in (levels or {}).items():
+            key = (symbol, market, step)
+            previous = self.last_levels.get(key)
+            # 快照在版本间复用没有变化的档位对象，相同对象或相等内容时跳过
+            if previous is step_levels or previous == step_levels:
+                continue
+            self.last_levels[key] = step_levels
+            threshold = thresholds.get(step)
+            if not threshold:
+                continue
+            visible = set()
+            for side, field in SIDES:
+                for level in step_levels.get(field, ()):
+                    bucket = key + (side, level['price'])
+                    visible.add(bucket)
+                    self.update_bucket(bucket, level['quantity'], threshold, now)
+            # 移出显示范围的区间视为解除，只比较这个步长上次显示的区间
+            for bucket in self.visible.get(key, set()) - visible:
+                self.pending.pop(bucket, None)
+                self.active.discard(bucket)
+            self.visible[key] = visible
+
+    def update_bucket(self, bucket, quantity, threshold, now):
+        """
+        按滞回规则更新单个区间
+        """
+        if bucket in self.active:
+            if quantity < threshold * self.clear_ratio:
+                self.active.discard(bucket)
+        elif quantity >= threshold:
+            state = self.pending.get(bucket)
+            if state is None:
+                self.pending[bucket] = [now, quantity]
+                heapq.heappush(self.debounce_heap, (now + self.debounce, now, bucket))
+            else:
+                state[1] = quantity
+        else:
+            self.pending.pop(bucket, None)
+
+    def flush(self, now=None):
+        """
+        返回持续时间已满debounce的区间的提醒，只取出已到期的项，不遍历全部区间
+        """
+        if not self.debounce_heap and not self.cooldown_heap:
+            return []
+        if now is None:
+            now = time.monotonic()
+        # 清理冷却期已过的记录
+        while self.cooldown_heap and self.cooldown_heap[0][0] <= now:
+            _, fired_at, bucket = heapq.heappop(self.cooldown_heap)
+            if self.fired_at.get(bucket) == fired_at:
+                del self.fired_at[bucket]
+        alerts = []
+        while self.debounce_heap and self.debounce_heap[0][0] <= now:
+            _, since, bucket = heapq.heappop(self.debounce_heap)
+            state = self.pending.get(bucket)
+            # 已解除或之后重新开始计时的区间，由对应的新项处理
+            if state is None or state[0] != since:
+                continue
+            del self.pending[bucket]
+            self.active.add(bucket)
+            fired_at = self.fired_at.get(bucket)
+            if fired_at is not None and now - fired_at < self.cooldown:
+                continue
+            self.fired_at[bucket] = now
+            heapq.heappush(self.cooldown_heap, (now + self.cooldown, now, bucket))
+            alerts.append(self.build_alert(bucket, state[1]))
+        return alerts
+
+    def build_alert(self, bucket, quantity):
+        symbol, market, step, side, price = bucket
+        threshold = CONFIG[symbol][market][step]
+        short_symbol = symbol[:-len('USDT')] if symbol.endswith('USDT') else symbol
+        return {
+            'type': side,
+            'symbol': short_symbol,
+            'market': market,
+            'step': step,
+            'price': price,
+            'quantity': quantity,
+            'threshold': threshold,
+            'message': (
+                f"{short_symbol} {MARKET_NAMES.get(market, market)} 步长{step} {SIDE_NAMES[side]} "
+                f"{price:g} 附近挂单量 {quantity:.2f} 超过阈值 {threshold}"
+            )
+        }
+
+    def reset(self, symbol, market=None):
+        """
+        删除交易对（或其中一个市场）的状态
+        """
+        def matches(key):
+            return key[0] == symbol and (market is None or key[1] == market)
+        self.last_levels = {key: value for key, value in self.last_levels.items() if not matches(key)}
+        self.visible = {key: value for key, value in self.visible.items() if not matches(key)}
+        self.pending = {key: value for key, value in self.pending.items() if not matches(key)}
+        self.active = {key for key in self.active if not matches(key)}
+        self.fired_at = {key: value for key, value in self.fired_at.items() if not matches(key)}
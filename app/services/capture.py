@@ -0,0 +1,285 @@
+import asyncio
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from app.services import metrics
+from app.services.decoder import decode_message
+
+# 文件头
+MAGIC = b'OBCAP\x00\x01\x00'
+# 块头: 压缩后长度, 帧数, 第一帧接收时间(ns)
+CHUNK_HEADER = struct.Struct('<IIQ')
+# 帧头: 接收时间(ns), 数据流名称长度, 数据长度
+FRAME_HEADER = struct.Struct('<QHI')
+# 深度快照使用的数据流名称前缀，格式 snapshot/<market>/<symbol>
+SNAPSHOT_PREFIX = 'snapshot/'
+
+
+class FrameRecorder:
+    def __init__(self, path, chunk_frames=2000, chunk_seconds=1.0, level=1, max_pending=100000):
+        """
+        把原始行情帧和接收时间写入追加式、分块压缩的二进制文件
+
+        record只把帧放入队列，压缩和写盘在后台线程中完成，可以在生产环境长期开启；
+        写盘跟不上时队列最多缓存max_pending帧，超出的帧丢弃并计入MESSAGES_FAILED
+        """
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.chunk_seconds = chunk_seconds
+        self.level = level
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.frames = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self.closed = False
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # 上次进程崩溃时末尾可能留下不完整的块，先截断，否则之后追加的块无法读取
+        recover_file(path)
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def record(self, stream, data, received_ns=None, market=None):
+        """
+        记录一帧，stream为市场名称（如 'futures'），data为原始文本；不阻塞调用方，队列已满时丢弃
+        """
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait((received_ns or time.time_ns(), stream, data))
+        except queue.Full:
+            self.dropped += 1
+            metrics.MESSAGES_FAILED.inc(market or stream, 'capture_full')
+
+    def record_snapshot(self, symbol, market, snapshot):
+        """
+        记录REST深度快照，回放时代替网络请求
+        """
+        self.record(f"{SNAPSHOT_PREFIX}{market}/{symbol}", json.dumps(snapshot), market=market)
+
+    def run(self):
+        buffer = []
+        deadline = time.monotonic() + self.chunk_seconds
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is not None and item[1] is not None:
+                buffer.append(item)
+            stopping = item is not None and item[1] is None
+            if buffer and (stopping or len(buffer) >= self.chunk_frames or time.monotonic() >= deadline):
+                self.write_chunk(buffer)
+                buffer = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.chunk_seconds
+            if stopping:
+                break
+
+    def write_chunk(self, frames):
+        parts = []
+        for received_ns, stream, data in frames:
+            stream_bytes = stream.encode()
+            data_bytes = data.encode() if isinstance(data, str) else data
+            parts.append(FRAME_HEADER.pack(received_ns, len(stream_bytes), len(data_bytes)))
+            parts.append(stream_bytes)
+            parts.append(data_bytes)
+        payload = zlib.compress(b''.join(parts), self.level)
+        self.file.write(CHUNK_HEADER.pack(len(payload), len(frames), frames[0][0]) + payload)
+        self.file.flush()
+        self.frames += len(frames)
+        self.bytes_written += CHUNK_HEADER.size + len(payload)
+
+    def close(self, timeout=5.0):
+        """
+        写入剩余的帧并关闭文件；写盘线程timeout秒内没有腾出队列空间时，丢弃还没写入的帧（计入dropped），不阻塞关闭
+        """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.queue.put((0, None, None), timeout=timeout)
+        except queue.Full:
+            discarded = self.discard_pending()
+            print(f"录制写盘跟不上，关闭时丢弃 {discarded} 帧")
+            try:
+                self.queue.put((0, None, None), timeout=timeout)
+            except queue.Full:
+                pass
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            # 写盘线程仍在写入，不能关闭它正在使用的文件，由进程退出时回收
+            print(f"录制线程在 {timeout} 秒内没有结束，{self.path} 末尾的块可能不完整")
+            return
+        self.file.close()
+
+    def discard_pending(self):
+        """
+        清空队列中还没写入的帧，返回丢弃的帧数
+        """
+        discarded = 0
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+            discarded += 1
+        self.dropped += discarded
+        return discarded
+
+
+def recover_file(path):
+    """
+    把录制文件截断到最后一个完整的块：只读取块头跳过各块，只解压最后一个块确认完整；
+    文件头不完整时清空文件，不是录制文件时抛出ValueError，返回截断的字节数
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r+b') as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(0)
+        magic = f.read(len(MAGIC))
+        if size < len(MAGIC) and MAGIC.startswith(magic):
+            f.truncate(0)
+            return size
+        if magic != MAGIC:
+            raise ValueError(f"{path} 不是行情录制文件")
+        end = last = len(MAGIC)
+        while True:
+            header = f.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                break
+            length = CHUNK_HEADER.unpack(header)[0]
+            if end + CHUNK_HEADER.size + length > size:
+                break
+            last = end
+            end += CHUNK_HEADER.size + length
+            f.seek(end)
+        if end > last:
+            f.seek(last + CHUNK_HEADER.size)
+            try:
+                zlib.decompress(f.read(end - last - CHUNK_HEADER.size))
+            except zlib.error:
+                end = last
+        if end < size:
+            f.truncate(end)
+            print(f"{path} 末尾有不完整的块，已截断 {size - end} 字节")
+        return size - end
+
+
+def iter_frames(path):
+    """
+    按顺序读取录制文件，返回 (接收时间ns, stream, data) ；末尾不完整的块会被忽略
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} 不是行情录制文件")
+        while True:
+            header = f.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                return
+            length, count, _ = CHUNK_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            raw = zlib.decompress(payload)
+            offset = 0
+            for _ in range(count):
+                received_ns, stream_length, data_length = FRAME_HEADER.unpack_from(raw, offset)
+                offset += FRAME_HEADER.size
+                stream = raw[offset:offset + stream_length].decode()
+                offset += stream_length
+                data = raw[offset:offset + data_length].decode()
+                offset += data_length
+                yield received_ns, stream, data
+
+
+class RecordingSnapshotFetcher:
+    def __init__(self, fetcher, recorder):
+        """
+        包装快照获取器，把获取到的快照写入录制文件
+        """
+        self.fetcher = fetcher
+        self.recorder = recorder
+
+    async def __call__(self, symbol, market):
+        snapshot = await self.fetcher(symbol, market)
+        self.recorder.record_snapshot(symbol, market, snapshot)
+        return snapshot
+
+    @property
+    def rest_urls(self):
+        return self.fetcher.rest_urls
+
+
+class ReplaySnapshotFetcher:
+    def __init__(self):
+        """
+        回放时按录制顺序提供快照，不访问网络；快照还没回放到时等待
+        """
+        self.snapshots = {}
+        self.waiters = {}
+
+    def add(self, symbol, market, snapshot):
+        key = (symbol, market)
+        waiter = self.waiters.pop(key, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(snapshot)
+        else:
+            self.snapshots.setdefault(key, []).append(snapshot)
+
+    async def __call__(self, symbol, market):
+        key = (symbol, market)
+        pending = self.snapshots.get(key)
+        if pending:
+            return pending.pop(0)
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters[key] = waiter
+        return await waiter
+
+
+async def replay(path, service, speed=None):
+    """
+    把录制的帧依次送入service.process_message
+
+    speed为None或0时尽可能快地回放，1为实时，大于1为加速；返回回放统计
+    """
+    fetcher = ReplaySnapshotFetcher()
+    service.snapshot_fetcher = fetcher
+    frames = 0
+    first_ns = None
+    started = time.perf_counter()
+    for received_ns, stream, data in iter_frames(path):
+        if stream.startswith(SNAPSHOT_PREFIX):
+            market, symbol = stream[len(SNAPSHOT_PREFIX):].split('/', 1)
+            fetcher.add(symbol, market, json.loads(data))
+            continue
+        if first_ns is None:
+            first_ns = received_ns
+        if speed:
+            delay = (received_ns - first_ns) / 1e9 / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        message = decode_message(data)
+        if 's' in message:
+            await service.process_message(message, message['s'], stream)
+        frames += 1
+        # 让出事件循环，使快照加载等任务得以执行
+        await asyncio.sleep(0)
+    for synchronizer in list(service.depth_synchronizers.values()):
+        synchronizer.cancel()
+    elapsed = time.perf_counter() - started
+    return {
+        'frames': frames,
+        'elapsed': elapsed,
+        'frames_per_second': frames / elapsed if elapsed > 0 else 0.0
+    }
@@ -0,0 +1,73 @@
+import json
+from typing import List, Optional, Tuple
+
+# 可选的高性能解码库，未安装时回退到标准库json
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if msgspec is not None:
+    class DepthUpdate(msgspec.Struct):
+        """
+        深度增量消息，价格和数量保持为字符串，直到写入订单簿时才转换
+
+        提供get/in/[]访问，和json解码出的dict用法一致
+        """
+        e: Optional[str] = None
+        E: Optional[int] = None
+        s: Optional[str] = None
+        U: Optional[int] = None
+        u: Optional[int] = None
+        pu: Optional[int] = None
+        b: List[Tuple[str, str]] = []
+        a: List[Tuple[str, str]] = []
+        c: Optional[str] = None
+
+        def get(self, key, default=None):
+            value = getattr(self, key, None)
+            return default if value is None else value
+
+        def __contains__(self, key):
+            return getattr(self, key, None) is not None
+
+        def __getitem__(self, key):
+            value = getattr(self, key, None)
+            if value is None:
+                raise KeyError(key)
+            return value
+
+    _depth_decoder = msgspec.json.Decoder(DepthUpdate)
+
+    def decode_message(raw):
+        """
+        解码一帧行情消息（msgspec），非对象消息回退为通用解码
+        """
+        try:
+            return _depth_decoder.decode(raw)
+        except msgspec.ValidationError:
+            return msgspec.json.decode(raw)
+
+    BACKEND = 'msgspec'
+elif orjson is not None:
+    def decode_message(raw):
+        """
+        解码一帧行情消息（orjson）
+        """
+        return orjson.loads(raw)
+
+    BACKEND = 'orjson'
+else:
+    def decode_message(raw):
+        """
+        解码一帧行情消息（标准库json）
+        """
+        return json.loads(raw)
+
+    BACKEND = 'json'
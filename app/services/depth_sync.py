@@ -0,0 +1,175 @@
+import asyncio
+import aiohttp
+from collections import deque
+from app.config import BINANCE_REST_URL, SNAPSHOT_LIMIT
+
+
+class BinanceSnapshotFetcher:
+    def __init__(self, rest_urls=None, limit=SNAPSHOT_LIMIT, get_session=None):
+        """
+        通过REST接口获取深度快照，rest_urls可替换为本地模拟服务地址
+
+        get_session返回共用的ClientSession（如WebSocketService.get_http_session），为None时自己创建会话
+        """
+        self.rest_urls = rest_urls or BINANCE_REST_URL
+        self.limit = limit
+        self.get_session = get_session
+        self.session = None
+
+    async def __call__(self, symbol, market):
+        """
+        获取快照，返回 {'lastUpdateId': int, 'bids': [...], 'asks': [...]}
+        """
+        if self.get_session is not None:
+            session = self.get_session()
+        else:
+            if self.session is None or self.session.closed:
+                self.session = aiohttp.ClientSession()
+            session = self.session
+        params = {'symbol': symbol, 'limit': self.limit}
+        timeout = aiohttp.ClientTimeout(total=10)
+        async with session.get(self.rest_urls[market], params=params, timeout=timeout) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class DepthSynchronizer:
+    STATE_SYNCING = 'syncing'
+    STATE_SYNCED = 'synced'
+
+    def __init__(self, symbol, market, fetch_snapshot, on_snapshot, on_update,
+                 max_buffer=5000, retry_delay=1):
+        """
+        单个(symbol, market)的快照+增量同步状态机
+
+        未同步时缓存增量并拉取快照，丢弃快照之前的旧增量；
+        同步后校验U/u/pu连续性，发现缺口时只对该交易对重新拉取快照，不重连WebSocket
+        """
+        self.symbol = symbol
+        self.market = market
+        self.fetch_snapshot = fetch_snapshot
+        self.on_snapshot = on_snapshot
+        self.on_update = on_update
+        self.retry_delay = retry_delay
+        self.state = self.STATE_SYNCING
+        self.buffer = deque(maxlen=max_buffer)
+        self.snapshot = None
+        self.last_update_id = None
+        self.fetch_task = None
+        self.resync_count = 0
+        self.dropped_count = 0
+
+    def is_synced(self):
+        return self.state == self.STATE_SYNCED
+
+    def handle(self, event):
+        """
+        处理一条深度增量，需要在事件循环中调用
+        """
+        if self.state == self.STATE_SYNCED:
+            if self._is_next(event):
+                self.last_update_id = event['u']
+                self.on_update(event)
+            elif event['u'] <= self.last_update_id:
+                # 重复或过期的增量
+                self.dropped_count += 1
+            else:
+                print(f"{self.symbol} {self.market} 深度序号不连续，"
+                      f"期望 {self.last_update_id}，收到 U={event['U']} u={event['u']}，重新同步")
+                self.resync()
+                self.buffer.append(event)
+            return
+        self.buffer.append(event)
+        if self.snapshot is not None:
+            self._apply_buffer()
+        else:
+            self._ensure_fetching()
+
+    def resync(self):
+        """
+        丢弃当前同步状态并重新拉取快照
+        """
+        self.resync_count += 1
+        self.state = self.STATE_SYNCING
+        self.snapshot = None
+        self.last_update_id = None
+        self.buffer.clear()
+        self._ensure_fetching()
+
+    def cancel(self):
+        if self.fetch_task is not None and not self.fetch_task.done():
+            self.fetch_task.cancel()
+        self.fetch_task = None
+
+    def _is_next(self, event):
+        """
+        合约使用pu与上一条的u衔接，现货使用U == 上一条u + 1
+        """
+        prev_id = event.get('pu')
+        if prev_id is not None:
+            return prev_id == self.last_update_id
+        return event['U'] == self.last_update_id + 1
+
+    def _ensure_fetching(self):
+        if self.fetch_task is None or self.fetch_task.done():
+            self.fetch_task = asyncio.get_running_loop().create_task(self._fetch())
+
+    async def _fetch(self):
+        """
+        拉取快照，失败时按固定间隔重试；快照太旧或应用时又出现缺口时在本任务中继续拉取
+        """
+        while True:
+            try:
+                snapshot = await self.fetch_snapshot(self.symbol, self.market)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"{self.symbol} {self.market} 获取深度快照失败: {e}")
+                await asyncio.sleep(self.retry_delay)
+                continue
+            if self.state != self.STATE_SYNCING:
+                return
+            self.snapshot = snapshot
+            self._apply_buffer()
+            # 本任务尚未结束，_apply_buffer中的_ensure_fetching不会创建新任务，由这里继续拉取
+            if self.state != self.STATE_SYNCING or self.snapshot is not None:
+                return
+
+    def _apply_buffer(self):
+        """
+        用快照和缓存的增量完成同步
+        """
+        snapshot_id = self.snapshot['lastUpdateId']
+        # 丢弃快照之前的增量（现货 u <= lastUpdateId，合约 u < lastUpdateId）
+        while self.buffer:
+            event = self.buffer[0]
+            stale = event['u'] < snapshot_id if event.get('pu') is not None else event['u'] <= snapshot_id
+            if not stale:
+                break
+            self.buffer.popleft()
+            self.dropped_count += 1
+        if not self.buffer:
+            # 等待推送追上快照
+            return
+        first = self.buffer[0]
+        first_id = snapshot_id if first.get('pu') is not None else snapshot_id + 1
+        if first['U'] > first_id:
+            # 快照太旧，和增量之间存在缺口，重新拉取
+            self.snapshot = None
+            self._ensure_fetching()
+            return
+        self.on_snapshot(self.snapshot)
+        self.snapshot = None
+        self.state = self.STATE_SYNCED
+        first = self.buffer.popleft()
+        self.last_update_id = first['u']
+        self.on_update(first)
+        pending = list(self.buffer)
+        self.buffer.clear()
+        for event in pending:
+            self.handle(event)
@@ -0,0 +1,310 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from app.config import CONFIG
+
+# 特征采集依赖numpy和pyarrow，未安装时不能启动采集
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+MARKETS = ('spot', 'futures')
+SIDES = ('ask', 'bid')
+# 每个市场使用前几个配置的步长，不同交易对的步长不同，列名只用步长序号
+STEP_COUNT = 3
+# 波动率使用最近多少个每秒价格
+VOLATILITY_WINDOW = 20
+
+
+def feature_names(level_count):
+    """
+    特征列名，如 spot_s0_ask_1 表示现货第1个步长卖单第1档挂单量
+    """
+    names = ['spot_price', 'futures_price', 'spread', 'volatility', 'triggered']
+    for market in MARKETS:
+        for step_index in range(STEP_COUNT):
+            for side in SIDES:
+                names.extend(f"{market}_s{step_index}_{side}_{i + 1}" for i in range(level_count))
+            names.append(f"{market}_s{step_index}_bid_ratio")
+    return names
+
+
+class PendingRows:
+    def __init__(self, capacity, width):
+        """
+        等待标签的特征行，按时间顺序存放在定长环形缓冲区中，满了之后覆盖最旧的行
+        """
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype='int64')
+        self.features = np.zeros((capacity, width), dtype='float64')
+        self.head = 0
+        self.size = 0
+        self.overwritten = 0
+
+    def push(self, timestamp, features):
+        index = (self.head + self.size) % self.capacity
+        if self.size == self.capacity:
+            self.head = (self.head + 1) % self.capacity
+            self.overwritten += 1
+        else:
+            self.size += 1
+        self.timestamps[index] = timestamp
+        self.features[index] = features
+
+    def pop_before(self, timestamp):
+        """
+        取出时间戳不晚于timestamp的行，返回 (timestamps, features)
+        """
+        indexes = (self.head + np.arange(self.size)) % self.capacity
+        count = int(np.searchsorted(self.timestamps[indexes], timestamp, side='right'))
+        if count == 0:
+            return None
+        indexes = indexes[:count]
+        self.head = (self.head + count) % self.capacity
+        self.size -= count
+        return self.timestamps[indexes], self.features[indexes]
+
+
+class ParquetBatchWriter:
+    def __init__(self, output_dir, batch_rows=5000, flush_seconds=600, max_pending=20):
+        """
+        后台线程把带标签的数据按 date=YYYY-MM-DD/hour=HH 分区写成Parquet文件
+
+        缓存满batch_rows行或超过flush_seconds秒后写一个文件，队列中最多max_pending个批次，
+        超出时丢弃，内存占用有上限
+        """
+        self.output_dir = output_dir
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.dropped_batches = 0
+        self.files_written = 0
+        self.rows_written = 0
+        self.thread = threading.Thread(target=self.run, name='feature-writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, columns):
+        """
+        加入一批数据（列名 -> numpy数组），不阻塞调用方
+        """
+        try:
+            self.queue.put_nowait(columns)
+        except queue.Full:
+            self.dropped_batches += 1
+
+    def run(self):
+        pending = {}
+        pending_rows = 0
+        deadline = None
+        while True:
+            try:
+                columns = self.queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                columns = None
+            stopping = columns is not None and not columns
+            if columns:
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_seconds
+                # 按小时分区，跨小时的批次分开写
+                hours = columns['timestamp'] // 3600000
+                for hour in np.unique(hours):
+                    mask = hours == hour
+                    part = {name: values[mask] for name, values in columns.items()}
+                    pending.setdefault(int(hour), []).append(part)
+                    pending_rows += int(mask.sum())
+            expired = deadline is not None and time.monotonic() >= deadline
+            if pending and (stopping or expired or pending_rows >= self.batch_rows):
+                for hour, parts in pending.items():
+                    self.write(hour, parts)
+                pending = {}
+                pending_rows = 0
+                deadline = None
+            if stopping:
+                break
+
+    def write(self, hour, parts):
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        moment = datetime.fromtimestamp(hour * 3600, tz=timezone.utc)
+        directory = os.path.join(self.output_dir, f"date={moment:%Y-%m-%d}", f"hour={moment:%H}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{int(columns['timestamp'][0])}.parquet")
+        try:
+            pq.write_table(pa.table(columns), path, compression='zstd')
+            self.files_written += 1
+            self.rows_written += len(columns['timestamp'])
+        except Exception as e:
+            print(f"写入特征文件 {path} 失败: {e}")
+
+    def close(self):
+        self.queue.put({})
+        self.thread.join()
+
+
+class FeatureCollector:
+    def __init__(self, service, output_dir, interval=1.0, horizon=300, level_count=None, label_threshold=0.001,
+                 buffer_seconds=900, batch_rows=5000):
+        """
+        每interval秒从订单簿快照计算一行特征，horizon秒后用现货价格的涨跌打标签并写入Parquet
+
+        只读取只读快照，不获取订单簿锁；计算和写盘分别在独立线程中进行，不阻塞接收；
+        档位来自快照，level_count默认为快照中每个步长的档数，不能超过它
+        """
+        if np is None or pa is None:
+            raise RuntimeError("特征采集需要安装numpy和pyarrow")
+        if level_count is None:
+            level_count = service.level_count
+        if level_count > service.level_count:
+            raise ValueError(f"快照中每个步长只有 {service.level_count} 档，不能采集 {level_count} 档")
+        self.service = service
+        self.output_dir = output_dir
+        self.interval = interval
+        self.horizon = horizon
+        self.level_count = level_count
+        self.label_threshold = label_threshold
+        self.names = feature_names(level_count)
+        capacity = int(buffer_seconds / interval) + 1
+        self.pending = {symbol: PendingRows(capacity, len(self.names)) for symbol in CONFIG}
+        self.capacity = capacity
+        self.prices = {}
+        self.writer = ParquetBatchWriter(output_dir, batch_rows)
+        self.rows = 0
+        self.labelled = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='feature-collector')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.writer.close()
+
+    def run(self):
+        next_tick = time.time()
+        while not self.stop_event.is_set():
+            next_tick += self.interval
+            try:
+                self.collect(int(time.time() * 1000))
+            except Exception as e:
+                print(f"特征采集错误: {e}")
+            delay = next_tick - time.time()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            else:
+                next_tick = time.time()
+
+    def collect(self, timestamp):
+        """
+        为每个交易对计算一行特征并为到期的行打标签
+        """
+        for symbol in list(CONFIG):
+            # 直接读取快照中增量维护的档位，不复制和重新聚合整个订单簿
+            symbol_levels = self.service.get_symbol_levels(symbol, MARKETS)
+            features = self.compute_features(symbol, symbol_levels)
+            if features is None:
+                continue
+            pending = self.pending.get(symbol)
+            if pending is None:
+                pending = self.pending[symbol] = PendingRows(self.capacity, len(self.names))
+            pending.push(timestamp, features)
+            self.rows += 1
+            self.label(symbol, pending, timestamp, features[0])
+
+    def compute_features(self, symbol, symbol_levels):
+        """
+        由各市场的最新价和各步长档位（{market: {'last_price', 'levels'}}）计算特征向量，现货没有价格时返回None
+        """
+        spot = symbol_levels.get('spot')
+        if not spot or not spot['last_price']:
+            return None
+        futures = symbol_levels.get('futures') or {'last_price': 0, 'levels': {}}
+        spot_price = spot['last_price']
+        futures_price = futures['last_price'] or np.nan
+        history = self.prices.setdefault(symbol, np.full(VOLATILITY_WINDOW + 1, np.nan))
+        history[:-1] = history[1:]
+        history[-1] = spot_price
+        returns = np.abs(np.diff(np.log(history)))
+        volatility = np.nanmedian(returns) if np.isfinite(returns).any() else np.nan
+
+        level_count = self.level_count
+        quantities = np.zeros((len(MARKETS), STEP_COUNT, len(SIDES), level_count))
+        thresholds = np.full((len(MARKETS), STEP_COUNT), np.inf)
+        for market_index, (market, market_data) in enumerate((('spot', spot), ('futures', futures))):
+            steps = list(CONFIG.get(symbol, {}).get(market, {}))[:STEP_COUNT]
+            levels = market_data['levels']
+            if not steps or not levels or not market_data['last_price']:
+                continue
+            for step_index, step in enumerate(steps):
+                step_levels = levels.get(step)
+                if not step_levels:
+                    continue
+                thresholds[market_index, step_index] = CONFIG[symbol][market][step]
+                for side_index, side in enumerate(('ask_levels', 'bid_levels')):
+                    side_levels = step_levels[side][:level_count]
+                    quantities[market_index, step_index, side_index, :len(side_levels)] = [
+                        level['quantity'] for level in side_levels
+                    ]
+        # 最近3档中有挂单量超过报警阈值时标记为触发
+        triggered = (quantities[:, :, :, :3] >= thresholds[:, :, None, None]).any()
+        totals = quantities.sum(axis=3)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bid_ratio = totals[:, :, 1] / (totals[:, :, 0] + totals[:, :, 1])
+        per_step = np.concatenate([quantities.reshape(len(MARKETS), STEP_COUNT, -1), bid_ratio[:, :, None]], axis=2)
+        head = np.array([
+            spot_price, futures_price, (futures_price - spot_price) / spot_price, volatility, float(triggered)
+        ])
+        return np.concatenate([head, per_step.ravel()])
+
+    def label(self, symbol, pending, timestamp, spot_price):
+        """
+        为horizon秒之前采集的行打标签：未来收益率和涨(1)/平(0)/跌(-1)分类
+        """
+        ready = pending.pop_before(timestamp - int(self.horizon * 1000))
+        if ready is None:
+            return
+        timestamps, features = ready
+        future_return = spot_price / features[:, 0] - 1
+        labels = np.where(future_return > self.label_threshold, 1,
+                          np.where(future_return < -self.label_threshold, -1, 0)).astype('int8')
+        columns = {
+            'timestamp': timestamps,
+            'symbol': np.array([symbol] * len(timestamps)),
+            'label_timestamp': np.full(len(timestamps), timestamp, dtype='int64')
+        }
+        for index, name in enumerate(self.names):
+            columns[name] = features[:, index]
+        columns['future_price'] = np.full(len(timestamps), spot_price)
+        columns['future_return'] = future_return
+        columns['label'] = labels
+        self.writer.put(columns)
+        self.labelled += len(timestamps)
+
+    def get_stats(self):
+        return {
+            'rows': self.rows,
+            'labelled': self.labelled,
+            'pending': {symbol: rows.size for symbol, rows in self.pending.items()},
+            'overwritten': sum(rows.overwritten for rows in self.pending.values()),
+            'files_written': self.writer.files_written,
+            'rows_written': self.writer.rows_written,
+            'dropped_batches': self.writer.dropped_batches
+        }
@@ -0,0 +1,192 @@
+import threading
+import time
+
+# 历史缓冲区使用numpy结构化数组，未安装时不记录历史
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class LevelHistory:
+    def __init__(self, steps, level_count, capacity):
+        """
+        单个(symbol, market)的定长历史环形缓冲区，每行是一次采样的档位、最新价和价差
+
+        档位随价格移动，同一位置在不同时刻是不同的价格区间，所以每行还保存每个步长第一档的区间编号：
+        卖单第i档为区间ask_start+i，买单第i档为区间bid_start-i
+
+        只有采样线程写入；读取方不加锁，复制后根据写入计数丢弃复制期间被覆盖的行
+        """
+        self.steps = list(steps)
+        self.level_count = level_count
+        self.capacity = capacity
+        shape = (len(self.steps), level_count)
+        self.dtype = np.dtype([
+            ('timestamp', 'i8'),
+            ('last_price', 'f8'),
+            ('spread', 'f8'),
+            ('ask_start', 'i8', (len(self.steps),)),
+            ('bid_start', 'i8', (len(self.steps),)),
+            ('asks', 'f8', shape),
+            ('bids', 'f8', shape)
+        ])
+        self.rows = np.zeros(capacity, dtype=self.dtype)
+        # 已写入的总行数，写完一行后才增加
+        self.count = 0
+
+    def append(self, timestamp, last_price, spread, levels):
+        """
+        追加一行，levels为 {step: {'ask_levels': [...], 'bid_levels': [...]}}
+        """
+        row = self.rows[self.count % self.capacity]
+        row['timestamp'] = timestamp
+        row['last_price'] = last_price
+        row['spread'] = spread
+        for index, step in enumerate(self.steps):
+            step_levels = levels.get(step)
+            if not step_levels or not step_levels['ask_levels'] or not step_levels['bid_levels']:
+                row['ask_start'][index] = 0
+                row['bid_start'][index] = 0
+                row['asks'][index] = 0.0
+                row['bids'][index] = 0.0
+                continue
+            # 卖单档位价格为区间上沿，买单为区间下沿，见aggregation.read_bucket_levels
+            row['ask_start'][index] = round(step_levels['ask_levels'][0]['price'] / step) - 1
+            row['bid_start'][index] = round(step_levels['bid_levels'][0]['price'] / step)
+            row['asks'][index] = [level['quantity'] for level in step_levels['ask_levels']]
+            row['bids'][index] = [level['quantity'] for level in step_levels['bid_levels']]
+        self.count += 1
+
+    def snapshot(self):
+        """
+        按时间顺序复制出所有有效行
+        """
+        count = self.count
+        size = min(count, self.capacity)
+        start = count - size
+        indexes = np.arange(start, count) % self.capacity
+        rows = self.rows[indexes]
+        # 复制期间写入的行（包括可能正在写入的下一行）会覆盖最旧的行，把这些行丢弃
+        overwritten = max(0, self.count + 1 - self.capacity - start)
+        return rows[overwritten:]
+
+    def query(self, start=None, end=None, resolution=None):
+        """
+        按时间区间[start, end]（毫秒）切片，resolution（秒）大于采样间隔时按时间分桶：
+        档位取桶内最后一行的价格区间，每个区间的挂单量按价格对齐后在能看到该区间的行中取平均；
+        价差取平均，最新价取桶内最后一个值
+        """
+        rows = self.snapshot()
+        timestamps = rows['timestamp']
+        lower = 0 if start is None else np.searchsorted(timestamps, start, side='left')
+        upper = len(rows) if end is None else np.searchsorted(timestamps, end, side='right')
+        rows = rows[lower:upper]
+        # 不足1毫秒的resolution不分桶，避免除以0
+        bucket_ms = int(resolution * 1000) if resolution and resolution > 0 else 0
+        if bucket_ms > 0 and len(rows):
+            buckets = rows['timestamp'] // bucket_ms
+            firsts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+            lasts = np.append(firsts[1:], len(rows)) - 1
+            counts = (lasts - firsts + 1).astype('f8')
+            sampled = np.zeros(len(firsts), dtype=self.dtype)
+            sampled['timestamp'] = buckets[firsts] * bucket_ms
+            sampled['last_price'] = rows['last_price'][lasts]
+            sampled['spread'] = np.add.reduceat(rows['spread'], firsts) / counts
+            sampled['ask_start'] = rows['ask_start'][lasts]
+            sampled['bid_start'] = rows['bid_start'][lasts]
+            # 每行所属的时间桶，用于取该桶最后一行的区间编号
+            groups = np.repeat(np.arange(len(firsts)), (lasts - firsts + 1))
+            sampled['asks'] = self.align_mean(
+                rows['asks'], sampled['ask_start'][groups] - rows['ask_start'], firsts)
+            sampled['bids'] = self.align_mean(
+                rows['bids'], rows['bid_start'] - sampled['bid_start'][groups], firsts)
+            rows = sampled
+        slots = np.arange(self.level_count)
+        return {
+            'steps': self.steps,
+            'timestamps': rows['timestamp'].tolist(),
+            'last_price': rows['last_price'].tolist(),
+            'spread': rows['spread'].tolist(),
+            'levels': {
+                step: {
+                    'ask_prices': ((rows['ask_start'][:, index, None] + slots + 1) * step).tolist(),
+                    'ask_levels': rows['asks'][:, index].tolist(),
+                    'bid_prices': ((rows['bid_start'][:, index, None] - slots) * step).tolist(),
+                    'bid_levels': rows['bids'][:, index].tolist()
+                }
+                for index, step in enumerate(self.steps)
+            }
+        }
+
+    def align_mean(self, quantities, offsets, firsts):
+        """
+        把每行的档位按区间对齐到所在时间桶最后一行的档位后求平均
+
+        offsets为 (行数, 步长数)，目标第k档对应该行第offsets+k档；超出该行显示范围的区间不计入平均
+        """
+        index = offsets[:, :, None] + np.arange(self.level_count)
+        visible = (index >= 0) & (index < self.level_count)
+        aligned = np.take_along_axis(quantities, np.clip(index, 0, self.level_count - 1), axis=2) * visible
+        totals = np.add.reduceat(aligned, firsts, axis=0)
+        seen = np.add.reduceat(visible.astype('f8'), firsts, axis=0)
+        return totals / np.maximum(seen, 1.0)
+
+
+class HistoryRecorder:
+    def __init__(self, service, interval=1.0, seconds=21600):
+        """
+        采样线程，每interval秒把各交易对的档位、最新价和现货/合约价差写入历史缓冲区
+        """
+        self.service = service
+        self.interval = interval
+        self.capacity = int(seconds / interval)
+        self.histories = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='history-recorder')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        next_tick = time.time()
+        while not self.stop_event.is_set():
+            next_tick += self.interval
+            try:
+                self.sample(int(time.time() * 1000))
+            except Exception as e:
+                print(f"历史采样错误: {e}")
+            delay = next_tick - time.time()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            else:
+                next_tick = time.time()
+
+    def sample(self, timestamp):
+        for symbol, markets in list(self.service.depth_data.items()):
+            symbol_data = self.service.get_symbol_levels(symbol, set(markets))
+            spot_price = symbol_data.get('spot', {}).get('last_price')
+            futures_price = symbol_data.get('futures', {}).get('last_price')
+            # 合约价格减现货价格，任一价格缺失时为0
+            spread = futures_price - spot_price if spot_price and futures_price else 0.0
+            for market, market_data in symbol_data.items():
+                history = self.histories.get((symbol, market))
+                if history is None:
+                    steps = self.service.get_market_steps(symbol, market)
+                    history = LevelHistory(steps, self.service.level_count, self.capacity)
+                    self.histories[(symbol, market)] = history
+                history.append(timestamp, market_data['last_price'], spread, market_data['levels'])
+
+    def query(self, symbol, market, start=None, end=None, resolution=None):
+        history = self.histories.get((symbol, market))
+        if history is None:
+            return None
+        return history.query(start, end, resolution)
@@ -0,0 +1,230 @@
+import sys
+import threading
+import traceback
+from bisect import bisect_left
+from collections import Counter as StackCounter
+
+# 延迟直方图的默认桶（秒）
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        """
+        单调递增计数器
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        """
+        计数加amount，返回新的计数
+        """
+        with self.lock:
+            value = self.values[label_values] = self.values.get(label_values, 0) + amount
+        return value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, documentation, labels=(), collect=None):
+        """
+        瞬时值；collect为抓取时调用的回调，返回 {label_values: value}
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.collect = collect
+        self.values = {}
+
+    def set(self, *label_values, value):
+        self.values[label_values] = value
+
+    def render(self):
+        values = self.values
+        if self.collect is not None:
+            try:
+                values = self.collect()
+            except Exception as e:
+                print(f"采集指标 {self.name} 失败: {e}")
+                values = {}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        """
+        固定桶直方图，observe只做一次二分查找和两次加法
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = [(key, list(series[0]), series[1], series[2]) for key, series in self.series.items()]
+        label_names = self.labels + ('le',)
+        for label_values, counts, total, count in sorted(items):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{format_labels(label_names, label_values + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, label_values)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, label_values)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labels=()):
+        metric = Counter(name, documentation, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, labels=(), collect=None):
+        metric = Gauge(name, documentation, labels, collect)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        输出Prometheus文本格式
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        """
+        采样分析器：定时抓取所有线程的调用栈并累计，输出flamegraph折叠格式
+        """
+        self.interval = interval
+        self.stacks = StackCounter()
+        self.samples = 0
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, interval=None):
+        if self.is_running():
+            return
+        if interval:
+            self.interval = interval
+        self.stacks = StackCounter()
+        self.samples = 0
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='sampling-profiler')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = ';'.join(
+                    f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})"
+                    for entry in traceback.extract_stack(frame)
+                )
+                self.stacks[stack] += 1
+            self.samples += 1
+
+    def report(self, limit=None):
+        """
+        折叠栈格式，每行 "栈 采样次数"
+        """
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common(limit)) + '\n'
+
+
+registry = MetricsRegistry()
+profiler = SamplingProfiler()
+
+MESSAGES_RECEIVED = registry.counter(
+    'ob_messages_received_total', '收到的WebSocket文本帧数量', ('connection',))
+MESSAGES_FAILED = registry.counter(
+    'ob_messages_failed_total', '丢弃或处理失败的消息数量', ('market', 'reason'))
+RECONNECTS = registry.counter(
+    'ob_reconnects_total', 'WebSocket重连次数', ('connection',))
+PARSE_SECONDS = registry.histogram(
+    'ob_parse_seconds', '单帧解码耗时', ('market',))
+UPDATE_SECONDS = registry.histogram(
+    'ob_update_seconds', '单条增量更新订单簿耗时（含等锁）', ('symbol', 'market'))
+LOCK_WAIT_SECONDS = registry.histogram(
+    'ob_lock_wait_seconds', '更新订单簿时等待锁的时间', ('symbol', 'market'))
+AGGREGATE_SECONDS = registry.histogram(
+    'ob_aggregate_seconds', '单个交易对档位聚合耗时', ('symbol',))
+EMIT_SECONDS = registry.histogram(
+    'ob_emit_seconds', '单个交易对推送耗时', ('symbol',))
+INGEST_TO_EMIT_SECONDS = registry.histogram(
+    'ob_ingest_to_emit_seconds', '从订单簿变化到推送的延迟', ('symbol', 'market'))
+FEED_DUPLICATES = registry.counter(
+    'ob_feed_duplicates_total', '冗余连接上晚到而被丢弃的重复增量', ('connection',))
+FEED_LATENCY_SECONDS = registry.histogram(
+    'ob_feed_latency_seconds', '行情事件时间到本地接收的延迟（含时钟偏差）', ('connection',))
+INGEST_RESTARTS = registry.counter(
+    'ob_ingest_restarts_total', '多进程模式下退出后被重启的接收进程次数', ('process',))
+ALERTS = registry.counter(
+    'ob_volume_alerts_total', '发出的大额挂单提醒数量', ('symbol', 'market', 'side'))
+# 以下瞬时值在抓取时由websocket_service设置的回调采集
+BOOK_LEVELS = registry.gauge(
+    'ob_book_levels', '订单簿每边的档数', ('symbol', 'market', 'side'))
+ROOM_CLIENTS = registry.gauge(
+    'ob_room_clients', '每个交易对和市场的订阅客户端数', ('symbol', 'market'))
+STALE_BOOKS = registry.gauge(
+    'ob_stale_books', '接收进程退出后数据已过期的订单簿，为1表示过期', ('symbol', 'market'))
+RECEIVE_QUEUE_DEPTH = registry.gauge(
+    'ob_receive_queue_depth', '接收队列中待处理的消息数', ('connection',))
@@ -0,0 +1,349 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from app.config import DEFAULT_TICK_SIZE
+from app.services.aggregation import read_bucket_levels
+
+
+class TickScale:
+    __slots__ = ('tick_size', 'divisor')
+
+    def __init__(self, tick_size):
+        """
+        价格与整数tick的换算，tick_size小于1时用整数除法换算回价格，结果与直接解析价格字符串一致
+        """
+        self.tick_size = tick_size
+        divisor = round(1 / tick_size)
+        self.divisor = divisor if divisor >= 1 and abs(1 / tick_size - divisor) < 1e-9 * divisor else None
+
+    def to_ticks(self, price):
+        if self.divisor is not None:
+            return round(float(price) * self.divisor)
+        return round(float(price) / self.tick_size)
+
+    def to_price(self, ticks):
+        if self.divisor is not None:
+            return ticks / self.divisor
+        return ticks * self.tick_size
+
+    def step_ticks(self, step):
+        """
+        步长换算为tick数，步长必须是tick_size的整数倍
+        """
+        ticks = round(step / self.tick_size)
+        if ticks < 1 or abs(step / self.tick_size - ticks) > 1e-6:
+            raise ValueError(f"步长 {step} 不是最小价格变动单位 {self.tick_size} 的整数倍")
+        return ticks
+
+
+class OrderBookSide:
+    __slots__ = ('descending', 'scale', 'prices', 'quantities', 'steps', 'offset', 'totals', 'counts',
+                 'bucket_tables')
+
+    def __init__(self, descending, scale, steps=()):
+        """
+        初始化订单簿单边（买单按价格从高到低，卖单按价格从低到高）
+        """
+        self.descending = descending
+        self.scale = scale
+        # 升序排列的整数tick价格列和对应的数量列，连续存储，最优价位于首/尾
+        self.prices = array('q')
+        self.quantities = array('d')
+        # 每个步长的区间挂单量和价位数，随每次价位变化增量维护
+        # 卖单区间k为 [k*step, (k+1)*step)，买单区间k为 (k*step, (k+1)*step]，都用整数tick计算
+        self.steps = tuple(steps)
+        self.offset = 1 if descending else 0
+        self.totals = {step: {} for step in self.steps}
+        self.counts = {step: {} for step in self.steps}
+        self.bucket_tables = [
+            (scale.step_ticks(step), self.totals[step], self.counts[step]) for step in self.steps
+        ]
+
+    def __len__(self):
+        return len(self.prices)
+
+    def update(self, ticks, quantity):
+        """
+        更新单个价位，数量为0时删除该价位
+
+        二分查找O(log n)；新增/删除价位时array移动后面的元素，是O(n)的内存移动而不是平衡树的O(log n)。
+        保留策略下单边通常几千档，这部分开销很小，而每个推送节拍的freeze可以直接整列复制；
+        与哈希索引+有序列表的对比见 benchmarks/bench_book_side.py
+        """
+        prices = self.prices
+        index = bisect_left(prices, ticks)
+        previous = self.quantities[index] if index < len(prices) and prices[index] == ticks else None
+        if quantity > 0:
+            if previous is None:
+                prices.insert(index, ticks)
+                self.quantities.insert(index, quantity)
+            else:
+                self.quantities[index] = quantity
+        elif previous is not None:
+            del prices[index]
+            del self.quantities[index]
+        else:
+            return
+        if self.steps:
+            # 新增价位计数+1，删除价位计数-1
+            self.add_to_buckets(ticks, quantity - (previous or 0.0), (previous is None) - (quantity <= 0))
+
+    def add_to_buckets(self, ticks, delta, count_delta):
+        """
+        把价位的数量变化累加到每个步长对应的区间，区间内没有价位时删除，避免浮点残差
+        """
+        ticks -= self.offset
+        for step_ticks, totals, counts in self.bucket_tables:
+            index = ticks // step_ticks
+            count = counts.get(index, 0) + count_delta
+            if count > 0:
+                counts[index] = count
+                totals[index] = totals.get(index, 0.0) + delta
+            else:
+                counts.pop(index, None)
+                totals.pop(index, None)
+
+    def best(self):
+        """
+        获取最优价格，没有挂单时返回None
+        """
+        if not self.prices:
+            return None
+        return self.scale.to_price(self.prices[-1] if self.descending else self.prices[0])
+
+    def trim(self, min_price=None, max_price=None):
+        """
+        删除[min_price, max_price]区间以外的价位，None表示该方向不限制
+        """
+        tick_size = self.scale.tick_size
+        start = 0 if min_price is None else bisect_left(self.prices, min_price / tick_size)
+        end = len(self.prices) if max_price is None else bisect_right(self.prices, max_price / tick_size)
+        self.remove_outside(start, end)
+
+    def trim_levels(self, max_levels):
+        """
+        只保留最优的max_levels档
+        """
+        if len(self.prices) <= max_levels:
+            return
+        if self.descending:
+            self.remove_outside(len(self.prices) - max_levels, len(self.prices))
+        else:
+            self.remove_outside(0, max_levels)
+
+    def remove_outside(self, start, end):
+        """
+        删除下标区间[start, end)以外的价位
+        """
+        if start == 0 and end >= len(self.prices):
+            return
+        if self.steps:
+            for index in list(range(start)) + list(range(end, len(self.prices))):
+                self.add_to_buckets(self.prices[index], -self.quantities[index], -1)
+        del self.prices[end:]
+        del self.quantities[end:]
+        del self.prices[:start]
+        del self.quantities[:start]
+
+    def clear(self):
+        self.prices = array('q')
+        self.quantities = array('d')
+        for step in self.steps:
+            self.totals[step].clear()
+            self.counts[step].clear()
+
+    def to_list(self, limit=None):
+        """
+        按最优价优先的顺序导出 [[price, quantity], ...]
+        """
+        return export_levels(self.prices, self.quantities, self.descending, self.scale, limit)
+
+    def freeze(self):
+        """
+        复制出只读的单边快照：整列复制，耗时和内存与档数成正比，只在每个推送节拍发布时调用
+        """
+        return SideSnapshot(self.prices[:], self.quantities[:], self.descending, self.scale)
+
+
+def export_levels(prices, quantities, descending, scale, limit=None):
+    """
+    按最优价优先的顺序导出 [[price, quantity], ...]，价格从整数tick换算回浮点数
+    """
+    count = len(prices) if limit is None else min(limit, len(prices))
+    if descending:
+        start = len(prices) - count
+        prices = reversed(prices[start:])
+        quantities = reversed(quantities[start:])
+    else:
+        prices = prices[:count]
+        quantities = quantities[:count]
+    if scale.divisor is not None:
+        divisor = scale.divisor
+        return [[ticks / divisor, quantity] for ticks, quantity in zip(prices, quantities)]
+    tick_size = scale.tick_size
+    return [[ticks * tick_size, quantity] for ticks, quantity in zip(prices, quantities)]
+
+
+class SideSnapshot:
+    __slots__ = ('prices', 'quantities', 'descending', 'scale')
+
+    def __init__(self, prices, quantities, descending, scale):
+        """
+        单边只读快照，发布后不再修改
+        """
+        self.prices = prices
+        self.quantities = quantities
+        self.descending = descending
+        self.scale = scale
+
+    def __len__(self):
+        return len(self.prices)
+
+    def best(self):
+        if not self.prices:
+            return None
+        return self.scale.to_price(self.prices[-1] if self.descending else self.prices[0])
+
+    def to_list(self, limit=None):
+        return export_levels(self.prices, self.quantities, self.descending, self.scale, limit)
+
+
+class BookSnapshot:
+    __slots__ = ('version', 'last_price', 'bids', 'asks', 'levels')
+
+    def __init__(self, version, last_price, bids, asks, levels=None):
+        """
+        订单簿的不可变版本快照
+
+        写入方在每个推送节拍整体替换OrderBook.snapshot引用（赋值是原子的），
+        读取方和聚合计算直接使用快照，不需要持有锁；代价是每次发布复制两边的全部价位，
+        5000档时约13微秒、157KB，每个推送间隔一次，不随消息数增加
+        levels为发布时从区间挂单量读出的各步长档位，订单簿未配置步长时为None
+        """
+        self.version = version
+        self.last_price = last_price
+        self.bids = bids
+        self.asks = asks
+        self.levels = levels
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def to_dict(self):
+        return {
+            'bids': self.bids.to_list(),
+            'asks': self.asks.to_list()
+        }
+
+
+EMPTY_SCALE = TickScale(DEFAULT_TICK_SIZE)
+EMPTY_SNAPSHOT = BookSnapshot(
+    0, 0, SideSnapshot(array('q'), array('d'), True, EMPTY_SCALE), SideSnapshot(array('q'), array('d'), False, EMPTY_SCALE)
+)
+
+
+class OrderBook:
+    __slots__ = ('steps', 'level_count', 'retention', 'scale', 'bids', 'asks', 'version', 'snapshot')
+
+    def __init__(self, steps=(), level_count=0, retention=('full', None), tick_size=DEFAULT_TICK_SIZE):
+        """
+        初始化订单簿，steps为需要增量维护区间挂单量的步长，level_count为当前价上下各读取的档数，
+        retention为保留策略，见config.DEFAULT_RETENTION；价格按tick_size换算为整数保存，匹配价位时没有浮点误差
+        """
+        self.steps = tuple(steps)
+        self.level_count = level_count
+        self.retention = retention
+        self.scale = TickScale(tick_size)
+        self.bids = OrderBookSide(descending=True, scale=self.scale, steps=self.steps)
+        self.asks = OrderBookSide(descending=False, scale=self.scale, steps=self.steps)
+        self.version = 0
+        self.snapshot = EMPTY_SNAPSHOT
+
+    def publish(self, last_price):
+        """
+        发布新的只读快照，调用方需持有写锁；复制整个订单簿，由推送节拍调用，不在每条增量上调用
+        """
+        self.version += 1
+        self.snapshot = BookSnapshot(
+            self.version, last_price, self.bids.freeze(), self.asks.freeze(), self.read_levels(last_price)
+        )
+        return self.snapshot
+
+    def read_levels(self, last_price):
+        """
+        按当前价读取各步长的档位，每个步长只查level_count*2个区间；
+        当前价没有跨过区间边界且挂单量不变时沿用上一版本的对象，推送比较时可以直接判断相同
+        """
+        if not self.steps:
+            return None
+        if not self.bids.prices or not self.asks.prices or last_price == 0:
+            return {}
+        price_ticks = self.scale.to_ticks(last_price)
+        previous = self.snapshot.levels or {}
+        levels = {}
+        for step, (step_ticks, ask_totals, _) in zip(self.steps, self.asks.bucket_tables):
+            step_levels = read_bucket_levels(
+                ask_totals, self.bids.totals[step],
+                price_ticks // step_ticks, (price_ticks - 1) // step_ticks, step, self.level_count
+            )
+            if previous.get(step) == step_levels:
+                step_levels = previous[step]
+            levels[step] = step_levels
+        return levels
+
+    def apply(self, bids, asks):
+        """
+        应用一批深度增量，价格和数量可以是字符串
+        """
+        to_ticks = self.scale.to_ticks
+        for price_str, quantity_str in bids:
+            self.bids.update(to_ticks(price_str), float(quantity_str))
+        for price_str, quantity_str in asks:
+            self.asks.update(to_ticks(price_str), float(quantity_str))
+
+    def load(self, bids, asks):
+        """
+        用快照替换整个订单簿
+        """
+        self.clear()
+        self.apply(bids, asks)
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def retain(self, current_price):
+        """
+        按保留策略删除远离当前价的挂单
+        """
+        mode, value = self.retention
+        if mode == 'percent':
+            price_range = current_price * value / 100
+            self.trim(current_price - price_range, current_price + price_range)
+        elif mode == 'levels':
+            self.bids.trim_levels(value)
+            self.asks.trim_levels(value)
+
+    def trim(self, min_price, max_price):
+        """
+        只保留价格区间内的挂单（买单截掉低于min_price的部分，卖单截掉高于max_price的部分）
+        """
+        self.bids.trim(min_price=min_price)
+        self.asks.trim(max_price=max_price)
+
+    def clear(self):
+        self.bids.clear()
+        self.asks.clear()
+
+    def to_dict(self):
+        """
+        导出为 {'bids': [...], 'asks': [...]} 格式
+        """
+        return {
+            'bids': self.bids.to_list(),
+            'asks': self.asks.to_list()
+        }
@@ -0,0 +1,138 @@
+import gzip
+import json
+import os
+import threading
+import time
+
+# MessagePack编码是可选的，未安装时只提供JSON
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_SEPARATORS = (',', ':')
+
+
+class EncodedPayload:
+    __slots__ = ('data', 'etag', 'json', 'encodings', 'lock')
+
+    def __init__(self, data, etag):
+        """
+        一次编码、多次复用的数据：JSON在创建时编码，gzip和MessagePack在第一次使用时编码后缓存
+        """
+        self.data = data
+        self.etag = etag
+        self.json = json.dumps(data, separators=JSON_SEPARATORS)
+        self.encodings = {}
+        self.lock = threading.Lock()
+
+    def body(self, fmt='json', compress=False):
+        """
+        返回fmt（'json'或'msgpack'）格式的字节，compress为True时返回gzip压缩后的字节
+        """
+        key = (fmt, compress)
+        encoded = self.encodings.get(key)
+        if encoded is not None:
+            return encoded
+        with self.lock:
+            encoded = self.encodings.get(key)
+            if encoded is None:
+                # 持有锁时不能再调用body()，锁不可重入
+                raw = self.encodings.get((fmt, False))
+                if raw is None:
+                    raw = msgpack.packb(self.data) if fmt == 'msgpack' else self.json.encode()
+                    self.encodings[(fmt, False)] = raw
+                encoded = gzip.compress(raw, compresslevel=6) if compress else raw
+                self.encodings[key] = encoded
+        return encoded
+
+
+class PayloadCache:
+    # 每个键保留的增量帧数，客户端落后不超过这个数时可以只重放增量
+    MAX_DELTAS = 64
+
+    def __init__(self):
+        """
+        按键缓存最新版本的编码结果，版本不变时直接返回，每个键只保留一个版本；
+        增量帧按 (key, 起始版本, 目标版本) 缓存，每个键保留最近MAX_DELTAS个；
+        推送线程和HTTP线程都会读写，字典只在self.lock内修改
+        """
+        self.entries = {}
+        self.deltas = {}
+        self.lock = threading.Lock()
+        # 进程标识加入ETag，重启后版本号从头开始也不会误返回304
+        self.instance = f"{os.getpid():x}{int(time.time()):x}"
+
+    def make_tag(self, key, version):
+        parts = (key if isinstance(key, tuple) else (key,)) + tuple(version)
+        return f"{self.instance}-" + '-'.join(str(part) for part in parts)
+
+    def get(self, key, version, build):
+        """
+        获取key在version下的编码结果，没有缓存时调用build()生成数据并编码；
+        build()在锁外执行，并发时可能重复生成，结果相同
+        """
+        with self.lock:
+            cached = self.entries.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        payload = EncodedPayload(build(), self.make_tag(key, version))
+        with self.lock:
+            self.entries[key] = (version, payload)
+        return payload
+
+    def get_delta(self, key, from_version, to_version, build):
+        """
+        获取key从from_version到to_version的增量帧，同一增量只编码一次
+        """
+        with self.lock:
+            payload = self.deltas.get(key, {}).get((from_version, to_version))
+        if payload is not None:
+            return payload
+        payload = EncodedPayload(build(), self.make_tag(key, (from_version, to_version)))
+        with self.lock:
+            deltas = self.deltas.setdefault(key, {})
+            deltas[(from_version, to_version)] = payload
+            while len(deltas) > self.MAX_DELTAS:
+                del deltas[next(iter(deltas))]
+        return payload
+
+    def get_delta_chain(self, key, versions):
+        """
+        按顺序取出versions中相邻版本之间的增量帧，有任何一段不在缓存中时返回None
+        """
+        with self.lock:
+            deltas = self.deltas.get(key, {})
+            chain = [deltas.get(pair) for pair in zip(versions, versions[1:])]
+        if any(payload is None for payload in chain):
+            return None
+        return chain
+
+    def discard(self, match):
+        """
+        删除match(key)为真的缓存
+        """
+        with self.lock:
+            for cache in (self.entries, self.deltas):
+                for key in [key for key in cache if match(key)]:
+                    del cache[key]
+
+
+class SocketIOJSON:
+    """
+    传给Socket.IO服务器的json模块：事件参数是EncodedPayload时直接拼接已编码的JSON，不再重复序列化
+    """
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        if isinstance(obj, list) and any(isinstance(item, EncodedPayload) for item in obj):
+            parts = [
+                item.json if isinstance(item, EncodedPayload) else json.dumps(item, **kwargs)
+                for item in obj
+            ]
+            return '[' + ','.join(parts) + ']'
+        return json.dumps(obj, **kwargs)
+
+    @staticmethod
+    def loads(*args, **kwargs):
+        return json.loads(*args, **kwargs)
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from app.services import metrics
+
+
+class LatencyWindow:
+    def __init__(self, size=1000):
+        """
+        保存最近size个延迟样本（秒），用于计算分位数
+        """
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * q))
+        return ordered[index]
+
+    def summary(self):
+        """
+        返回毫秒为单位的统计结果
+        """
+        return {
+            'count': self.count,
+            'p50_ms': round(self.percentile(0.5) * 1000, 3),
+            'p99_ms': round(self.percentile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3)
+        }
+
+
+class DepthPublisher:
+    def __init__(self, service, interval):
+        """
+        独立的推送线程，按固定节拍只计算并推送有变化的交易对
+
+        接收协程只负责更新订单簿并标记(symbol, market)为dirty，
+        聚合计算和emit都在这个线程中完成，不阻塞WebSocket读取
+        """
+        self.service = service
+        self.interval = interval
+        self.ingest_to_emit = LatencyWindow()
+        self.emit_duration = LatencyWindow()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        next_tick = time.perf_counter()
+        while not self.stop_event.is_set():
+            next_tick += self.interval
+            self.tick()
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            else:
+                # 处理时间超过一个节拍，直接从当前时间重新计时
+                next_tick = time.perf_counter()
+
+    async def run_async(self, after_tick):
+        """
+        异步服务模式：在当前事件循环中按节拍推送，不创建推送线程；
+        after_tick为每个节拍之后调用的协程函数，用于发送本节拍缓存的emit
+        """
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while not self.stop_event.is_set():
+            next_tick += self.interval
+            self.tick()
+            await after_tick()
+            delay = next_tick - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                next_tick = loop.time()
+    
+    def tick(self):
+        """
+        取出dirty标记并推送对应交易对
+        """
+        dirty = self.service.take_dirty()
+        try:
+            # 没有变化时也要检查，等待中的提醒可能已满足持续时间
+            self.service.check_alerts(dirty)
+        except Exception as e:
+            print(f"挂单提醒错误: {e}")
+        if not dirty:
+            return
+        try:
+            started = time.perf_counter()
+            symbols = {symbol for symbol, market in dirty}
+            self.service.push_updated_data(symbols)
+            finished = time.perf_counter()
+            self.emit_duration.add(finished - started)
+            for (symbol, market), marked_at in dirty.items():
+                self.ingest_to_emit.add(finished - marked_at)
+                metrics.INGEST_TO_EMIT_SECONDS.observe(finished - marked_at, symbol, market)
+        except Exception as e:
+            print(f"推送线程错误: {e}")
+
+    def get_metrics(self):
+        return {
+            'interval_ms': self.interval * 1000,
+            'ingest_to_emit': self.ingest_to_emit.summary(),
+            'emit_duration': self.emit_duration.summary()
+        }
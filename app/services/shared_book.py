@@ -0,0 +1,88 @@
+import struct
+import time
+from array import array
+from multiprocessing import shared_memory
+
+# 头部: 写序号(seqlock，奇数表示正在写入), 版本号, 最新价格, 买单档数, 卖单档数
+HEADER = struct.Struct('<QQdII')
+LEVEL_SIZE = 16
+
+
+class SharedBookSegment:
+    def __init__(self, name, levels, create=False):
+        """
+        共享内存中的单个订单簿前N档快照
+
+        写入进程用seqlock保护：写入前后各把序号加1，读取方在序号为奇数或读取前后不一致时重试，
+        读写双方都不需要跨进程的锁
+        """
+        self.levels = levels
+        size = HEADER.size + 2 * levels * LEVEL_SIZE
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self.name = self.shm.name
+        self.owner = create
+        self.buf = self.shm.buf
+        if create:
+            HEADER.pack_into(self.buf, 0, 0, 0, 0.0, 0, 0)
+
+    def write(self, last_price, bids, asks):
+        """
+        写入快照，bids/asks为最优价优先的 [[price, quantity], ...]
+        """
+        bids = bids[:self.levels]
+        asks = asks[:self.levels]
+        seq, version = struct.unpack_from('<QQ', self.buf, 0)
+        struct.pack_into('<Q', self.buf, 0, seq + 1)
+        bid_bytes = array('d', [value for level in bids for value in level]).tobytes()
+        ask_bytes = array('d', [value for level in asks for value in level]).tobytes()
+        offset = HEADER.size
+        self.buf[offset:offset + len(bid_bytes)] = bid_bytes
+        offset = HEADER.size + self.levels * LEVEL_SIZE
+        self.buf[offset:offset + len(ask_bytes)] = ask_bytes
+        HEADER.pack_into(self.buf, 0, seq + 1, version + 1, last_price, len(bids), len(asks))
+        struct.pack_into('<Q', self.buf, 0, seq + 2)
+
+    def reset_writer(self):
+        """
+        写入进程在写入中途退出时序号停在奇数，启动新的写入进程前恢复为偶数
+        """
+        seq = struct.unpack_from('<Q', self.buf, 0)[0]
+        if seq % 2:
+            struct.pack_into('<Q', self.buf, 0, seq + 1)
+
+    def version(self):
+        """
+        读取版本号，版本变化表示有新快照
+        """
+        return struct.unpack_from('<Q', self.buf, 8)[0]
+
+    def read(self, retries=100):
+        """
+        读取一致的快照，返回 (version, last_price, bids, asks)
+        """
+        for _ in range(retries):
+            seq, version, last_price, bid_count, ask_count = HEADER.unpack_from(self.buf, 0)
+            if seq % 2:
+                time.sleep(0)
+                continue
+            bids = array('d')
+            offset = HEADER.size
+            bids.frombytes(self.buf[offset:offset + bid_count * LEVEL_SIZE])
+            asks = array('d')
+            offset = HEADER.size + self.levels * LEVEL_SIZE
+            asks.frombytes(self.buf[offset:offset + ask_count * LEVEL_SIZE])
+            if struct.unpack_from('<Q', self.buf, 0)[0] != seq:
+                continue
+            return (
+                version,
+                last_price,
+                [[bids[i], bids[i + 1]] for i in range(0, len(bids), 2)],
+                [[asks[i], asks[i + 1]] for i in range(0, len(asks), 2)]
+            )
+        raise RuntimeError(f"读取共享订单簿 {self.name} 失败")
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
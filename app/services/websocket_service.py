@@ -1,9 +1,27 @@
 import asyncio
 import aiohttp
-import json
+import atexit
+import multiprocessing
+import os
 import time
 import threading
-from app.config import BINANCE_WS_URL, CONFIG
+from app.config import (
+    ALERT_CLEAR_RATIO, ALERT_COOLDOWN, ALERT_DEBOUNCE, ALERT_ENABLED, BINANCE_WS_URL, CAPTURE_PATH, CONFIG, DEFAULT_RETENTION, DEFAULT_TICK_SIZE, DEPTH_STREAM, FEED_REDUNDANCY,
+    FEATURE_CAPTURE_DIR, FEATURE_HORIZON, FEATURE_INTERVAL, FEATURE_LABEL_THRESHOLD, HISTORY_INTERVAL,
+    HISTORY_SECONDS, INGEST_MODE, LEVEL_COUNT, PUSH_INTERVAL, RECEIVE_QUEUE_SIZE, RETENTION, SHARED_BOOK_LEVELS, STREAMS_PER_CONNECTION, TICK_SIZE
+)
+from app.services.aggregation import aggregate_levels, build_render_rows
+from app.services.alerts import AlertEngine
+from app.services.capture import FrameRecorder, RecordingSnapshotFetcher
+from app.services.decoder import decode_message
+from app.services.depth_sync import BinanceSnapshotFetcher, DepthSynchronizer
+from app.services.feature_collector import FeatureCollector
+from app.services import history
+from app.services import metrics
+from app.services.order_book import OrderBook
+from app.services.payload_cache import PayloadCache
+from app.services.publisher import DepthPublisher, LatencyWindow
+from app.services.shared_book import SharedBookSegment
 
 class WebSocketService:
     def __init__(self):
@@ -12,25 +30,92 @@ class WebSocketService:
         """
         self.socketio_instance = None
         self.last_push_time = 0
+        self.level_count = LEVEL_COUNT
+        # 订单簿和最新价格按CONFIG中的交易对和市场初始化
         self.depth_data = {
-            'BTCUSDT': {
-                'spot': {'bids': [], 'asks': []},
-                'futures': {'bids': [], 'asks': []}
-            },
-            'ETHUSDT': {
-                'spot': {'bids': [], 'asks': []},
-                'futures': {'bids': [], 'asks': []}
-            }
+            symbol: {market: self.create_order_book(symbol, market) for market in markets}
+            for symbol, markets in CONFIG.items()
         }
         self.last_price_data = {
-            'BTCUSDT': {'spot': 0, 'futures': 0},
-            'ETHUSDT': {'spot': 0, 'futures': 0}
+            symbol: {market: 0 for market in markets}
+            for symbol, markets in CONFIG.items()
         }
         self.last_pushed_data = {}
+        # 每个交易对的推送数据变化次数，和房间序号一起作为完整帧缓存的版本
+        self.pushed_generation = {}
+        # 完整帧和REST深度数据的编码缓存，同一版本只编码一次
+        self.payload_cache = PayloadCache()
+        # 每个房间的推送序号，客户端据此发现丢失的增量并请求完整数据
+        self.room_seq = {}
+        # 房间 (symbol, market, step) -> 订阅的客户端sid，以及反向索引
+        self.room_members = {}
+        self.client_rooms = {}
+        self.push_lock = threading.Lock()
         self.processed_data_cache = {}
-        self.MIN_PUSH_INTERVAL = 0.1
+        # (symbol, market, step) -> (档位对象, 显示行)，档位对象没有变化时沿用上次格式化的结果
+        self.render_cache = {}
+        self.render_lock = threading.Lock()
+        self.MIN_PUSH_INTERVAL = PUSH_INTERVAL
+        # 已发布新快照、待推送的(symbol, market) -> 首次变化时间；写入方和推送线程都会修改，用dirty_lock保护
+        self.dirty = {}
+        self.dirty_lock = threading.Lock()
+        # 上次发布快照后有变化的(symbol, market) -> 首次变化时间，每个推送间隔最多发布一次，每条增量不再复制订单簿
+        self.unpublished = {}
+        self.last_publish_time = 0
+        self.publisher = DepthPublisher(self, self.MIN_PUSH_INTERVAL)
+        # 大额挂单提醒，只在推送线程中使用
+        self.alert_engine = AlertEngine(ALERT_CLEAR_RATIO, ALERT_DEBOUNCE, ALERT_COOLDOWN) if ALERT_ENABLED else None
+        # 每个市场的接收队列，接收协程只负责入队
+        self.receive_queues = {}
+        self.receive_queue_size = RECEIVE_QUEUE_SIZE
+        self.dropped_messages = {}
         self.lock = threading.Lock()
         self.ws_connections = {}
+        # 每个分片的冗余连接数，多条连接收到的同一条增量只处理最先到达的一份
+        self.feed_redundancy = FEED_REDUNDANCY
+        # 分片 (market, index) -> 在线的连接标识，以及共用的消费协程
+        self.shard_connections = {}
+        self.shard_consumers = {}
+        # (market, 分片序号, 冗余序号) -> 连接任务，保存引用避免任务被回收，移除分片时取消
+        self.feed_tasks = {}
+        # 在事件循环中启动、尚未完成的增删交易对任务
+        self.loop_tasks = set()
+        # (symbol, market) -> 已处理的最后更新ID，用于去重
+        self.last_update_ids = {}
+        # 每条连接的事件延迟、最先到达和被去重的增量数
+        self.feed_latency = {}
+        self.first_arrivals = {}
+        self.duplicates = {}
+        # 所有行情连接共用的长期会话
+        self.http_session = None
+        # 行情地址和快照获取器可替换，便于接入本地模拟服务
+        self.ws_urls = dict(BINANCE_WS_URL)
+        self.snapshot_fetcher = BinanceSnapshotFetcher(get_session=self.get_http_session)
+        self.depth_synchronizers = {}
+        # 每个市场的连接分片，每个分片是一个WebSocket连接订阅的交易对集合
+        self.streams_per_connection = STREAMS_PER_CONNECTION
+        self.shards = {}
+        self.loop = None
+        self.request_id = 0
+        # 多进程模式：'thread' 在本进程的事件循环中接收，'process' 每个分片一个接收进程
+        self.ingest_mode = INGEST_MODE
+        self.shared_books = {}
+        self.shared_versions = {}
+        self.ingest_processes = []
+        # 接收进程名称 -> (market, 交易对 -> 共享内存名称)，进程退出后按原参数重启
+        self.ingest_workers = {}
+        self.ingest_restarted_at = {}
+        self.INGEST_RESTART_DELAY = 5
+        # 接收进程退出后数据过期的(symbol, market) -> 退出时的快照版本号，重启的进程写入新版本后解除
+        self.stale_books = {}
+        # 原始行情录制，None表示不录制
+        self.recorder = None
+        # 机器学习特征采集，None表示不采集
+        self.feature_collector = None
+        # 每秒档位历史，没有安装numpy时为None
+        self.history = None
+        if history.np is not None:
+            self.history = history.HistoryRecorder(self, HISTORY_INTERVAL, HISTORY_SECONDS)
     
     def set_socketio_instance(self, sio):
         """
@@ -48,61 +133,137 @@ class WebSocketService:
             if not bids and not asks:
 
                 return
+            started = time.perf_counter()
             with self.lock:
-                if symbol not in self.depth_data:
-                    self.depth_data[symbol] = {}
-                if market not in self.depth_data[symbol]:
-                    self.depth_data[symbol][market] = {
-                        'bids': [],
-                        'asks': []
-                    }
-                order_book = self.depth_data[symbol][market]
-                for price_str, quantity_str in bids:
-                    price = float(price_str)
-                    quantity = float(quantity_str)
-                    found = False
-                    for i, (p, q) in enumerate(order_book['bids']):
-                        if p == price:
-                            if quantity > 0:
-                                order_book['bids'][i] = [price, quantity]
-                            else:
-                                order_book['bids'].pop(i)
-                            found = True
-                            break
-                    if not found and quantity > 0:
-                        order_book['bids'].append([price, quantity])
-                for price_str, quantity_str in asks:
-                    price = float(price_str)
-                    quantity = float(quantity_str)
-                    found = False
-                    for i, (p, q) in enumerate(order_book['asks']):
-                        if p == price:
-                            if quantity > 0:
-                                order_book['asks'][i] = [price, quantity]
-                            else:
-                                order_book['asks'].pop(i)
-                            found = True
-                            break
-                    if not found and quantity > 0:
-                        order_book['asks'].append([price, quantity])
-                order_book['bids'].sort(key=lambda x: x[0], reverse=True)
-                order_book['asks'].sort(key=lambda x: x[0])
-                current_price = 0
-                if order_book['asks']:
-                    current_price = order_book['asks'][0][0]  # 卖一价
-                elif order_book['bids']:
-                    current_price = order_book['bids'][0][0]  # 买一价
-                if current_price > 0:
-                    # 限制订单簿深度，只保存距离当前价0.5%的数据
-                    self.limit_order_book_depth(order_book, current_price)
-                    if symbol not in self.last_price_data:
-                        self.last_price_data[symbol] = {
-                            'spot': 0,
-                            'futures': 0
-                        }
-                    self.last_price_data[symbol][market] = current_price
-        except Exception:
-            pass
+                acquired = time.perf_counter()
+                order_book = self.get_order_book(symbol, market)
+                order_book.apply(bids, asks)
+                self.refresh_order_book(symbol, market, order_book)
+            metrics.LOCK_WAIT_SECONDS.observe(acquired - started, symbol, market)
+            metrics.UPDATE_SECONDS.observe(time.perf_counter() - started, symbol, market)
+        except Exception as e:
+            self.record_failure(market, 'update_error', e)
+    
+    def load_order_book_snapshot(self, symbol, market, snapshot):
+        """
+        用REST快照重建订单簿
+        """
+        with self.lock:
+            order_book = self.get_order_book(symbol, market)
+            order_book.load(snapshot.get('bids', []), snapshot.get('asks', []))
+            self.refresh_order_book(symbol, market, order_book)
+            # 重新同步后立即发布，读取方不用等到下一个节拍
+            self.publish_pending()
+        print(f"{symbol} {market} 深度快照已加载，lastUpdateId={snapshot.get('lastUpdateId')}")
+    
+    def get_order_book(self, symbol, market):
+        """
+        获取订单簿，不存在时创建，调用方需持有锁
+        """
+        if symbol not in self.depth_data:
+            self.depth_data[symbol] = {}
+        if market not in self.depth_data[symbol]:
+            self.depth_data[symbol][market] = self.create_order_book(symbol, market)
+        return self.depth_data[symbol][market]
+    
+    def create_order_book(self, symbol, market):
+        """
+        创建订单簿，按CONFIG中的步长增量维护区间挂单量，按RETENTION设置保留策略，按TICK_SIZE换算整数价格
+        """
+        return OrderBook(
+            CONFIG.get(symbol, {}).get(market, {}), self.level_count, RETENTION.get(symbol, DEFAULT_RETENTION),
+            TICK_SIZE.get(symbol, {}).get(market, DEFAULT_TICK_SIZE)
+        )
+    
+    def refresh_order_book(self, symbol, market, order_book):
+        """
+        订单簿变化后更新最新价格并限制深度，调用方需持有锁
+        """
+        current_price = order_book.best_ask()  # 卖一价
+        if current_price is None:
+            current_price = order_book.best_bid() or 0  # 买一价
+        if current_price > 0:
+            # 按保留策略限制订单簿深度
+            self.limit_order_book_depth(order_book, current_price)
+            if symbol not in self.last_price_data:
+                self.last_price_data[symbol] = {
+                    'spot': 0,
+                    'futures': 0
+                }
+            self.last_price_data[symbol][market] = current_price
+        # 写入方已持有锁，距上次发布超过推送间隔时顺便发布，不在每条增量上复制整个订单簿
+        now = time.perf_counter()
+        self.unpublished.setdefault((symbol, market), now)
+        if now - self.last_publish_time >= self.MIN_PUSH_INTERVAL:
+            self.publish_pending()
+    
+    def publish_pending(self):
+        """
+        为上次发布后有变化的订单簿发布只读快照并标记待推送，返回发布的(symbol, market)，调用方需持有锁
+
+        只有发布了新快照的订单簿才标记，推送线程不会读到旧快照后把变化当作已推送
+        """
+        published = self.unpublished
+        self.unpublished = {}
+        for (symbol, market), changed_at in published.items():
+            order_book = self.depth_data.get(symbol, {}).get(market)
+            if order_book is not None:
+                order_book.publish(self.last_price_data.get(symbol, {}).get(market, 0))
+            self.mark_dirty(symbol, market, changed_at)
+        self.last_publish_time = time.perf_counter()
+        return published
+    
+    def mark_dirty(self, symbol, market, changed_at=None):
+        """
+        标记(symbol, market)有新快照，由推送线程在下一个节拍推送；保留最早的变化时间用于统计延迟
+        """
+        with self.dirty_lock:
+            if (symbol, market) not in self.dirty:
+                self.dirty[(symbol, market)] = changed_at or time.perf_counter()
+    
+    def take_dirty(self):
+        """
+        取出并清空dirty标记；多进程模式下根据共享内存中的版本号判断
+
+        写入方忙时会自己按推送间隔发布快照，这里只在拿得到锁时补发布剩余的变化，
+        不阻塞等锁：阻塞后写入方要等推送线程让出GIL，每个节拍都会产生一次毫秒级停顿；
+        这一节拍没有发布的变化留在unpublished中，由下一次发布标记
+        """
+        if self.shared_books:
+            return self.take_shared_dirty()
+        if self.unpublished and self.lock.acquire(blocking=False):
+            try:
+                self.publish_pending()
+            finally:
+                self.lock.release()
+        # dirty_lock只保护字典替换和标记，持有时间很短
+        with self.dirty_lock:
+            dirty, self.dirty = self.dirty, {}
+        return dirty
+    
+    def get_depth_synchronizer(self, symbol, market):
+        """
+        获取(symbol, market)的同步状态机
+        """
+        key = (symbol, market)
+        synchronizer = self.depth_synchronizers.get(key)
+        if synchronizer is None:
+            synchronizer = DepthSynchronizer(
+                symbol, market, self.snapshot_fetcher,
+                on_snapshot=lambda snapshot: self.load_order_book_snapshot(symbol, market, snapshot),
+                on_update=lambda event: self.update_order_book(symbol, market, event)
+            )
+            self.depth_synchronizers[key] = synchronizer
+        return synchronizer
+    
+    def reset_depth_synchronizers(self, market, symbols):
+        """
+        连接断开后重置这些交易对的同步状态，重连后重新拉取快照
+        """
+        for symbol in symbols:
+            synchronizer = self.depth_synchronizers.pop((symbol, market), None)
+            if synchronizer is not None:
+                synchronizer.cancel()
     
     def update_last_price(self, symbol, market, data):
         """
@@ -119,144 +280,544 @@ class WebSocketService:
                         'futures': 0
                     }
                 self.last_price_data[symbol][market] = price
-        except Exception:
-            pass
+        except Exception as e:
+            self.record_failure(market, 'price_error', e)
+    
+    def record_failure(self, market, reason, error):
+        """
+        统计处理失败的消息，每种原因只打印第一次的错误，避免刷屏
+        """
+        if metrics.MESSAGES_FAILED.inc(market, reason) == 1:
+            print(f"{market} 消息处理失败({reason}): {error}")
     
     async def process_message(self, message, symbol, market):
         """
-        处理消息
+        处理消息，message可以是已解码的消息或原始文本
         """
         try:
-            data = json.loads(message)
+            if isinstance(message, (str, bytes)):
+                data = decode_message(message)
+            else:
+                data = message
             if 'e' in data and data['e'] == 'depthUpdate':
-                # 深度更新消息，会计算并更新最新价格（卖一价或买一价）
-                self.update_order_book(symbol, market, data)
+                # 深度更新消息，经同步状态机校验序号后更新订单簿和最新价格（卖一价或买一价）
+                self.get_depth_synchronizer(symbol, market).handle(data)
             elif 'c' in data:
                 # ticker消息，只作为备用价格来源
                 # 不再直接更新价格，而是让深度更新消息来更新价格
                 pass
-            # 每100ms最多推送一次，避免过于频繁的推送
-            current_time = time.time()
-            if self.socketio_instance and current_time - self.last_push_time > self.MIN_PUSH_INTERVAL:
-                await self.push_updated_data()
+            # 推送由独立的推送线程按固定节拍完成
             return True
         except Exception as e:
-            print(f"处理消息错误: {e}")
+            self.record_failure(market, 'process_error', e)
             return False
     
-    async def push_updated_data(self):
+    def push_updated_data(self, symbols=None):
         """
-        推送更新后的数据
+        推送更新后的数据，只为有订阅者的房间计算并发送有变化的部分，symbols为空时检查所有交易对
         """
+        if not self.socketio_instance:
+            return
         try:
-            # 获取深度数据
-            btc_data = self.get_symbol_depth('BTCUSDT')
-            eth_data = self.get_symbol_depth('ETHUSDT')
-            # 处理深度数据，使用缓存避免重复计算
-            processed_btc = self.get_cached_processed_data('BTC', btc_data)
-            processed_eth = self.get_cached_processed_data('ETH', eth_data)
-            # 构建推送数据
-            push_data = {
-                'BTC': processed_btc,
-                'ETH': processed_eth
-            }
-            # 直接推送数据
-            self.socketio_instance.emit('depth_update', push_data)
-            # 更新上次推送时间和数据
-            self.update_last_pushed_data(push_data)
+            if symbols is None:
+                symbols = list(self.depth_data.keys())
+            with self.push_lock:
+                active_rooms = [room for room, members in self.room_members.items() if members]
+            for symbol in symbols:
+                short_symbol = self.get_short_symbol(symbol)
+                rooms = [room for room in active_rooms if room[0] == short_symbol]
+                if not rooms:
+                    continue
+                markets = {room[1] for room in rooms}
+                symbol_data = self.compute_symbol_data(symbol, markets)
+                started = time.perf_counter()
+                with self.push_lock:
+                    symbol_delta = self.diff_symbol_data(self.last_pushed_data.get(short_symbol), symbol_data)
+                    # 没有变化时不推送
+                    if not symbol_delta:
+                        continue
+                    for room in rooms:
+                        room_delta = self.slice_room_data(symbol_delta, room)
+                        if room_delta is None:
+                            continue
+                        room_name = self.get_room_name(room)
+                        seq = self.room_seq.get(room, 0)
+                        self.room_seq[room] = seq + 1
+                        # 增量帧按 (房间, 起始序号, 目标序号) 缓存，重新同步的客户端直接复用编码结果
+                        frame = self.payload_cache.get_delta(
+                            ('room',) + room, seq, seq + 1,
+                            lambda: {'room': room_name, 'seq': seq + 1, 'data': room_delta}
+                        )
+                        self.socketio_instance.emit('depth_delta', frame, to=room_name)
+                    # 更新上次推送的数据
+                    self.update_last_pushed_data({short_symbol: symbol_data})
+                metrics.EMIT_SECONDS.observe(time.perf_counter() - started, symbol)
             self.last_push_time = time.time()
         except Exception as e:
             print(f"推送数据错误: {e}")
     
+    def check_alerts(self, dirty):
+        """
+        用有变化的(symbol, market)的最新档位更新提醒状态，把到期的提醒发给对应房间的订阅者
+        """
+        if self.alert_engine is None:
+            return
+        markets_by_symbol = {}
+        for symbol, market in dirty:
+            markets_by_symbol.setdefault(symbol, set()).add(market)
+        for symbol, markets in markets_by_symbol.items():
+            for market, market_data in self.get_symbol_levels(symbol, markets).items():
+                self.alert_engine.evaluate(symbol, market, market_data['levels'])
+        for alert in self.alert_engine.flush():
+            metrics.ALERTS.inc(alert['symbol'] + 'USDT', alert['market'], alert['type'])
+            room = (alert['symbol'], alert['market'], alert['step'])
+            with self.push_lock:
+                has_members = bool(self.room_members.get(room))
+            if has_members and self.socketio_instance:
+                self.socketio_instance.emit('volume_alert', alert, to=self.get_room_name(room))
+    
+    def compute_symbol_data(self, symbol, markets):
+        """
+        计算交易对指定市场的档位数据
+        """
+        started = time.perf_counter()
+        symbol_data = self.get_symbol_levels(symbol, markets)
+        metrics.AGGREGATE_SECONDS.observe(time.perf_counter() - started, symbol)
+        return self.render_levels(symbol, symbol_data)
+    
+    def get_symbol_levels(self, symbol, markets):
+        """
+        获取交易对指定市场的最新价和各步长档位，不获取订单簿锁
+        """
+        if self.shared_books:
+            # 多进程模式只有共享内存中的前N档，按版本缓存聚合结果
+            depth_data = self.get_symbol_depth(symbol)
+            depth_data = {market: market_data for market, market_data in depth_data.items() if market in markets}
+            return self.get_cached_processed_data(self.get_short_symbol(symbol), depth_data)
+        return self.get_snapshot_levels(symbol, markets)
+    
+    def get_market_steps(self, symbol, market):
+        """
+        交易对在某个市场配置的步长
+        """
+        return list(CONFIG.get(symbol, {}).get(market, {}))
+    
+    def get_snapshot_levels(self, symbol, markets):
+        """
+        直接读取快照中增量维护的档位，不遍历订单簿
+        """
+        result = {}
+        for market, order_book in list(self.depth_data.get(symbol, {}).items()):
+            if market not in markets:
+                continue
+            snapshot = order_book.snapshot
+            result[market] = {
+                'last_price': snapshot.last_price or snapshot.best_ask() or snapshot.best_bid() or 0,
+                'levels': snapshot.levels or {}
+            }
+        return result
+    
+    def get_room_name(self, room):
+        """
+        房间元组 (symbol, market, step) -> 'BTC:spot:10'
+        """
+        return f"{room[0]}:{room[1]}:{room[2]}"
+    
+    def subscribe(self, sid, symbol, market, step):
+        """
+        记录客户端订阅，返回房间名；参数不在配置中时返回None
+        """
+        try:
+            step = int(step)
+        except (TypeError, ValueError):
+            return None
+        symbol = str(symbol).upper()
+        market_config = CONFIG.get(symbol + 'USDT', {}).get(market)
+        if not market_config or step not in market_config:
+            return None
+        room = (symbol, market, step)
+        with self.push_lock:
+            market_active = any(
+                members for active_room, members in self.room_members.items()
+                if active_room[:2] == room[:2]
+            )
+            self.room_members.setdefault(room, set()).add(sid)
+            self.client_rooms.setdefault(sid, set()).add(room)
+        if not market_active:
+            # 该市场之前没有订阅者，上次推送的数据已过期，先重新计算
+            symbol_data = self.compute_symbol_data(symbol + 'USDT', {market})
+            with self.push_lock:
+                self.update_last_pushed_data({symbol: symbol_data})
+        return self.get_room_name(room)
+    
+    def unsubscribe(self, sid, symbol, market, step):
+        """
+        取消订阅，返回房间名
+        """
+        try:
+            room = (str(symbol).upper(), market, int(step))
+        except (TypeError, ValueError):
+            return None
+        with self.push_lock:
+            self.room_members.get(room, set()).discard(sid)
+            self.client_rooms.get(sid, set()).discard(room)
+        return self.get_room_name(room)
+    
+    def remove_client(self, sid):
+        """
+        客户端断开时清理订阅
+        """
+        with self.push_lock:
+            for room in self.client_rooms.pop(sid, set()):
+                self.room_members.get(room, set()).discard(sid)
+    
+    def slice_room_data(self, symbol_data, room):
+        """
+        从交易对数据中取出某个房间(市场+步长)需要的部分，没有内容时返回None
+        """
+        symbol, market, step = room
+        market_data = symbol_data.get(market)
+        if not market_data:
+            return None
+        room_data = {}
+        if 'last_price' in market_data:
+            room_data['last_price'] = market_data['last_price']
+        if 'levels' in market_data:
+            levels = market_data['levels']
+            if levels is None:
+                room_data['levels'] = None
+            elif step in levels:
+                room_data['levels'] = {step: levels[step]}
+        if not room_data:
+            return None
+        return {symbol: {market: room_data}}
+    
+    def send_full_frame(self, sid, room_name, since=None):
+        """
+        向刚订阅的客户端发送房间的完整数据，之后客户端只接收增量；
+        同一版本的完整帧只编码一次，同时订阅的客户端共用编码结果。
+        since是重新同步的客户端已应用的序号，缓存中有since之后的全部增量时只重放增量
+        """
+        if not self.socketio_instance:
+            return
+        with self.push_lock:
+            room = next((r for r in self.client_rooms.get(sid, ()) if self.get_room_name(r) == room_name), None)
+            if room is None:
+                return
+            symbol, market, step = room
+            seq = self.room_seq.get(room, 0)
+            if isinstance(since, int) and not isinstance(since, bool) and 0 <= since < seq:
+                chain = self.payload_cache.get_delta_chain(('room',) + room, list(range(since, seq + 1)))
+                if chain is not None:
+                    for frame in chain:
+                        self.socketio_instance.emit('depth_delta', frame, to=sid)
+                    return
+            version = (self.room_seq.get(room, 0), self.pushed_generation.get(symbol, 0))
+            frame = self.payload_cache.get(('room',) + room, version, lambda: self.build_full_frame(room, room_name))
+            self.socketio_instance.emit('depth_full', frame, to=sid)
+    
+    def build_full_frame(self, room, room_name):
+        """
+        由上次推送的数据生成房间的完整帧，调用方需持有push_lock
+        """
+        symbol, market, step = room
+        market_data = self.last_pushed_data.get(symbol, {}).get(market, {'last_price': 0, 'levels': {}})
+        room_data = {
+            'last_price': market_data['last_price'],
+            'levels': {step: market_data['levels'][step]} if step in market_data['levels'] else {}
+        }
+        return {'room': room_name, 'seq': self.room_seq.get(room, 0), 'data': {symbol: {market: room_data}}}
+    
+    def get_depth_payload(self, symbol):
+        """
+        交易对当前各市场的显示数据（与推送内容格式相同），按订单簿版本缓存编码结果；交易对不存在时返回None
+        """
+        symbol = str(symbol).upper()
+        if symbol not in CONFIG and symbol + 'USDT' in CONFIG:
+            symbol += 'USDT'
+        markets = CONFIG.get(symbol)
+        if not markets:
+            return None
+        versions = self.get_book_versions(symbol)
+        
+        def build():
+            return {
+                'symbol': self.get_short_symbol(symbol),
+                'versions': dict(versions),
+                'data': self.compute_symbol_data(symbol, set(markets))
+            }
+        
+        return self.payload_cache.get(('depth', symbol), tuple(version for _, version in versions), build)
+    
+    def get_book_versions(self, symbol):
+        """
+        交易对各市场订单簿的版本号 [(market, version), ...]
+        """
+        if self.shared_books:
+            return sorted(
+                (market, segment.version()) for (book_symbol, market), segment in list(self.shared_books.items())
+                if book_symbol == symbol
+            )
+        return sorted(
+            (market, order_book.snapshot.version) for market, order_book in list(self.depth_data.get(symbol, {}).items())
+        )
+    
+    def diff_symbol_data(self, previous, current):
+        """
+        比较单个交易对的两次推送数据，返回有变化的市场、最新价和档位
+        """
+        if not previous:
+            return current
+        delta = {}
+        for market, market_data in current.items():
+            previous_market = previous.get(market)
+            if previous_market is None:
+                delta[market] = market_data
+                continue
+            market_delta = {}
+            if market_data['last_price'] != previous_market['last_price']:
+                market_delta['last_price'] = market_data['last_price']
+            levels = market_data['levels']
+            previous_levels = previous_market['levels']
+            if not levels and previous_levels:
+                # 订单簿为空，通知客户端清空档位
+                market_delta['levels'] = None
+            else:
+                levels_delta = {}
+                for step, step_data in levels.items():
+                    previous_step = previous_levels.get(step)
+                    if previous_step is None:
+                        levels_delta[step] = step_data
+                        continue
+                    step_delta = {
+                        side: side_levels for side, side_levels in step_data.items()
+                        if side_levels != previous_step.get(side)
+                    }
+                    if step_delta:
+                        levels_delta[step] = step_delta
+                if levels_delta:
+                    market_delta['levels'] = levels_delta
+            if market_delta:
+                delta[market] = market_delta
+        return delta
+    
+    def render_levels(self, symbol, symbol_data):
+        """
+        把各步长的档位转换为页面直接显示的行，前端只负责把变化的单元格写入表格
+        """
+        result = {}
+        # 推送线程和HTTP线程都会调用，render_cache只在render_lock内读写
+        with self.render_lock:
+            for market, market_data in symbol_data.items():
+                thresholds = CONFIG.get(symbol, {}).get(market, {})
+                levels = {}
+                for step, step_levels in market_data['levels'].items():
+                    key = (symbol, market, step)
+                    cached = self.render_cache.get(key)
+                    # 快照在版本间复用没有变化的档位对象，相同对象时直接使用上次的结果
+                    if cached is None or cached[0] is not step_levels:
+                        cached = self.render_cache[key] = (
+                            step_levels, build_render_rows(step_levels, step, thresholds.get(step), cached)
+                        )
+                    levels[step] = cached[1]
+                result[market] = {'last_price': market_data['last_price'], 'levels': levels}
+        return result
+    
+    def get_short_symbol(self, symbol):
+        """
+        BTCUSDT -> BTC，推送数据和前端使用去掉计价币的名称
+        """
+        if symbol.endswith('USDT'):
+            return symbol[:-len('USDT')]
+        return symbol
+    
+    def get_publisher_metrics(self):
+        """
+        获取推送延迟和接收队列深度
+        """
+        metrics = self.publisher.get_metrics()
+        metrics['receive_queue_depth'] = {
+            market: queue.qsize() for market, queue in list(self.receive_queues.items())
+        }
+        metrics['dropped_messages'] = dict(self.dropped_messages)
+        metrics['stale_books'] = sorted(f"{symbol}:{market}" for symbol, market in list(self.stale_books))
+        metrics['feed_connections'] = {
+            connection_id: dict(
+                latency.summary(),
+                first_arrivals=self.first_arrivals.get(connection_id, 0),
+                duplicates=self.duplicates.get(connection_id, 0)
+            )
+            for connection_id, latency in list(self.feed_latency.items())
+        }
+        return metrics
+    
+    def collect_book_levels(self):
+        """
+        /metrics抓取时采集每个订单簿的档数
+        """
+        if self.shared_books:
+            return {}
+        result = {}
+        for symbol, markets in list(self.depth_data.items()):
+            for market, order_book in list(markets.items()):
+                snapshot = order_book.snapshot
+                result[(symbol, market, 'bids')] = len(snapshot.bids)
+                result[(symbol, market, 'asks')] = len(snapshot.asks)
+        return result
+    
+    def collect_room_clients(self):
+        """
+        /metrics抓取时采集每个(symbol, market)的订阅客户端数，同一客户端订阅多个步长只计一次
+        """
+        clients = {}
+        with self.push_lock:
+            for (symbol, market, step), members in self.room_members.items():
+                clients.setdefault((symbol + 'USDT', market), set()).update(members)
+        return {key: len(members) for key, members in clients.items()}
+    
+    def collect_stale_books(self):
+        return {key: 1 for key in list(self.stale_books)}
+    
+    def collect_receive_queue_depth(self):
+        return {(connection_id,): queue.qsize() for connection_id, queue in list(self.receive_queues.items())}
+    
     def get_cached_processed_data(self, symbol, depth_data):
         """
-        获取缓存的处理后数据
+        获取缓存的处理后数据，每个市场以订单簿版本号为键，没有变化的市场直接返回上次的结果
         """
-        # 生成缓存键
-        cache_key = f"{symbol}_{int(time.time() / 0.1)}"  # 每100ms更新一次缓存
-        with self.lock:
-            if cache_key in self.processed_data_cache:
-                return self.processed_data_cache[cache_key]
-            # 处理数据
-            processed_data = self.process_symbol_depth(symbol, depth_data)
-            # 更新缓存
-            self.processed_data_cache[cache_key] = processed_data
-            # 清理过期缓存
-            self.clean_expired_cache()
-            return processed_data
-    
-    def clean_expired_cache(self):
-        """
-        清理过期缓存
-        """
-        current_time = int(time.time() / 0.1)
-        expired_keys = []
-        for key in self.processed_data_cache:
-            try:
-                # 提取时间戳
-                timestamp = int(key.split('_')[-1])
-                if current_time - timestamp > 5:  # 清理5秒前的缓存
-                    expired_keys.append(key)
-            except:
-                pass
-        for key in expired_keys:
-            if key in self.processed_data_cache:
-                del self.processed_data_cache[key]
+        result = {}
+        for market, market_data in depth_data.items():
+            version = market_data.get('version')
+            cached = self.processed_data_cache.get((symbol, market))
+            if cached is None or cached[0] != version:
+                # 处理数据，market_data来自只读快照，计算过程不持有订单簿锁
+                processed = self.process_symbol_depth(symbol, {market: market_data})[market]
+                # 每个市场只保留最新版本
+                cached = self.processed_data_cache[(symbol, market)] = (version, processed)
+            result[market] = cached[1]
+        return result
     
     def update_last_pushed_data(self, data):
         """
-        更新上次推送的数据
+        更新上次推送的数据，按市场合并
         """
-        self.last_pushed_data = data.copy()
+        for symbol, symbol_data in data.items():
+            self.last_pushed_data.setdefault(symbol, {}).update(symbol_data)
+            self.pushed_generation[symbol] = self.pushed_generation.get(symbol, 0) + 1
     
     def limit_order_book_depth(self, order_book, current_price):
         """
-        限制订单簿深度，只保存距离当前价0.5%的数据
+        按订单簿的保留策略限制深度：百分比区间、最大档数或保留全部
         """
         if current_price <= 0:
             return
-        
-        # 计算价格范围（当前价格的±0.5%）
-        price_range = current_price * 0.005
-        min_price = current_price - price_range
-        max_price = current_price + price_range
-        
-        # 筛选买单（价格 >= 最低价）
-        filtered_bids = []
-        for bid in order_book['bids']:
-            bid_price = bid[0]
-            if bid_price >= min_price:
-                filtered_bids.append(bid)
-            else:
-                break
-        
-        # 筛选卖单（价格 <= 最高价）
-        filtered_asks = []
-        for ask in order_book['asks']:
-            ask_price = ask[0]
-            if ask_price <= max_price:
-                filtered_asks.append(ask)
-            else:
-                break
-        
-        # 更新订单簿
-        order_book['bids'] = filtered_bids
-        order_book['asks'] = filtered_asks
+        order_book.retain(current_price)
+    
+    def get_stream_name(self, symbol):
+        """
+        BTCUSDT -> btcusdt@depth
+        """
+        return symbol.lower() + DEPTH_STREAM
+    
+    def next_request_id(self):
+        self.request_id += 1
+        return self.request_id
+    
+    def get_connection_id(self, market, index, replica=0):
+        """
+        连接标识，如 spot-0；每个分片有多条冗余连接时为 spot-0-1
+        """
+        if self.feed_redundancy == 1:
+            return f"{market}-{index}"
+        return f"{market}-{index}-{replica}"
+    
+    def get_shard_websockets(self, market, index):
+        """
+        分片当前在线的所有WebSocket连接
+        """
+        connections = []
+        for replica in range(self.feed_redundancy):
+            ws = self.ws_connections.get(self.get_connection_id(market, index, replica))
+            if ws is not None and not ws.closed:
+                connections.append(ws)
+        return connections
+    
+    def get_http_session(self):
+        """
+        所有行情连接共用一个长期的ClientSession，重连时复用连接池和DNS缓存
+        """
+        if self.http_session is None or self.http_session.closed:
+            self.http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0, ttl_dns_cache=300))
+        return self.http_session
     
-    async def create_websocket_async(self, market):
+    def start_shard_feeds(self, market, index):
         """
-        创建WebSocket连接
+        为分片启动feed_redundancy条连接，返回连接任务
         """
-        ws_url = BINANCE_WS_URL[market]
+        tasks = []
+        for replica in range(self.feed_redundancy):
+            task = asyncio.create_task(self.create_websocket_async(market, index, replica))
+            self.feed_tasks[(market, index, replica)] = task
+            tasks.append(task)
+        return tasks
+    
+    def stop_shard_feeds(self, market, index):
+        """
+        取消分片的所有连接任务，连接关闭后不再重连
+        """
+        for replica in range(self.feed_redundancy):
+            task = self.feed_tasks.pop((market, index, replica), None)
+            if task is not None:
+                task.cancel()
+    
+    def has_shard_feeds(self, market, index):
+        return any((market, index, replica) in self.feed_tasks for replica in range(self.feed_redundancy))
+    
+    def open_shard_queue(self, market, index):
+        """
+        分片的接收队列和消费协程由所有冗余连接共用，第一条连接建立时创建
+        """
+        queue_id = f"{market}-{index}"
+        queue = self.receive_queues.get(queue_id)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=self.receive_queue_size)
+            self.receive_queues[queue_id] = queue
+            self.shard_consumers[(market, index)] = asyncio.create_task(
+                self.consume_messages(market, self.shards[market][index], queue)
+            )
+        return queue
+    
+    def close_shard(self, market, index):
+        """
+        分片的所有连接都断开后停止消费，丢弃未处理的消息并重置同步状态，重连后重新拉取快照
+        """
+        consumer = self.shard_consumers.pop((market, index), None)
+        if consumer is not None:
+            consumer.cancel()
+        self.receive_queues.pop(f"{market}-{index}", None)
+        shard = self.shards[market][index]
+        self.reset_depth_synchronizers(market, shard)
+        for symbol in shard:
+            self.last_update_ids.pop((symbol, market), None)
+    
+    async def create_websocket_async(self, market, index, replica=0):
+        """
+        创建WebSocket连接，订阅市场第index个分片中所有交易对的深度数据；
+        replica为分片内冗余连接的序号，同一分片的连接互为热备，任一条断开都不会中断行情
+        """
+        ws_url = self.ws_urls[market]
+        shard = self.shards[market][index]
+        connection_id = self.get_connection_id(market, index, replica)
+        live = self.shard_connections.setdefault((market, index), set())
+        self.feed_latency.setdefault(connection_id, LatencyWindow())
         # 增加重连延迟，避免频繁重连
         reconnect_delay = 1
         max_reconnect_delay = 30
         
         while True:
-            session = aiohttp.ClientSession()
             try:
                 # 使用更合适的参数设置
-                async with session.ws_connect(
+                async with self.get_http_session().ws_connect(
                     ws_url, 
                     timeout=10,
                     autoclose=False,  # 不自动关闭连接
@@ -264,42 +825,38 @@ class WebSocketService:
                     heartbeat=30,     # 每30秒发送一次ping
                     receive_timeout=45  # 45秒内没有收到消息则超时
                 ) as ws:
-                    print(f"{market} 市场WebSocket连接打开")
-                    self.ws_connections[market] = ws
+                    print(f"{connection_id} WebSocket连接打开，订阅 {len(shard)} 个交易对")
+                    self.ws_connections[connection_id] = ws
                     
-                    # 订阅多个币种的深度数据和ticker数据，使用100ms间隔
-                    subscribe_message = {
-                        "method": "SUBSCRIBE",
-                        "params": [
-                            # "btcusdt@depth@100ms",
-                            # "ethusdt@depth@100ms",
-                            "btcusdt@depth",
-                            "ethusdt@depth",
-                            # "btcusdt@ticker",
-                            # "ethusdt@ticker"
-                        ],
-                        "id": 1
-                    }
-                    await ws.send_json(subscribe_message)
+                    # 订阅分片内所有交易对的深度数据
+                    if shard:
+                        subscribe_message = {
+                            "method": "SUBSCRIBE",
+                            "params": [self.get_stream_name(symbol) for symbol in sorted(shard)],
+                            "id": self.next_request_id()
+                        }
+                        await ws.send_json(subscribe_message)
                     
                     # 重置重连延迟
                     reconnect_delay = 1
                     
-                    # 处理消息
+                    # 接收协程只负责入队，解码、去重和订单簿更新在分片的消费协程中完成
+                    queue = self.open_shard_queue(market, index)
+                    live.add(connection_id)
                     async for msg in ws:
                         if msg.type == aiohttp.WSMsgType.TEXT:
+                            metrics.MESSAGES_RECEIVED.inc(connection_id)
                             try:
-                                data = json.loads(msg.data)
-                                if 's' in data:
-                                    symbol = data['s']
-                                    await self.process_message(msg.data, symbol, market)
-                            except Exception as e:
-                                print(f"处理消息错误: {e}")
+                                queue.put_nowait((connection_id, time.time(), msg.data))
+                            except asyncio.QueueFull:
+                                # 丢弃的增量会被同步状态机识别为序号缺口并重新同步
+                                self.dropped_messages[connection_id] = self.dropped_messages.get(connection_id, 0) + 1
+                                metrics.MESSAGES_FAILED.inc(market, 'queue_full')
                         elif msg.type == aiohttp.WSMsgType.CLOSED:
-                            print(f"{market} 市场WebSocket连接关闭")
+                            print(f"{connection_id} WebSocket连接关闭")
                             break
                         elif msg.type == aiohttp.WSMsgType.ERROR:
-                            print(f"{market} 市场WebSocket错误: {ws.exception()}")
+                            print(f"{connection_id} WebSocket错误: {ws.exception()}")
                             break
                         elif msg.type == aiohttp.WSMsgType.PING:
                             # 回复ping信息
@@ -308,32 +865,204 @@ class WebSocketService:
                             # 收到pong信息，无需处理
                             pass
             except Exception as e:
-                print(f"{market} 市场WebSocket连接错误: {e}")
+                print(f"{connection_id} WebSocket连接错误: {e}")
             finally:
-                if market in self.ws_connections:
-                    del self.ws_connections[market]
-                await session.close()
-                
-                # 重连
-                print(f"{market} 市场WebSocket正在重连...")
-                # 使用指数退避重连策略
-                await asyncio.sleep(reconnect_delay)
-                # 增加重连延迟
-                reconnect_delay = min(reconnect_delay * 2, max_reconnect_delay)
+                live.discard(connection_id)
+                if connection_id in self.ws_connections:
+                    del self.ws_connections[connection_id]
+                # 还有其他连接在线时行情不中断，不需要重新同步
+                if not live:
+                    self.close_shard(market, index)
+            
+            # 重连；任务被取消（分片已移除）时CancelledError不会被上面捕获，不再重连
+            print(f"{connection_id} WebSocket正在重连...")
+            metrics.RECONNECTS.inc(connection_id)
+            # 使用指数退避重连策略
+            await asyncio.sleep(reconnect_delay)
+            # 增加重连延迟
+            reconnect_delay = min(reconnect_delay * 2, max_reconnect_delay)
+    
+    async def consume_messages(self, market, shard, queue):
+        """
+        从接收队列取出消息，每帧解码一次后处理；忽略已取消订阅的交易对和冗余连接上的重复增量
+        """
+        while True:
+            connection_id, received_at, message = await queue.get()
+            try:
+                started = time.perf_counter()
+                data = decode_message(message)
+                metrics.PARSE_SECONDS.observe(time.perf_counter() - started, market)
+                if 's' in data:
+                    symbol = data['s']
+                    if symbol in shard and self.accept_update(connection_id, symbol, market, data, received_at):
+                        # 去重之后再录制，冗余连接上的同一帧只记录一次
+                        if self.recorder is not None:
+                            self.recorder.record(market, message, int(received_at * 1e9))
+                        await self.process_message(data, symbol, market)
+            except Exception as e:
+                self.record_failure(market, 'decode_error', e)
+    
+    def accept_update(self, connection_id, symbol, market, data, received_at):
+        """
+        记录连接的事件延迟（接收时间减事件时间E，含两端时钟偏差），
+        有冗余连接时按最后更新ID u去重，只有最先到达的一份返回True
+        """
+        if 'E' in data:
+            latency = received_at - data['E'] / 1000
+            self.feed_latency[connection_id].add(latency)
+            metrics.FEED_LATENCY_SECONDS.observe(latency, connection_id)
+        if self.feed_redundancy == 1 or data.get('e') != 'depthUpdate':
+            return True
+        key = (symbol, market)
+        if data['u'] <= self.last_update_ids.get(key, -1):
+            self.duplicates[connection_id] = self.duplicates.get(connection_id, 0) + 1
+            metrics.FEED_DUPLICATES.inc(connection_id)
+            return False
+        self.last_update_ids[key] = data['u']
+        self.first_arrivals[connection_id] = self.first_arrivals.get(connection_id, 0) + 1
+        return True
+    
+    def build_shards(self):
+        """
+        按STREAMS_PER_CONNECTION把每个市场的交易对分配到多个连接
+        """
+        self.shards = {}
+        for symbol, markets in CONFIG.items():
+            for market in markets:
+                shards = self.shards.setdefault(market, [])
+                if not shards or len(shards[-1]) >= self.streams_per_connection:
+                    shards.append(set())
+                shards[-1].add(symbol)
     
     async def start_websockets_async(self):
         """
         启动WebSocket连接
         """
         print("开始启动异步WebSocket连接...")
-        markets = ['spot', 'futures']
-        tasks = []
+        self.loop = asyncio.get_running_loop()
+        self.build_shards()
+        for market, shards in self.shards.items():
+            for index in range(len(shards)):
+                self.start_shard_feeds(market, index)
+                # 添加小延迟，避免同时连接导致的消息集中到达
+                await asyncio.sleep(0.1)
+        # 连接任务保存在feed_tasks中，运行时会增删分片，这里一直等待直到被取消
+        await asyncio.Event().wait()
+    
+    async def add_symbol_async(self, symbol, market_config):
+        """
+        运行时添加交易对：加入有空余的分片并发送SUBSCRIBE，分片都已满时新建连接；
+        分片的连接已因交易对全部移除而停止时重新启动，连接建立后订阅分片内所有交易对
+        """
+        for market in market_config:
+            shards = self.shards.setdefault(market, [])
+            if any(symbol in shard for shard in shards):
+                continue
+            index = next((i for i, shard in enumerate(shards) if len(shard) < self.streams_per_connection), None)
+            if index is None:
+                shards.append(set())
+                index = len(shards) - 1
+            shards[index].add(symbol)
+            if not self.has_shard_feeds(market, index):
+                self.start_shard_feeds(market, index)
+                continue
+            for ws in self.get_shard_websockets(market, index):
+                await ws.send_json({
+                    "method": "SUBSCRIBE",
+                    "params": [self.get_stream_name(symbol)],
+                    "id": self.next_request_id()
+                })
+    
+    async def remove_symbol_async(self, symbol, markets):
+        """
+        运行时移除交易对：发送UNSUBSCRIBE并从分片中删除，分片变空时关闭它的连接
+        """
         for market in markets:
-            task = asyncio.create_task(self.create_websocket_async(market))
-            tasks.append(task)
-            # 添加小延迟，避免同时连接导致的消息集中到达
-            await asyncio.sleep(0.1)
-        await asyncio.gather(*tasks)
+            for index, shard in enumerate(self.shards.get(market, [])):
+                if symbol not in shard:
+                    continue
+                shard.discard(symbol)
+                self.reset_depth_synchronizers(market, [symbol])
+                self.last_update_ids.pop((symbol, market), None)
+                if not shard:
+                    self.stop_shard_feeds(market, index)
+                    continue
+                for ws in self.get_shard_websockets(market, index):
+                    await ws.send_json({
+                        "method": "UNSUBSCRIBE",
+                        "params": [self.get_stream_name(symbol)],
+                        "id": self.next_request_id()
+                    })
+    
+    def run_on_loop(self, coro):
+        """
+        在接收行情的事件循环中执行coro：从其它线程调用时等待完成；
+        已在事件循环中（异步服务的HTTP请求）时作为任务启动，等待结果会阻塞循环自身
+        """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            task = self.loop.create_task(coro)
+            self.loop_tasks.add(task)
+            task.add_done_callback(self.loop_tasks.discard)
+            return
+        asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout=10)
+    
+    def add_symbol(self, symbol, market_config):
+        """
+        添加交易对，market_config格式与CONFIG相同，如 {'spot': {10: 15}, 'futures': {10: 150}}；
+        交易对已存在、市场不支持或步长不是最小价格变动单位的整数倍时抛出ValueError
+        """
+        if self.shared_books:
+            raise RuntimeError("多进程模式不支持运行时增删交易对")
+        symbol = symbol.upper()
+        unknown = [market for market in market_config if market not in self.ws_urls]
+        if unknown:
+            raise ValueError(f"不支持的市场 {unknown}")
+        with self.lock:
+            if symbol in CONFIG:
+                raise ValueError(f"交易对 {symbol} 已存在")
+            CONFIG[symbol] = market_config
+            try:
+                books = {market: self.create_order_book(symbol, market) for market in market_config}
+            except ValueError:
+                del CONFIG[symbol]
+                raise
+            self.depth_data[symbol] = books
+            for market in market_config:
+                self.last_price_data.setdefault(symbol, {}).setdefault(market, 0)
+        if self.loop is not None:
+            self.run_on_loop(self.add_symbol_async(symbol, market_config))
+    
+    def remove_symbol(self, symbol):
+        """
+        移除交易对并清理订单簿和推送数据
+        """
+        if self.shared_books:
+            raise RuntimeError("多进程模式不支持运行时增删交易对")
+        symbol = symbol.upper()
+        with self.lock:
+            markets = list(CONFIG.pop(symbol, {}))
+        if self.loop is not None:
+            self.run_on_loop(self.remove_symbol_async(symbol, markets))
+        with self.lock:
+            self.depth_data.pop(symbol, None)
+            self.last_price_data.pop(symbol, None)
+            for market in markets:
+                self.unpublished.pop((symbol, market), None)
+                with self.dirty_lock:
+                    self.dirty.pop((symbol, market), None)
+        if self.alert_engine is not None:
+            self.alert_engine.reset(symbol)
+        with self.push_lock:
+            self.last_pushed_data.pop(self.get_short_symbol(symbol), None)
+        with self.render_lock:
+            for key in [key for key in self.render_cache if key[0] == symbol]:
+                del self.render_cache[key]
+        short_symbol = self.get_short_symbol(symbol)
+        self.payload_cache.discard(lambda key: key[1] in (symbol, short_symbol))
     
     def start_websockets_thread(self):
         """
@@ -397,13 +1126,11 @@ class WebSocketService:
                     'levels': {}
                 }
                 continue
-            levels = {}
             symbol_config = CONFIG.get(symbol + 'USDT', {})
             market_config = symbol_config.get(market, {})
             steps = list(market_config.keys()) if market_config else []
-            # 使用配置中的步长档位
-            for step in steps:
-                levels[step] = self.calculate_price_levels(bids, asks, current_price, step, 2)
+            # 使用配置中的步长档位，只累加当前价附近的区间
+            levels = aggregate_levels(bids, asks, current_price, steps, self.level_count)
             result[market] = {
                 'last_price': current_price,
                 'levels': levels
@@ -412,20 +1139,229 @@ class WebSocketService:
     
 
     
+    def start_recording(self, path):
+        """
+        开始录制原始行情帧和深度快照
+        """
+        if self.recorder is not None:
+            return
+        self.recorder = FrameRecorder(path)
+        self.snapshot_fetcher = RecordingSnapshotFetcher(self.snapshot_fetcher, self.recorder)
+        print(f"开始录制行情到 {path}")
+    
+    def stop_recording(self):
+        """
+        停止录制并写入剩余数据
+        """
+        recorder = self.recorder
+        if recorder is None:
+            return
+        self.recorder = None
+        if isinstance(self.snapshot_fetcher, RecordingSnapshotFetcher):
+            self.snapshot_fetcher = self.snapshot_fetcher.fetcher
+        recorder.close()
+    
+    def start_feature_collector(self, output_dir):
+        """
+        开始每秒采集特征，5分钟后打标签写入Parquet
+        """
+        if self.feature_collector is not None:
+            return
+        self.feature_collector = FeatureCollector(
+            self, output_dir, FEATURE_INTERVAL, FEATURE_HORIZON, label_threshold=FEATURE_LABEL_THRESHOLD
+        )
+        self.feature_collector.start()
+        print(f"开始采集特征到 {output_dir}")
+    
+    def stop_feature_collector(self):
+        """
+        停止特征采集并写出已打标签的数据
+        """
+        collector = self.feature_collector
+        if collector is None:
+            return
+        self.feature_collector = None
+        collector.stop()
+    
     def start_websockets(self):
         """
         启动所有WebSocket连接
         """
         print("开始启动WebSocket连接...")
-        self.start_websockets_thread()
+        if CAPTURE_PATH and self.ingest_mode != 'process':
+            self.start_recording(CAPTURE_PATH)
+        if self.ingest_mode == 'process':
+            self.start_ingest_processes()
+        else:
+            self.start_websockets_thread()
+        self.publisher.start()
+        self.start_samplers()
         print("WebSocket连接启动完成")
     
+    async def run_in_loop(self, after_tick):
+        """
+        异步服务模式：行情接收、聚合和推送都在当前事件循环中运行，emit不跨线程；
+        after_tick在每个推送节拍之后调用，负责发送缓存的emit
+        """
+        print("开始在事件循环中启动WebSocket连接...")
+        if CAPTURE_PATH and self.ingest_mode != 'process':
+            self.start_recording(CAPTURE_PATH)
+        tasks = [asyncio.create_task(self.publisher.run_async(after_tick))]
+        if self.ingest_mode == 'process':
+            self.start_ingest_processes()
+        else:
+            tasks.append(asyncio.create_task(self.start_websockets_async()))
+        self.start_samplers()
+        await asyncio.gather(*tasks)
+    
+    def start_samplers(self):
+        """
+        启动按固定间隔读取快照的后台线程：档位历史和特征采集
+        """
+        if self.history is not None:
+            self.history.start()
+        if FEATURE_CAPTURE_DIR:
+            self.start_feature_collector(FEATURE_CAPTURE_DIR)
+    
+    def start_ingest_processes(self):
+        """
+        多进程模式：每个连接分片在独立进程中接收和维护订单簿，通过共享内存发布前N档快照
+        """
+        self.build_shards()
+        prefix = f"ob_{os.getpid()}"
+        for market, shards in self.shards.items():
+            for index, shard in enumerate(shards):
+                segment_names = {}
+                for symbol in shard:
+                    segment = SharedBookSegment(f"{prefix}_{symbol}_{market}", SHARED_BOOK_LEVELS, create=True)
+                    self.shared_books[(symbol, market)] = segment
+                    segment_names[symbol] = segment.name
+                name = f"ingest-{market}-{index}"
+                self.ingest_workers[name] = (market, segment_names)
+                process = self.spawn_ingest_process(name)
+                self.ingest_processes.append(process)
+                print(f"接收进程 {process.name} 已启动，pid={process.pid}，交易对 {sorted(shard)}")
+        atexit.register(self.stop_ingest_processes)
+    
+    def spawn_ingest_process(self, name):
+        """
+        按保存的参数启动一个接收进程
+        """
+        market, segment_names = self.ingest_workers[name]
+        process = multiprocessing.get_context('spawn').Process(
+            target=run_ingest_worker,
+            args=(market, segment_names, self.ws_urls, self.snapshot_fetcher.rest_urls),
+            name=name
+        )
+        process.daemon = True
+        process.start()
+        return process
+    
+    def supervise_ingest_processes(self):
+        """
+        推送节拍检查接收进程：已退出进程的订单簿标记为过期，距上次重启超过INGEST_RESTART_DELAY秒时重启
+        """
+        now = time.monotonic()
+        for i, process in enumerate(self.ingest_processes):
+            if process.is_alive():
+                continue
+            market, segment_names = self.ingest_workers[process.name]
+            for symbol in segment_names:
+                key = (symbol, market)
+                if key not in self.stale_books:
+                    self.stale_books[key] = self.shared_books[key].version()
+            if now - self.ingest_restarted_at.get(process.name, -self.INGEST_RESTART_DELAY) < self.INGEST_RESTART_DELAY:
+                continue
+            print(f"接收进程 {process.name} 已退出，exitcode={process.exitcode}，正在重启")
+            for symbol in segment_names:
+                self.shared_books[(symbol, market)].reset_writer()
+            self.ingest_processes[i] = self.spawn_ingest_process(process.name)
+            self.ingest_restarted_at[process.name] = now
+            metrics.INGEST_RESTARTS.inc(process.name)
+    
+    def stop_ingest_processes(self):
+        """
+        结束接收进程并释放共享内存
+        """
+        for process in self.ingest_processes:
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=5)
+        self.ingest_processes = []
+        self.stale_books = {}
+        shared_books = self.shared_books
+        self.shared_books = {}
+        for segment in shared_books.values():
+            segment.close()
+    
+    def take_shared_dirty(self):
+        """
+        多进程模式下比较共享内存版本号，返回有新快照的(symbol, market)
+        """
+        self.supervise_ingest_processes()
+        dirty = {}
+        now = time.perf_counter()
+        for key, segment in self.shared_books.items():
+            version = segment.version()
+            if version != self.shared_versions.get(key):
+                self.shared_versions[key] = version
+                dirty[key] = now
+            if key in self.stale_books and version != self.stale_books[key]:
+                del self.stale_books[key]
+        return dirty
+    
+    def get_shared_symbol_depth(self, symbol):
+        """
+        多进程模式下从共享内存读取深度数据，不需要获取self.lock
+        """
+        result = {}
+        for (book_symbol, market), segment in list(self.shared_books.items()):
+            if book_symbol != symbol:
+                continue
+            version, last_price, bids, asks = segment.read()
+            result[market] = {'bids': bids, 'asks': asks, 'last_price': last_price, 'version': version}
+        return result
+    
+    async def run_shared_ingest(self, market, segments):
+        """
+        接收进程的主循环：接收一个分片的数据，并按推送节拍把有变化的订单簿写入共享内存
+        """
+        self.loop = asyncio.get_running_loop()
+        self.shards = {market: [set(segments)]}
+        feed = asyncio.gather(*self.start_shard_feeds(market, 0))
+        while not feed.done():
+            await asyncio.sleep(self.MIN_PUSH_INTERVAL)
+            for symbol, dirty_market in self.take_dirty():
+                segment = segments.get(symbol)
+                if segment is None:
+                    continue
+                snapshot = self.depth_data[symbol][dirty_market].snapshot
+                segment.write(
+                    snapshot.last_price,
+                    snapshot.bids.to_list(segment.levels),
+                    snapshot.asks.to_list(segment.levels)
+                )
+        await feed
+    
+    def get_history(self, symbol, market, start=None, end=None, resolution=None):
+        """
+        查询档位历史，symbol可以是BTC或BTCUSDT；只读取历史缓冲区，不获取订单簿锁
+        """
+        if self.history is None:
+            return None
+        symbol = str(symbol).upper()
+        if symbol not in self.depth_data and symbol + 'USDT' in self.depth_data:
+            symbol += 'USDT'
+        return self.history.query(symbol, market, start, end, resolution)
+    
     def get_depth_data(self):
         """
         获取深度数据
         """
-        with self.lock:
-            return self.depth_data.copy()
+        return {
+            symbol: {market: order_book.snapshot.to_dict() for market, order_book in list(markets.items())}
+            for symbol, markets in list(self.depth_data.items())
+        }
     
     def calculate_volume_in_range(self, orders, price_range, is_ask):
         """
@@ -452,35 +1388,44 @@ class WebSocketService:
         获取指定交易对的深度数据和最新价格
         """
         result = {}
+        if self.shared_books:
+            return self.get_shared_symbol_depth(symbol)
         try:
-            with self.lock:
-                if symbol in self.depth_data:
-                    result = {}
-                    for market, market_data in self.depth_data[symbol].items():
-                        bids = market_data['bids'][:]
-                        asks = market_data['asks'][:]
-                        result[market] = {
-                            'bids': bids,
-                            'asks': asks
-                        }
-                    if symbol in self.last_price_data:
-                        for market in result:
-                            if market in self.last_price_data[symbol]:
-                                result[market]['last_price'] = self.last_price_data[symbol][market]
-                    for market in result:
-                        if result[market].get('last_price', 0) == 0:
-                            if result[market]['asks']:
-                                result[market]['last_price'] = result[market]['asks'][0][0]
-                            elif result[market]['bids']:
-                                result[market]['last_price'] = result[market]['bids'][0][0]
-                            else:
-                                result[market]['last_price'] = 0
+            # 读取写入方发布的只读快照，不持有锁
+            for market, order_book in list(self.depth_data.get(symbol, {}).items()):
+                snapshot = order_book.snapshot
+                result[market] = snapshot.to_dict()
+                last_price = snapshot.last_price
+                if last_price == 0:
+                    last_price = snapshot.best_ask() or snapshot.best_bid() or 0
+                result[market]['last_price'] = last_price
+                result[market]['version'] = snapshot.version
         except Exception:
             pass
         return result
 
+def run_ingest_worker(market, segment_names, ws_urls, rest_urls):
+    """
+    接收进程入口，在子进程中运行一个分片的WebSocket接收和订单簿维护
+    """
+    service = WebSocketService()
+    service.ws_urls = ws_urls
+    service.snapshot_fetcher = BinanceSnapshotFetcher(rest_urls, get_session=service.get_http_session)
+    segments = {
+        symbol: SharedBookSegment(name, SHARED_BOOK_LEVELS)
+        for symbol, name in segment_names.items()
+    }
+    try:
+        asyncio.run(service.run_shared_ingest(market, segments))
+    except KeyboardInterrupt:
+        pass
+
 # 创建WebSocket服务实例
 websocket_service = WebSocketService()
+metrics.BOOK_LEVELS.collect = websocket_service.collect_book_levels
+metrics.ROOM_CLIENTS.collect = websocket_service.collect_room_clients
+metrics.RECEIVE_QUEUE_DEPTH.collect = websocket_service.collect_receive_queue_depth
+metrics.STALE_BOOKS.collect = websocket_service.collect_stale_books
 
 # 导出方法
 def set_socketio_instance(sio):
@@ -494,3 +1439,33 @@ def get_depth_data():
 
 def get_symbol_depth(symbol):
     return websocket_service.get_symbol_depth(symbol)
+
+def subscribe(sid, symbol, market, step):
+    return websocket_service.subscribe(sid, symbol, market, step)
+
+def unsubscribe(sid, symbol, market, step):
+    return websocket_service.unsubscribe(sid, symbol, market, step)
+
+def remove_client(sid):
+    websocket_service.remove_client(sid)
+
+def send_full_frame(sid, room_name, since=None):
+    websocket_service.send_full_frame(sid, room_name, since)
+
+def add_symbol(symbol, market_config):
+    websocket_service.add_symbol(symbol, market_config)
+
+def remove_symbol(symbol):
+    websocket_service.remove_symbol(symbol)
+
+def get_publisher_metrics():
+    return websocket_service.get_publisher_metrics()
+
+def get_history(symbol, market, start=None, end=None, resolution=None):
+    return websocket_service.get_history(symbol, market, start, end, resolution)
+
+async def run_in_loop(after_tick):
+    return await websocket_service.run_in_loop(after_tick)
+
+def get_depth_payload(symbol):
+    return websocket_service.get_depth_payload(symbol)
@@ -0,0 +1,132 @@
+import asyncio
+import socketio
+from aiohttp import web
+from flask import Flask
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+from app.services import websocket_service
+from app.blueprints.ob import ob_bp
+from app.services.payload_cache import SocketIOJSON
+
+# 异步服务模式：Socket.IO、行情接收、聚合和推送共用一个asyncio事件循环
+# 用法: python async_main.py
+
+# HTTP路由仍由Flask蓝图处理
+flask_app = Flask(__name__)
+flask_app.register_blueprint(ob_bp)
+
+# 初始化异步SocketIO，使用可以直接拼接已编码数据的json模块
+sio = socketio.AsyncServer(cors_allowed_origins="*", async_mode='aiohttp', ping_interval=25, ping_timeout=60,
+                           json=SocketIOJSON)
+
+
+class QueuedEmitter:
+    def __init__(self, server):
+        """
+        服务中的emit是同步调用，这里先按顺序缓存，由事件循环在推送节拍结束或处理完客户端事件后发送
+        """
+        self.server = server
+        self.pending = []
+
+    def emit(self, event, data, to=None):
+        self.pending.append((event, data, to))
+
+    async def flush(self):
+        pending, self.pending = self.pending, []
+        for event, data, to in pending:
+            await self.server.emit(event, data, to=to)
+
+
+emitter = QueuedEmitter(sio)
+
+# 客户端连接事件
+@sio.event
+async def connect(sid, environ):
+    print('Client connected')
+
+# 客户端断开连接事件
+@sio.event
+async def disconnect(sid, reason=None):
+    print('Client disconnected')
+    websocket_service.remove_client(sid)
+
+# 订阅 (symbol, market, step) 房间，先发送完整数据，之后只推送增量
+@sio.event
+async def subscribe(sid, data=None):
+    # 客户端可以发送任意数据，不是对象时直接忽略
+    if not isinstance(data, dict):
+        return
+    room = websocket_service.subscribe(sid, data.get('symbol'), data.get('market'), data.get('step'))
+    if room:
+        await sio.enter_room(sid, room)
+        websocket_service.send_full_frame(sid, room)
+        await emitter.flush()
+
+# 取消订阅
+@sio.event
+async def unsubscribe(sid, data=None):
+    if not isinstance(data, dict):
+        return
+    room = websocket_service.unsubscribe(sid, data.get('symbol'), data.get('market'), data.get('step'))
+    if room:
+        await sio.leave_room(sid, room)
+
+# 客户端发现增量序号不连续时请求重新同步，seq是已应用的序号，能从缓存重放时只补发缺少的增量，否则发送完整数据
+@sio.event
+async def depth_resync(sid, data=None):
+    if not isinstance(data, dict):
+        return
+    websocket_service.send_full_frame(sid, data.get('room'), data.get('seq'))
+    await emitter.flush()
+
+
+# 事件循环中不加锁读写的状态（订单簿、档位历史、采样器）只能在循环中访问，
+# 修改状态的请求和读取这些状态的路由直接在事件循环中执行，与行情处理和推送串行
+LOOP_PATHS = ('/debug/profiler', '/api/history')
+
+
+def runs_on_loop(request):
+    return request.method not in ('GET', 'HEAD') or request.path in LOOP_PATHS
+
+
+async def handle_http(request):
+    """
+    把HTTP请求转给Flask应用：只读请求在线程池中执行，不阻塞事件循环；会访问循环内状态的请求在循环中执行
+    """
+    environ = EnvironBuilder(
+        path=request.path,
+        method=request.method,
+        headers=list(request.headers.items()),
+        query_string=request.query_string,
+        data=await request.read()
+    ).get_environ()
+    if runs_on_loop(request):
+        body, status, headers = run_wsgi_app(flask_app, environ, True)
+    else:
+        loop = asyncio.get_running_loop()
+        body, status, headers = await loop.run_in_executor(None, run_wsgi_app, flask_app, environ, True)
+    return web.Response(body=b''.join(body), status=int(status.split()[0]), headers=list(headers.items()))
+
+
+async def start_websocket_services(app):
+    """在同一个事件循环中启动WebSocket服务"""
+    app['websocket_service'] = asyncio.create_task(websocket_service.run_in_loop(emitter.flush))
+
+
+def create_app():
+    # 传递缓存emit的对象给 websocket_service，只在创建异步应用时设置，导入本模块不影响线程模式的服务
+    websocket_service.set_socketio_instance(emitter)
+    app = web.Application()
+    sio.attach(app)
+    # Socket.IO之外的路径都交给Flask
+    app.router.add_route('*', '/{path:.*}', handle_http)
+    app.on_startup.append(start_websocket_services)
+    return app
+
+
+def main():
+    print("Starting async application...")
+    web.run_app(create_app(), host='127.0.0.1', port=5000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+对比订单簿单边不同结构的单价位更新耗时，以及发布快照时按价格顺序导出的耗时
+
+用法:
+    python benchmarks/bench_book_side.py --levels 1000 5000 20000 100000
+
+结构:
+    array    当前实现：有序的整数tick价格列和数量列(array)，二分查找，插入/删除时移动后面的元素
+    dict     价格->数量哈希索引加有序价格列表(list)，查找O(1)，插入/删除仍要移动列表元素
+    chunked  哈希索引加分块有序列表（每块最多CHUNK个价格），插入/删除只移动一块，接近O(log n)
+
+workload:
+    uniform  价位在最优价附近levels档内均匀分布（与common.make_updates相同）
+    front    全部落在最优价一侧的最前面，array每次插入/删除都要移动整列，是array的最坏情况
+"""
+import argparse
+import random
+import time
+from bisect import bisect_left, insort
+
+from common import percentile
+from app.services.order_book import OrderBookSide, TickScale
+
+CHUNK = 512
+BEST_TICKS = 6000000
+
+
+class DictSide:
+    def __init__(self):
+        self.levels = {}
+        self.prices = []
+
+    def update(self, ticks, quantity):
+        if quantity > 0:
+            if ticks not in self.levels:
+                insort(self.prices, ticks)
+            self.levels[ticks] = quantity
+        elif self.levels.pop(ticks, None) is not None:
+            del self.prices[bisect_left(self.prices, ticks)]
+
+    def best(self):
+        return self.prices[0] if self.prices else None
+
+    def export(self):
+        levels = self.levels
+        return [(price, levels[price]) for price in self.prices]
+
+
+class ChunkedSide:
+    def __init__(self):
+        """
+        分块有序列表：chunks为有序的价格块，maxes为每块的最大价格，定位块用二分查找
+        """
+        self.levels = {}
+        self.chunks = []
+        self.maxes = []
+
+    def update(self, ticks, quantity):
+        if quantity > 0:
+            if ticks not in self.levels:
+                self.insert(ticks)
+            self.levels[ticks] = quantity
+        elif self.levels.pop(ticks, None) is not None:
+            self.remove(ticks)
+
+    def insert(self, ticks):
+        if not self.chunks:
+            self.chunks.append([ticks])
+            self.maxes.append(ticks)
+            return
+        index = min(bisect_left(self.maxes, ticks), len(self.chunks) - 1)
+        chunk = self.chunks[index]
+        insort(chunk, ticks)
+        self.maxes[index] = chunk[-1]
+        if len(chunk) > CHUNK * 2:
+            half = chunk[CHUNK:]
+            del chunk[CHUNK:]
+            self.chunks.insert(index + 1, half)
+            self.maxes[index] = chunk[-1]
+            self.maxes.insert(index + 1, half[-1])
+
+    def remove(self, ticks):
+        index = bisect_left(self.maxes, ticks)
+        chunk = self.chunks[index]
+        del chunk[bisect_left(chunk, ticks)]
+        if chunk:
+            self.maxes[index] = chunk[-1]
+        else:
+            del self.chunks[index]
+            del self.maxes[index]
+
+    def best(self):
+        return self.chunks[0][0] if self.chunks else None
+
+    def export(self):
+        levels = self.levels
+        return [(price, levels[price]) for chunk in self.chunks for price in chunk]
+
+
+# 结构名 -> (创建函数, 按价格顺序导出的函数)；array的导出就是发布快照时的freeze
+STRUCTURES = {
+    'array': (lambda: OrderBookSide(False, TickScale(0.01)), OrderBookSide.freeze),
+    'dict': (DictSide, DictSide.export),
+    'chunked': (ChunkedSide, ChunkedSide.export)
+}
+
+
+def make_operations(levels, count, workload):
+    """
+    卖单一侧的价位更新 [(ticks, quantity), ...]，约一半是新增或删除价位
+    """
+    operations = []
+    for _ in range(count):
+        if workload == 'front':
+            ticks = BEST_TICKS - random.randint(1, 50)
+        else:
+            ticks = BEST_TICKS + random.randint(0, levels)
+        quantity = 0.0 if random.random() < 0.5 else random.uniform(0.1, 5)
+        operations.append((ticks, quantity))
+    return operations
+
+
+def bench(name, levels, operations, exports):
+    create, export = STRUCTURES[name]
+    side = create()
+    for ticks in range(BEST_TICKS, BEST_TICKS + levels):
+        side.update(ticks, 1.0)
+    update = side.update
+    durations = []
+    for ticks, quantity in operations:
+        started = time.perf_counter()
+        update(ticks, quantity)
+        durations.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    for _ in range(exports):
+        export(side)
+    export_seconds = (time.perf_counter() - started) / exports
+    return {
+        'p50_ns': round(percentile(durations, 0.5) * 1e9),
+        'mean_ns': round(sum(durations) / len(durations) * 1e9),
+        'export_us': round(export_seconds * 1e6, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--levels', type=int, nargs='+', default=[1000, 5000, 20000, 100000])
+    parser.add_argument('--count', type=int, default=50000)
+    parser.add_argument('--exports', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    print(f"{'levels':>8} {'workload':>8} {'structure':>9} {'p50_ns':>8} {'mean_ns':>8} {'export_us':>10}")
+    for levels in args.levels:
+        for workload in ('uniform', 'front'):
+            random.seed(args.seed)
+            operations = make_operations(levels, args.count, workload)
+            for name in STRUCTURES:
+                result = bench(name, levels, operations, args.exports)
+                print(f"{levels:>8} {workload:>8} {name:>9} {result['p50_ns']:>8} {result['mean_ns']:>8} "
+                      f"{result['export_us']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+订单簿更新、档位聚合和推送热路径的基准测试
+
+用法:
+    python benchmarks/bench_hot_paths.py                          # 合成行情，默认参数矩阵
+    python benchmarks/bench_hot_paths.py --capture data/x.obcap   # 额外回放录制文件
+    python benchmarks/bench_hot_paths.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_hot_paths.py --compare benchmarks/baseline.json --tolerance 0.2
+
+与基线比较时任一指标变差超过tolerance则以非0状态退出
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from common import MARKET, SYMBOL, make_snapshot, make_updates, percentile
+from app.config import CONFIG
+from app.services.capture import replay
+from app.services.websocket_service import WebSocketService
+
+# 指标名 -> 是否越大越好
+METRICS = {
+    'msgs_per_sec': True,
+    'p50_us': False,
+    'p99_us': False,
+    'alloc_bytes_per_msg': False,
+    'per_push_us': False,
+    'per_publish_us': False,
+    'alloc_bytes_per_publish': False,
+    'frames_per_sec': True
+}
+
+
+class NullSocketIO:
+    def emit(self, event, data, to=None):
+        pass
+
+
+def make_service(levels):
+    service = WebSocketService()
+    service.load_order_book_snapshot(SYMBOL, MARKET, make_snapshot(levels))
+    return service
+
+
+def timed(func, items):
+    durations = []
+    for item in items:
+        started = time.perf_counter()
+        func(item)
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def summarize(durations):
+    total = sum(durations)
+    return {
+        'msgs_per_sec': round(len(durations) / total, 1) if total else 0.0,
+        'p50_us': round(percentile(durations, 0.5) * 1e6, 2),
+        'p99_us': round(percentile(durations, 0.99) * 1e6, 2)
+    }
+
+
+def measure_allocations(func, items):
+    """
+    每条消息处理期间新分配内存的峰值（字节）的平均值
+    """
+    peaks = []
+    tracemalloc.start()
+    try:
+        for item in items:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            func(item)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return round(sum(peaks) / len(peaks), 1) if peaks else 0.0
+
+
+def bench_update(levels, changes, count):
+    service = make_service(levels)
+    updates = make_updates(count, levels, changes)
+    apply = lambda update: service.update_order_book(SYMBOL, MARKET, update)
+    result = summarize(timed(apply, updates))
+    result['alloc_bytes_per_msg'] = measure_allocations(apply, updates[:min(200, count)])
+    return result
+
+
+def bench_publish(levels, changes, pushes):
+    """
+    每个推送节拍发布一次快照的耗时和内存分配：复制两边的价格/数量列并读出各步长档位
+    """
+    service = make_service(levels)
+    updates = make_updates(pushes, levels, changes)
+    order_book = service.depth_data[SYMBOL][MARKET]
+    last_price = service.last_price_data[SYMBOL][MARKET]
+
+    def publish(update):
+        order_book.apply(update['b'], update['a'])
+        started = time.perf_counter()
+        order_book.publish(last_price)
+        return time.perf_counter() - started
+
+    durations = [publish(update) for update in updates]
+    return {
+        'per_publish_us': round(percentile(durations, 0.5) * 1e6, 2),
+        'alloc_bytes_per_publish': measure_allocations(lambda _: order_book.publish(last_price), updates[:50])
+    }
+
+
+def bench_aggregate(levels, changes, pushes):
+    """
+    对比逐步长的calculate_price_levels、由列表聚合的process_symbol_depth和读取增量区间的compute_symbol_data
+    """
+    service = make_service(levels)
+    updates = make_updates(pushes, levels, changes)
+    steps = list(CONFIG[SYMBOL][MARKET])
+
+    def legacy(update):
+        service.update_order_book(SYMBOL, MARKET, update)
+        service.take_dirty()
+        market_data = service.get_symbol_depth(SYMBOL)[MARKET]
+        started = time.perf_counter()
+        for step in steps:
+            service.calculate_price_levels(market_data['bids'], market_data['asks'],
+                                           market_data['last_price'], step, service.level_count)
+        return time.perf_counter() - started
+
+    def batched(update):
+        service.update_order_book(SYMBOL, MARKET, update)
+        service.take_dirty()
+        depth_data = service.get_symbol_depth(SYMBOL)
+        started = time.perf_counter()
+        service.process_symbol_depth(SYMBOL[:-len('USDT')], depth_data)
+        return time.perf_counter() - started
+
+    def incremental(update):
+        service.update_order_book(SYMBOL, MARKET, update)
+        # 快照由推送节拍发布，这里模拟每条增量后一个节拍
+        service.take_dirty()
+        started = time.perf_counter()
+        service.compute_symbol_data(SYMBOL, {MARKET})
+        return time.perf_counter() - started
+
+    return {
+        'legacy': {'per_push_us': round(percentile([legacy(u) for u in updates], 0.5) * 1e6, 2)},
+        'batched': {'per_push_us': round(percentile([batched(u) for u in updates], 0.5) * 1e6, 2)},
+        'incremental': {'per_push_us': round(percentile([incremental(u) for u in updates], 0.5) * 1e6, 2)}
+    }
+
+
+def bench_push(levels, changes, pushes):
+    """
+    每次推送前应用一条增量，测量push_updated_data的耗时（所有步长均有订阅）
+    """
+    service = make_service(levels)
+    service.set_socketio_instance(NullSocketIO())
+    short_symbol = SYMBOL[:-len('USDT')]
+    for step in CONFIG[SYMBOL][MARKET]:
+        service.subscribe('bench', short_symbol, MARKET, step)
+    updates = make_updates(pushes, levels, changes)
+    durations = []
+    for update in updates:
+        service.update_order_book(SYMBOL, MARKET, update)
+        dirty = service.take_dirty()
+        started = time.perf_counter()
+        service.push_updated_data({symbol for symbol, market in dirty})
+        durations.append(time.perf_counter() - started)
+    return {'per_push_us': round(percentile(durations, 0.5) * 1e6, 2),
+            'p99_us': round(percentile(durations, 0.99) * 1e6, 2)}
+
+
+def bench_replay(path):
+    service = WebSocketService()
+    stats = asyncio.run(replay(path, service))
+    return {'frames_per_sec': round(stats['frames_per_second'], 1)}
+
+
+def run_all(args):
+    results = {}
+    for levels in args.levels:
+        for changes in args.changes:
+            suffix = f"levels={levels}/changes={changes}"
+            random.seed(1)
+            results[f"update/{suffix}"] = bench_update(levels, changes, args.messages)
+            random.seed(1)
+            results[f"publish/{suffix}"] = bench_publish(levels, changes, args.pushes)
+            random.seed(1)
+            for name, value in bench_aggregate(levels, changes, args.pushes).items():
+                results[f"aggregate_{name}/{suffix}"] = value
+            random.seed(1)
+            results[f"push/{suffix}"] = bench_push(levels, changes, args.pushes)
+    if args.capture:
+        results['replay'] = bench_replay(args.capture)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    返回变差超过tolerance的指标列表
+    """
+    regressions = []
+    for case, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(case, {}).get(metric)
+            if not base:
+                continue
+            higher_is_better = METRICS.get(metric, False)
+            change = (value - base) / base
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append((case, metric, base, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='订单簿热路径基准测试')
+    parser.add_argument('--levels', type=int, nargs='+', default=[200, 1000, 5000], help='每边档数')
+    parser.add_argument('--changes', type=int, nargs='+', default=[10, 100], help='每条增量修改的价位数')
+    parser.add_argument('--messages', type=int, default=2000, help='更新测试的消息数')
+    parser.add_argument('--pushes', type=int, default=300, help='聚合和推送测试的次数')
+    parser.add_argument('--capture', help='回放的录制文件')
+    parser.add_argument('--save-baseline', help='把结果保存为基线JSON')
+    parser.add_argument('--compare', help='与基线JSON比较')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的变差比例')
+    args = parser.parse_args()
+
+    results = run_all(args)
+    for case, metrics in results.items():
+        print(f"{case:<45} " + '  '.join(f"{k}={v}" for k, v in metrics.items()))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"基线已保存到 {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for case, metric, base, value, change in regressions:
+            print(f"性能回退: {case} {metric} {base} -> {value} ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print("与基线相比没有超过阈值的回退")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+对比订单簿不同存储结构的内存占用
+
+用法:
+    python benchmarks/bench_memory.py --symbols 20 --levels 5000
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+from bisect import insort
+
+from common import MID_PRICE, TICK, make_snapshot
+from app.services.order_book import OrderBook
+
+
+def build_lists(snapshot):
+    """
+    最初的结构：{'bids': [[price, quantity], ...], 'asks': [...]}
+    """
+    return {
+        'bids': [[float(price), float(quantity)] for price, quantity in snapshot['bids']],
+        'asks': [[float(price), float(quantity)] for price, quantity in snapshot['asks']]
+    }
+
+
+def build_dict_index(snapshot):
+    """
+    哈希索引加有序价格列表：每边 {price: quantity} 和 [price, ...]
+    """
+    book = {}
+    for side in ('bids', 'asks'):
+        levels = {}
+        prices = []
+        for price, quantity in snapshot[side]:
+            price = float(price)
+            levels[price] = float(quantity)
+            insort(prices, price)
+        book[side] = (levels, prices)
+    return book
+
+
+def build_order_book(snapshot, steps=()):
+    """
+    当前结构：整数tick价格列和数量列
+    """
+    order_book = OrderBook(steps, 2, ('full', None), TICK)
+    order_book.load(snapshot['bids'], snapshot['asks'])
+    order_book.publish(MID_PRICE)
+    return order_book
+
+
+def measure(builder, snapshots):
+    """
+    返回构建所有订单簿后新增的内存（字节）
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    books = [builder(snapshot) for snapshot in snapshots]
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del books
+    return used
+
+
+def main():
+    parser = argparse.ArgumentParser(description='订单簿存储结构内存对比')
+    parser.add_argument('--symbols', type=int, default=20, help='订单簿数量')
+    parser.add_argument('--levels', type=int, default=5000, help='每边档数')
+    args = parser.parse_args()
+    random.seed(1)
+    snapshots = [make_snapshot(args.levels) for _ in range(args.symbols)]
+    total_levels = args.symbols * args.levels * 2
+    cases = (
+        ('list_of_lists', build_lists),
+        ('dict_index', build_dict_index),
+        ('tick_columns', build_order_book),
+        ('tick_columns+buckets', lambda snapshot: build_order_book(snapshot, (10, 20, 50)))
+    )
+    print(f"{args.symbols} 个订单簿，每边 {args.levels} 档")
+    print(f"{'structure':<22} {'total(MB)':>10} {'bytes/level':>12}")
+    for name, builder in cases:
+        used = measure(builder, snapshots)
+        print(f"{name:<22} {used / 1024 / 1024:>10.2f} {used / total_levels:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
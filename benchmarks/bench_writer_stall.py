@@ -0,0 +1,104 @@
+"""
+对比读取方持锁复制/聚合（旧实现）与只读快照（新实现）时写入方的停顿时间
+
+none为没有读取方的基准；snapshot的读取方不停地做全量聚合，和写入方争抢GIL，
+publisher按推送线程的实际节奏每个节拍发布一次并计算推送数据
+
+用法:
+    python benchmarks/bench_writer_stall.py --updates 20000 --levels 500
+"""
+import argparse
+import random
+import threading
+import time
+
+from common import MARKET, SYMBOL, make_snapshot, make_updates, percentile
+from app.config import PUSH_INTERVAL
+from app.services.websocket_service import WebSocketService
+
+
+def make_service(levels):
+    service = WebSocketService()
+    service.load_order_book_snapshot(SYMBOL, MARKET, make_snapshot(levels))
+    return service
+
+
+def legacy_reader(service, stop_event):
+    """
+    旧实现：持锁复制列表，再在同一把锁内做聚合计算
+    """
+    while not stop_event.is_set():
+        with service.lock:
+            depth_data = {
+                market: dict(order_book.to_dict(), last_price=service.last_price_data[SYMBOL][market])
+                for market, order_book in service.depth_data[SYMBOL].items()
+            }
+        with service.lock:
+            service.process_symbol_depth('BTC', depth_data)
+
+
+def snapshot_reader(service, stop_event):
+    """
+    新实现：像推送线程一样每个节拍持锁发布一次快照，读取和聚合计算不持锁
+    """
+    next_publish = 0
+    while not stop_event.is_set():
+        if time.perf_counter() >= next_publish:
+            next_publish = time.perf_counter() + PUSH_INTERVAL
+            service.take_dirty()
+        depth_data = service.get_symbol_depth(SYMBOL)
+        service.process_symbol_depth('BTC', depth_data)
+
+
+def publisher_reader(service, stop_event):
+    """
+    新实现按推送线程的实际节奏：每个节拍发布快照并由区间挂单量计算推送数据，其余时间等待
+    """
+    while not stop_event.wait(PUSH_INTERVAL):
+        service.take_dirty()
+        service.compute_symbol_data(SYMBOL, {MARKET})
+
+
+def no_reader(service, stop_event):
+    """
+    没有读取方，写入方自身的耗时（包括每个推送间隔一次的快照发布）
+    """
+    stop_event.wait()
+
+
+def run(reader, levels, updates):
+    service = make_service(levels)
+    # 只测量订单簿写入，不启动推送
+    service.mark_dirty = lambda symbol, market, changed_at=None: None
+    stop_event = threading.Event()
+    thread = threading.Thread(target=reader, args=(service, stop_event))
+    thread.daemon = True
+    thread.start()
+    durations = []
+    for update in updates:
+        started = time.perf_counter()
+        service.update_order_book(SYMBOL, MARKET, update)
+        durations.append(time.perf_counter() - started)
+    stop_event.set()
+    thread.join()
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='写入方停顿时间对比')
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--levels', type=int, default=500)
+    args = parser.parse_args()
+    random.seed(1)
+    updates = make_updates(args.updates, args.levels, changes=20)
+    print(f"{'reader':<10} {'p50(us)':>10} {'p99(us)':>10} {'max(ms)':>10} {'total(ms)':>10}")
+    readers = (('none', no_reader), ('legacy', legacy_reader), ('snapshot', snapshot_reader),
+               ('publisher', publisher_reader))
+    for name, reader in readers:
+        durations = run(reader, args.levels, updates)
+        print(f"{name:<10} {percentile(durations, 0.5) * 1e6:>10.1f} {percentile(durations, 0.99) * 1e6:>10.1f} "
+              f"{max(durations) * 1e3:>10.2f} {sum(durations) * 1e3:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
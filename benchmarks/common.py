@@ -0,0 +1,56 @@
+"""
+基准测试共用的合成行情生成和统计函数
+"""
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+SYMBOL = 'BTCUSDT'
+MARKET = 'futures'
+MID_PRICE = 60000.0
+TICK = 0.01
+
+
+def make_snapshot(levels, mid_price=MID_PRICE, tick=TICK):
+    """
+    生成每边levels档的深度快照
+    """
+    bids = [[f"{mid_price - i * tick:.2f}", f"{random.uniform(0.1, 5):.3f}"] for i in range(1, levels + 1)]
+    asks = [[f"{mid_price + i * tick:.2f}", f"{random.uniform(0.1, 5):.3f}"] for i in range(levels)]
+    return {'lastUpdateId': 1, 'bids': bids, 'asks': asks}
+
+
+def make_updates(count, levels, changes, mid_price=MID_PRICE, tick=TICK, symbol=SYMBOL):
+    """
+    生成count条深度增量，每条修改changes个价位（约10%为删除）
+    """
+    updates = []
+    update_id = 1
+    for _ in range(count):
+        bids = []
+        asks = []
+        for _ in range(changes):
+            offset = random.randint(1, levels) * tick
+            quantity = '0' if random.random() < 0.1 else f"{random.uniform(0.1, 5):.3f}"
+            if random.random() < 0.5:
+                bids.append([f"{mid_price - offset:.2f}", quantity])
+            else:
+                asks.append([f"{mid_price + offset:.2f}", quantity])
+        updates.append({
+            'e': 'depthUpdate', 's': symbol,
+            'U': update_id + 1, 'u': update_id + 1, 'pu': update_id,
+            'b': bids, 'a': asks
+        })
+        update_id += 1
+    return updates
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
@@ -1,14 +1,16 @@
-from flask import Flask
-from flask_socketio import SocketIO
+from flask import Flask, request
+from flask_socketio import SocketIO, join_room, leave_room
 import os
 from app.services import  websocket_service
 from app.blueprints.ob import ob_bp
+from app.services.payload_cache import SocketIOJSON
 
 # 创建Flask应用
 app = Flask(__name__)
 
-# 初始化SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', ping_interval=25, ping_timeout=60)
+# 初始化SocketIO，使用可以直接拼接已编码数据的json模块
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', ping_interval=25, ping_timeout=60,
+                    json=SocketIOJSON)
 
 # 注册蓝图
 app.register_blueprint(ob_bp)
@@ -25,6 +27,34 @@ def connect():
 @socketio.event
 def disconnect():
     print('Client disconnected')
+    websocket_service.remove_client(request.sid)
+
+# 订阅 (symbol, market, step) 房间，先发送完整数据，之后只推送增量
+@socketio.event
+def subscribe(data=None):
+    # 客户端可以发送任意数据，不是对象时直接忽略
+    if not isinstance(data, dict):
+        return
+    room = websocket_service.subscribe(request.sid, data.get('symbol'), data.get('market'), data.get('step'))
+    if room:
+        join_room(room)
+        websocket_service.send_full_frame(request.sid, room)
+
+# 取消订阅
+@socketio.event
+def unsubscribe(data=None):
+    if not isinstance(data, dict):
+        return
+    room = websocket_service.unsubscribe(request.sid, data.get('symbol'), data.get('market'), data.get('step'))
+    if room:
+        leave_room(room)
+
+# 客户端发现增量序号不连续时请求重新同步，seq是已应用的序号，能从缓存重放时只补发缺少的增量，否则发送完整数据
+@socketio.event
+def depth_resync(data=None):
+    if not isinstance(data, dict):
+        return
+    websocket_service.send_full_frame(request.sid, data.get('room'), data.get('seq'))
 
 def start_websocket_services():
     """在后台线程中启动WebSocket服务"""
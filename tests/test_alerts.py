@@ -0,0 +1,109 @@
+from app.services.alerts import AlertEngine
+
+# BTCUSDT现货步长10的阈值为15
+THRESHOLD = 15
+
+
+def levels(ask_quantity, ask_price=60010, bid_quantity=0.0):
+    """
+    每次生成新的档位对象，模拟快照发布了新版本
+    """
+    return {10: {
+        'ask_levels': [{'price': ask_price, 'quantity': ask_quantity}],
+        'bid_levels': [{'price': 60000, 'quantity': bid_quantity}]
+    }}
+
+
+def run(engine, steps):
+    """
+    依次在时间now检查挂单量并flush，返回每一步提醒的 (类型, 价格) 列表
+    """
+    fired = []
+    for now, level_data in steps:
+        if level_data is not None:
+            engine.evaluate('BTCUSDT', 'spot', level_data, now)
+        fired.append([(alert['type'], alert['price']) for alert in engine.flush(now)])
+    return fired
+
+
+def test_alert_fires_after_debounce():
+    engine = AlertEngine(clear_ratio=0.8, debounce=1.0, cooldown=0)
+    fired = run(engine, [(0, levels(20)), (0.5, levels(21)), (1.0, None)])
+    assert fired == [[], [], [('ask', 60010)]]
+    assert engine.flush(1.0) == []
+    assert ('BTCUSDT', 'spot', 10, 'ask', 60010) in engine.active
+
+
+def test_alert_reports_latest_quantity():
+    engine = AlertEngine(debounce=1.0, cooldown=0)
+    engine.evaluate('BTCUSDT', 'spot', levels(20), 0)
+    engine.evaluate('BTCUSDT', 'spot', levels(30), 0.5)
+    [alert] = engine.flush(1.0)
+    assert alert['quantity'] == 30
+    assert alert['threshold'] == THRESHOLD
+    assert alert['symbol'] == 'BTC'
+
+
+def test_short_spike_is_debounced():
+    engine = AlertEngine(debounce=1.0, cooldown=0)
+    # 只持续0.5秒就回落，不触发；之后重新达到阈值从头计时
+    fired = run(engine, [(0, levels(20)), (0.5, levels(5)), (0.8, levels(20)), (1.2, None), (1.8, None)])
+    assert fired == [[], [], [], [], [('ask', 60010)]]
+
+
+def test_rearm_requires_drop_below_clear_ratio():
+    engine = AlertEngine(clear_ratio=0.8, debounce=0, cooldown=0)
+    fired = run(engine, [
+        (0, levels(20)),
+        # 降到阈值以下但不低于阈值*0.8，仍处于触发状态
+        (1, levels(13)),
+        (2, levels(20)),
+        # 低于阈值*0.8后解除，再次达到阈值重新提醒
+        (3, levels(11)),
+        (4, levels(20)),
+    ])
+    assert fired == [[('ask', 60010)], [], [], [], [('ask', 60010)]]
+
+
+def test_cooldown_suppresses_repeat_alerts():
+    engine = AlertEngine(clear_ratio=0.8, debounce=0, cooldown=60)
+    fired = run(engine, [
+        (0, levels(20)),
+        (1, levels(5)),
+        # 冷却期内重新达到阈值，不重复提醒
+        (2, levels(20)),
+        (3, levels(5)),
+        # 冷却期过后再次提醒
+        (61, levels(20)),
+    ])
+    assert fired == [[('ask', 60010)], [], [], [], [('ask', 60010)]]
+    assert len(engine.fired_at) == 1
+
+
+def test_expired_cooldowns_are_removed():
+    engine = AlertEngine(debounce=0, cooldown=10)
+    run(engine, [(0, levels(20)), (1, levels(5, bid_quantity=20))])
+    assert len(engine.fired_at) == 2
+    engine.flush(10.5)
+    assert list(engine.fired_at) == [('BTCUSDT', 'spot', 10, 'bid', 60000)]
+    engine.flush(11)
+    assert engine.fired_at == {}
+    assert engine.cooldown_heap == []
+
+
+def test_bucket_leaving_view_is_cleared():
+    engine = AlertEngine(debounce=1.0, cooldown=0)
+    engine.evaluate('BTCUSDT', 'spot', levels(20), 0)
+    # 价格移动后原区间不再显示，等待中的区间被清除，不会触发
+    engine.evaluate('BTCUSDT', 'spot', levels(20, ask_price=60020), 0.5)
+    assert [alert['price'] for alert in engine.flush(1.0)] == []
+    assert [alert['price'] for alert in engine.flush(1.5)] == [60020]
+    assert engine.debounce_heap == []
+
+
+def test_reset_clears_symbol_state():
+    engine = AlertEngine(debounce=1.0, cooldown=60)
+    engine.evaluate('BTCUSDT', 'spot', levels(20), 0)
+    engine.reset('BTCUSDT')
+    assert engine.flush(2) == []
+    assert engine.pending == {} and engine.visible == {}
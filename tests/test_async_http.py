@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+import pytest
+
+# 先导入线程模式入口，再导入异步入口，后者不能替换已设置的推送对象
+import main
+async_main = pytest.importorskip('async_main')
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.blueprints.ob import routes
+from app.config import CONFIG
+from app.services.websocket_service import websocket_service as service
+
+AUTH = {'Authorization': 'Bearer secret'}
+
+
+def test_import_does_not_replace_emitter():
+    assert service.socketio_instance is main.socketio
+
+
+def run_requests(requests):
+    """
+    把服务的事件循环设为当前循环（模拟异步服务模式），依次发送请求，返回 (状态码列表, 事件循环线程)
+    """
+    async def run():
+        service.loop = asyncio.get_running_loop()
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', async_main.handle_http)
+        async with TestClient(TestServer(app)) as client:
+            statuses = []
+            for method, path, kwargs in requests:
+                # 在循环中等待自身会死锁，设置超时
+                response = await asyncio.wait_for(client.request(method, path, **kwargs), 5)
+                statuses.append(response.status)
+            # 让在循环中启动的增删交易对任务执行完
+            await asyncio.sleep(0)
+            return statuses, threading.get_ident()
+
+    return asyncio.run(run())
+
+
+def test_state_changing_routes_run_on_loop(monkeypatch):
+    monkeypatch.setattr(routes, 'ADMIN_TOKEN', 'secret')
+    threads = {}
+
+    def record(name, func):
+        def wrapper(*args, **kwargs):
+            threads[name] = threading.get_ident()
+            return func(*args, **kwargs)
+        return wrapper
+
+    async def add_symbol_async(symbol, market_config):
+        threads['add_symbol_async'] = threading.get_ident()
+
+    monkeypatch.setattr(service, 'get_history', record('get_history', service.get_history))
+    monkeypatch.setattr(service, 'get_publisher_metrics', record('get_publisher_metrics', service.get_publisher_metrics))
+    monkeypatch.setattr(service, 'add_symbol_async', add_symbol_async)
+    original_loop = service.loop
+    try:
+        statuses, loop_thread = run_requests([
+            ('POST', '/api/symbols', {'json': {'symbol': 'ADAUSDT', 'markets': {'spot': {'1': 500}}}, 'headers': AUTH}),
+            ('GET', '/api/history?symbol=BTC&market=spot', {}),
+            ('GET', '/api/publisher_metrics', {}),
+        ])
+    finally:
+        service.loop = original_loop
+        if 'ADAUSDT' in CONFIG:
+            service.remove_symbol('ADAUSDT')
+    assert statuses[0] == 201
+    # 修改状态和读取历史的请求与行情处理在同一线程，只读请求在线程池中执行
+    assert threads['add_symbol_async'] == loop_thread
+    assert threads['get_history'] == loop_thread
+    assert threads['get_publisher_metrics'] != loop_thread
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from app.services import metrics
+from app.services.capture import CHUNK_HEADER, MAGIC, FrameRecorder, iter_frames
+from app.services.publisher import LatencyWindow
+from app.services.websocket_service import WebSocketService
+
+
+def depth_frame(u):
+    return json.dumps({'e': 'depthUpdate', 'E': int(time.time() * 1000), 's': 'BTCUSDT',
+                       'U': u, 'u': u, 'pu': u - 1, 'b': [], 'a': []})
+
+
+def test_redundant_frames_recorded_once(tmp_path):
+    path = str(tmp_path / 'feed.obcap')
+    service = WebSocketService()
+    service.feed_redundancy = 2
+    for connection_id in ('futures-0-0', 'futures-0-1'):
+        service.feed_latency[connection_id] = LatencyWindow()
+    processed = []
+
+    async def process_message(data, symbol, market):
+        processed.append(data['u'])
+
+    service.process_message = process_message
+    service.start_recording(path)
+
+    async def run():
+        queue = asyncio.Queue()
+        for u in (1, 2, 3):
+            # 两条冗余连接收到同样的帧
+            queue.put_nowait(('futures-0-0', time.time(), depth_frame(u)))
+            queue.put_nowait(('futures-0-1', time.time(), depth_frame(u)))
+        consumer = asyncio.ensure_future(service.consume_messages('futures', {'BTCUSDT'}, queue))
+        while not queue.empty():
+            await asyncio.sleep(0)
+        consumer.cancel()
+
+    asyncio.run(run())
+    service.stop_recording()
+    recorded = [json.loads(data)['u'] for _, stream, data in iter_frames(path) if stream == 'futures']
+    assert processed == [1, 2, 3]
+    assert recorded == [1, 2, 3]
+
+
+def test_recorder_drops_when_queue_full(tmp_path, monkeypatch):
+    path = str(tmp_path / 'full.obcap')
+    release = threading.Event()
+    run = FrameRecorder.run
+    # 写盘线程先不取帧，模拟写盘跟不上
+    monkeypatch.setattr(FrameRecorder, 'run', lambda self: (release.wait(), run(self)))
+    before = metrics.MESSAGES_FAILED.values.get(('futures', 'capture_full'), 0)
+    recorder = FrameRecorder(path, max_pending=2)
+    for u in (1, 2, 3):
+        recorder.record('futures', depth_frame(u))
+    assert recorder.dropped == 1
+    assert metrics.MESSAGES_FAILED.values[('futures', 'capture_full')] == before + 1
+    release.set()
+    recorder.close()
+    assert [json.loads(data)['u'] for _, _, data in iter_frames(path)] == [1, 2]
+
+
+def record_frames(path, first, last):
+    recorder = FrameRecorder(path)
+    for u in range(first, last + 1):
+        recorder.record('futures', depth_frame(u))
+    recorder.close()
+
+
+@pytest.mark.parametrize('cut', [CHUNK_HEADER.size // 2, CHUNK_HEADER.size + 5])
+def test_append_after_crash_truncates_partial_chunk(tmp_path, cut):
+    path = str(tmp_path / 'crash.obcap')
+    record_frames(path, 1, 2)
+    with open(path, 'rb') as f:
+        complete = f.read()
+    record_frames(path, 3, 4)
+    # 模拟写第二个块时进程崩溃，只写入了一部分
+    with open(path, 'r+b') as f:
+        f.truncate(len(complete) + cut)
+    record_frames(path, 5, 6)
+    assert [json.loads(data)['u'] for _, _, data in iter_frames(path)] == [1, 2, 5, 6]
+
+
+def test_corrupt_last_chunk_is_dropped(tmp_path):
+    path = str(tmp_path / 'corrupt.obcap')
+    record_frames(path, 1, 1)
+    with open(path, 'ab') as f:
+        f.write(CHUNK_HEADER.pack(4, 1, 0) + b'junk')
+    record_frames(path, 2, 2)
+    assert [json.loads(data)['u'] for _, _, data in iter_frames(path)] == [1, 2]
+
+
+def test_partial_magic_is_rewritten_and_foreign_file_kept(tmp_path):
+    path = str(tmp_path / 'empty.obcap')
+    with open(path, 'wb') as f:
+        f.write(MAGIC[:3])
+    record_frames(path, 1, 1)
+    assert [json.loads(data)['u'] for _, _, data in iter_frames(path)] == [1]
+    other = tmp_path / 'other.txt'
+    other.write_bytes(b'not a capture file')
+    with pytest.raises(ValueError):
+        FrameRecorder(str(other))
+    assert other.read_bytes() == b'not a capture file'
+
+
+def test_close_does_not_block_on_full_queue(tmp_path, monkeypatch):
+    path = str(tmp_path / 'stuck.obcap')
+    release = threading.Event()
+    run = FrameRecorder.run
+    monkeypatch.setattr(FrameRecorder, 'run', lambda self: (release.wait(), run(self)))
+    recorder = FrameRecorder(path, max_pending=2)
+    for u in (1, 2):
+        recorder.record('futures', depth_frame(u))
+    started = time.monotonic()
+    recorder.close(timeout=0.1)
+    assert time.monotonic() - started < 2
+    assert recorder.dropped == 2
+    release.set()
+    recorder.thread.join(5)
+    assert not recorder.thread.is_alive()
+    recorder.file.close()
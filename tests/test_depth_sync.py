@@ -0,0 +1,138 @@
+import asyncio
+
+from app.services.depth_sync import DepthSynchronizer
+
+
+class ScriptedFetcher:
+    def __init__(self, *update_ids):
+        """
+        按顺序返回给定lastUpdateId的快照，记录请求次数
+        """
+        self.update_ids = list(update_ids)
+        self.calls = 0
+
+    async def __call__(self, symbol, market):
+        self.calls += 1
+        return {'lastUpdateId': self.update_ids.pop(0), 'bids': [], 'asks': []}
+
+
+def spot(first, last):
+    return {'U': first, 'u': last}
+
+
+def futures(first, last, prev):
+    return {'U': first, 'u': last, 'pu': prev}
+
+
+async def settle():
+    """
+    让快照请求任务执行完
+    """
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def run_script(fetcher, market, script):
+    """
+    依次送入增量，返回 (同步器, 加载的快照ID, 应用的增量u)
+    """
+    snapshots = []
+    updates = []
+
+    async def run():
+        synchronizer = DepthSynchronizer(
+            'BTCUSDT', market, fetcher,
+            on_snapshot=lambda snapshot: snapshots.append(snapshot['lastUpdateId']),
+            on_update=lambda event: updates.append(event['u']),
+            retry_delay=0
+        )
+        for event in script:
+            synchronizer.handle(event)
+            await settle()
+        synchronizer.cancel()
+        return synchronizer
+
+    return asyncio.run(run()), snapshots, updates
+
+
+def test_spot_drops_stale_events_before_snapshot():
+    fetcher = ScriptedFetcher(100)
+    synchronizer, snapshots, updates = run_script(fetcher, 'spot', [
+        spot(90, 95), spot(96, 100), spot(101, 103), spot(104, 106)
+    ])
+    assert synchronizer.is_synced()
+    assert snapshots == [100]
+    assert updates == [103, 106]
+    assert synchronizer.dropped_count == 2
+
+
+def test_spot_first_event_straddles_snapshot():
+    fetcher = ScriptedFetcher(100)
+    synchronizer, snapshots, updates = run_script(fetcher, 'spot', [
+        spot(98, 102), spot(103, 105)
+    ])
+    assert snapshots == [100]
+    assert updates == [102, 105]
+
+
+def test_spot_requires_contiguous_first_update_id():
+    fetcher = ScriptedFetcher(100, 106)
+    synchronizer, snapshots, updates = run_script(fetcher, 'spot', [
+        spot(101, 103), spot(104, 105),
+        # 缺少106，U不等于上一条u+1
+        spot(107, 108),
+        spot(109, 110)
+    ])
+    assert synchronizer.resync_count == 1
+    assert fetcher.calls == 2
+    assert snapshots == [100, 106]
+    assert updates == [103, 105, 108, 110]
+    assert synchronizer.is_synced()
+
+
+def test_futures_uses_previous_update_id():
+    fetcher = ScriptedFetcher(100)
+    synchronizer, snapshots, updates = run_script(fetcher, 'futures', [
+        # 合约丢弃 u < lastUpdateId 的增量，第一条满足 U <= lastUpdateId <= u
+        futures(90, 99, 89), futures(100, 104, 99),
+        # 合约的U可以跳跃，只看pu是否等于上一条的u
+        futures(110, 112, 104), futures(113, 120, 112)
+    ])
+    assert synchronizer.is_synced()
+    assert synchronizer.resync_count == 0
+    assert synchronizer.dropped_count == 1
+    assert updates == [104, 112, 120]
+
+
+def test_futures_gap_triggers_resync():
+    fetcher = ScriptedFetcher(100, 130)
+    synchronizer, snapshots, updates = run_script(fetcher, 'futures', [
+        futures(100, 104, 99),
+        # pu不等于上一条的u，说明中间有增量丢失
+        futures(120, 125, 115),
+        futures(126, 131, 125), futures(132, 135, 131)
+    ])
+    assert synchronizer.resync_count == 1
+    assert snapshots == [100, 130]
+    assert updates == [104, 131, 135]
+    assert synchronizer.is_synced()
+
+
+def test_duplicate_event_after_sync_is_dropped():
+    fetcher = ScriptedFetcher(100)
+    synchronizer, snapshots, updates = run_script(fetcher, 'spot', [
+        spot(101, 103), spot(104, 105), spot(104, 105)
+    ])
+    assert updates == [103, 105]
+    assert synchronizer.resync_count == 0
+    assert synchronizer.dropped_count == 1
+
+
+def test_snapshot_too_old_is_refetched():
+    # 第一次快照早于缓存的第一条增量，中间有缺口，需要重新拉取
+    fetcher = ScriptedFetcher(50, 101)
+    synchronizer, snapshots, updates = run_script(fetcher, 'spot', [spot(100, 105)])
+    assert fetcher.calls == 2
+    assert snapshots == [101]
+    assert updates == [105]
+    assert synchronizer.is_synced()
@@ -0,0 +1,123 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('pyarrow')
+import pyarrow.parquet as pq
+
+from app.services.aggregation import aggregate_levels
+from app.services.feature_collector import FeatureCollector, ParquetBatchWriter, PendingRows, feature_names
+from app.services.websocket_service import WebSocketService
+
+
+def test_pending_rows_pop_in_time_order():
+    rows = PendingRows(4, 2)
+    for timestamp in (10, 20, 30):
+        rows.push(timestamp, [timestamp, -timestamp])
+    assert rows.pop_before(5) is None
+    timestamps, features = rows.pop_before(20)
+    assert timestamps.tolist() == [10, 20]
+    assert features.tolist() == [[10, -10], [20, -20]]
+    assert rows.size == 1
+
+
+def test_pending_rows_overwrite_oldest_when_full():
+    rows = PendingRows(3, 1)
+    for timestamp in range(1, 6):
+        rows.push(timestamp, [timestamp])
+    assert rows.overwritten == 2
+    # 环形缓冲区回绕后仍按时间顺序取出
+    timestamps, features = rows.pop_before(100)
+    assert timestamps.tolist() == [3, 4, 5]
+    assert features[:, 0].tolist() == [3, 4, 5]
+    assert rows.size == 0
+
+
+def make_service():
+    service = WebSocketService()
+    service.load_order_book_snapshot('BTCUSDT', 'spot', {
+        'lastUpdateId': 1,
+        'bids': [['59995', '1'], ['59985', '2'], ['59945', '5']],
+        'asks': [['60005', '3'], ['60015', '4'], ['60055', '6']]
+    })
+    return service
+
+
+@pytest.fixture
+def collector(tmp_path):
+    collector = FeatureCollector(make_service(), str(tmp_path), horizon=1)
+    batches = []
+    collector.writer.put = batches.append
+    collector.batches = batches
+    yield collector
+    collector.writer.close()
+
+
+def test_features_read_snapshot_levels(collector):
+    service = collector.service
+    # 只读取快照中维护的档位，不再复制整个订单簿重新聚合
+    service.get_symbol_depth = lambda symbol: pytest.fail('不应复制订单簿')
+    collector.collect(0)
+    timestamps, features = collector.pending['BTCUSDT'].pop_before(0)
+    row = dict(zip(collector.names, features[0]))
+    snapshot = service.depth_data['BTCUSDT']['spot'].snapshot
+    depth = snapshot.to_dict()
+    expected = aggregate_levels(depth['bids'], depth['asks'], snapshot.last_price, [10, 20, 50], service.level_count)
+    for step_index, step in enumerate((10, 20, 50)):
+        for side in ('ask', 'bid'):
+            assert [row[f"spot_s{step_index}_{side}_{i + 1}"] for i in range(service.level_count)] == [
+                level['quantity'] for level in expected[step][f"{side}_levels"]
+            ]
+    assert row['spot_price'] == 60005.0
+    assert np.isnan(row['futures_price'])
+
+
+def test_level_count_is_limited_to_snapshot(tmp_path):
+    service = WebSocketService()
+    with pytest.raises(ValueError):
+        FeatureCollector(service, str(tmp_path), level_count=service.level_count + 1)
+
+
+def test_rows_are_labelled_after_horizon(collector):
+    names = feature_names(collector.level_count)
+    pending = collector.pending['BTCUSDT']
+    for timestamp, price in ((0, 100.0), (100, 100.0), (200, 100.0)):
+        features = np.zeros(len(names))
+        features[0] = price
+        pending.push(timestamp, features)
+    # 只有horizon(1秒)之前的行才打标签
+    collector.label('BTCUSDT', pending, 1100, 100.5)
+    collector.label('BTCUSDT', pending, 1200, 99.0)
+    first, second = collector.batches
+    assert first['timestamp'].tolist() == [0, 100]
+    assert first['label'].tolist() == [1, 1]
+    assert first['label_timestamp'].tolist() == [1100, 1100]
+    assert second['timestamp'].tolist() == [200]
+    assert second['label'].tolist() == [-1]
+    collector.label('BTCUSDT', pending, 5000, 100.05)
+    assert len(collector.batches) == 2
+    assert collector.labelled == 3
+
+
+def test_unchanged_price_is_labelled_flat(collector):
+    pending = collector.pending['BTCUSDT']
+    features = np.zeros(len(collector.names))
+    features[0] = 100.0
+    pending.push(0, features)
+    collector.label('BTCUSDT', pending, 1000, 100.05)
+    assert collector.batches[0]['label'].tolist() == [0]
+
+
+def test_writer_partitions_by_hour(tmp_path):
+    writer = ParquetBatchWriter(str(tmp_path), batch_rows=10)
+    # 2024-01-01 00:59:59 到 01:00:01，跨小时的批次分开写
+    start = 1704070799000
+    timestamps = np.array([start, start + 1000, start + 2000], dtype='int64')
+    writer.put({'timestamp': timestamps, 'value': np.array([1.0, 2.0, 3.0])})
+    writer.close()
+    files = sorted(tmp_path.rglob('*.parquet'))
+    assert [path.parent.relative_to(tmp_path).as_posix() for path in files] == [
+        'date=2024-01-01/hour=00', 'date=2024-01-01/hour=01'
+    ]
+    assert [pq.read_table(path).column('value').to_pylist() for path in files] == [[1.0], [2.0, 3.0]]
+    assert writer.rows_written == 3
+    assert writer.files_written == 2
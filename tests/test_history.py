@@ -0,0 +1,65 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from app.services.aggregation import read_bucket_levels
+from app.services.history import LevelHistory
+
+
+def levels_at(ask_start, bid_start, asks, bids, step=10):
+    """
+    按区间编号生成一个步长的档位，格式与快照中的levels相同
+    """
+    ask_totals = {ask_start + i: quantity for i, quantity in enumerate(asks)}
+    bid_totals = {bid_start - i: quantity for i, quantity in enumerate(bids)}
+    return {step: read_bucket_levels(ask_totals, bid_totals, ask_start, bid_start, step, len(asks))}
+
+
+def make_history(rows=10):
+    history = LevelHistory([10], 2, 100)
+    for i in range(rows):
+        history.append(1000 * i, 100.0 + i, 0.5, levels_at(10, 10, [1.0, 2.0], [3.0, 4.0]))
+    return history
+
+
+def test_query_downsamples_by_resolution():
+    result = make_history().query(resolution=5)
+    assert result['timestamps'] == [0, 5000]
+    assert result['last_price'] == [104.0, 109.0]
+    assert result['levels'][10]['ask_prices'] == [[110, 120], [110, 120]]
+    assert result['levels'][10]['ask_levels'] == [[1.0, 2.0], [1.0, 2.0]]
+
+
+def test_query_returns_prices_per_slot():
+    history = LevelHistory([10], 2, 100)
+    history.append(0, 100.0, 0.0, levels_at(10, 10, [1.0, 2.0], [3.0, 4.0]))
+    history.append(1000, 110.0, 0.0, levels_at(11, 11, [6.0, 8.0], [5.0, 7.0]))
+    levels = history.query()['levels'][10]
+    assert levels['ask_prices'] == [[110, 120], [120, 130]]
+    assert levels['bid_prices'] == [[100, 90], [110, 100]]
+
+
+def test_resampling_averages_by_price_bucket():
+    history = LevelHistory([10], 2, 100)
+    # 价格上移一个区间后，同一位置对应不同的价格区间
+    history.append(0, 100.0, 0.0, levels_at(10, 10, [1.0, 2.0], [3.0, 4.0]))
+    history.append(1000, 110.0, 0.0, levels_at(11, 11, [6.0, 8.0], [5.0, 7.0]))
+    levels = history.query(resolution=5)['levels'][10]
+    # 使用桶内最后一行的区间：卖单120两行都能看到 (2+6)/2，130只有第二行
+    assert levels['ask_prices'] == [[120, 130]]
+    assert levels['ask_levels'] == [[4.0, 8.0]]
+    # 买单110只有第二行，100两行都能看到 (3+7)/2
+    assert levels['bid_prices'] == [[110, 100]]
+    assert levels['bid_levels'] == [[5.0, 5.0]]
+
+
+def test_query_ignores_sub_millisecond_resolution():
+    result = make_history().query(resolution=0.0001)
+    assert len(result['timestamps']) == 10
+
+
+@pytest.mark.parametrize('resolution', ['0', '-1', '0.5', 'nan', 'inf', 'abc'])
+def test_history_route_rejects_invalid_resolution(resolution):
+    import main
+    response = main.app.test_client().get(f'/api/history?symbol=BTC&market=spot&resolution={resolution}')
+    assert response.status_code == 400
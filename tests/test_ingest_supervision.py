@@ -0,0 +1,61 @@
+import os
+
+from app.services import metrics
+from app.services.shared_book import SharedBookSegment
+from app.services.websocket_service import WebSocketService
+
+
+class FakeProcess:
+    def __init__(self, name, alive):
+        self.name = name
+        self.alive = alive
+        self.exitcode = None if alive else -9
+        self.pid = 0
+
+    def is_alive(self):
+        return self.alive
+
+
+def test_dead_ingest_process_is_flagged_and_restarted():
+    service = WebSocketService()
+    segment = SharedBookSegment(f"ob_test_{os.getpid()}", 4, create=True)
+    try:
+        service.shared_books[('BTCUSDT', 'spot')] = segment
+        service.ingest_workers['ingest-spot-0'] = ('spot', {'BTCUSDT': segment.name})
+        service.ingest_processes = [FakeProcess('ingest-spot-0', alive=False)]
+        spawned = []
+        service.spawn_ingest_process = lambda name: spawned.append(name) or FakeProcess(name, alive=True)
+        before = metrics.INGEST_RESTARTS.values.get(('ingest-spot-0',), 0)
+
+        service.take_dirty()
+        assert spawned == ['ingest-spot-0']
+        assert service.ingest_processes[0].is_alive()
+        assert metrics.INGEST_RESTARTS.values[('ingest-spot-0',)] == before + 1
+        # 重启的进程写入新快照前数据仍标记为过期
+        assert service.get_publisher_metrics()['stale_books'] == ['BTCUSDT:spot']
+
+        segment.write(60000.0, [[59999.9, 1.0]], [[60000.1, 2.0]])
+        service.take_dirty()
+        assert service.stale_books == {}
+    finally:
+        service.shared_books = {}
+        segment.close()
+
+
+def test_restart_is_rate_limited():
+    service = WebSocketService()
+    segment = SharedBookSegment(f"ob_test_rate_{os.getpid()}", 4, create=True)
+    try:
+        service.shared_books[('BTCUSDT', 'futures')] = segment
+        service.ingest_workers['ingest-futures-0'] = ('futures', {'BTCUSDT': segment.name})
+        service.ingest_processes = [FakeProcess('ingest-futures-0', alive=False)]
+        spawned = []
+        # 新进程启动后立即退出
+        service.spawn_ingest_process = lambda name: spawned.append(name) or FakeProcess(name, alive=False)
+        for _ in range(5):
+            service.take_dirty()
+        assert spawned == ['ingest-futures-0']
+        assert ('BTCUSDT', 'futures') in service.stale_books
+    finally:
+        service.shared_books = {}
+        segment.close()
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from app.services.aggregation import aggregate_levels
+from app.services.order_book import OrderBook
+
+STEPS = (0.5, 1, 10, 50)
+LEVEL_COUNT = 5
+
+
+def on_tick(price, tick_size):
+    """
+    把价格取整到tick，成交价总是tick的整数倍
+    """
+    return round(round(price / tick_size) * tick_size, 8)
+
+
+def random_price(rng, center, spread, tick_size):
+    return repr(on_tick(center + rng.randint(-spread, spread) * tick_size, tick_size))
+
+
+def mismatches(book, last_price):
+    """
+    比较增量维护的区间挂单量和由全部价位重新聚合的结果，返回不一致的档位数
+    """
+    expected = aggregate_levels(book.bids.to_list(), book.asks.to_list(), last_price, STEPS, LEVEL_COUNT)
+    actual = book.read_levels(last_price)
+    count = 0
+    for step in STEPS:
+        for field in ('ask_levels', 'bid_levels'):
+            for want, got in zip(expected[step][field], actual[step][field]):
+                if want['price'] != pytest.approx(got['price']) or abs(want['quantity'] - got['quantity']) > 1e-6:
+                    count += 1
+    return count
+
+
+@pytest.mark.parametrize('tick_size, retention', [
+    (0.1, ('full', None)),
+    (0.01, ('levels', 300)),
+    (0.1, ('percent', 0.2)),
+])
+def test_bucket_totals_match_aggregate_levels(tick_size, retention):
+    rng = random.Random(7)
+    book = OrderBook(STEPS, LEVEL_COUNT, retention, tick_size)
+    center = 60000.0
+    book.load(
+        [[random_price(rng, center - 1, 2000, tick_size), str(rng.uniform(0.1, 5))] for _ in range(500)],
+        [[random_price(rng, center + 1, 2000, tick_size), str(rng.uniform(0.1, 5))] for _ in range(500)],
+    )
+    total = 0
+    for _ in range(800):
+        center += rng.uniform(-2, 2)
+        bids = [[random_price(rng, center - 1, 500, tick_size),
+                 '0' if rng.random() < 0.3 else str(round(rng.uniform(0.001, 10), 3))] for _ in range(10)]
+        asks = [[random_price(rng, center + 1, 500, tick_size),
+                 '0' if rng.random() < 0.3 else str(round(rng.uniform(0.001, 10), 3))] for _ in range(10)]
+        book.apply(bids, asks)
+        book.retain(center)
+        if book.bids.prices and book.asks.prices:
+            total += mismatches(book, on_tick(center, tick_size))
+    assert total == 0
+
+
+def test_bucket_counts_match_levels():
+    rng = random.Random(11)
+    book = OrderBook(STEPS, LEVEL_COUNT, ('levels', 100), 0.1)
+    for _ in range(3000):
+        side = rng.choice((book.bids, book.asks))
+        side.update(rng.randint(599000, 601000), 0.0 if rng.random() < 0.4 else rng.uniform(0.1, 5))
+        book.retain(60000.0)
+    for side in (book.bids, book.asks):
+        for step, (step_ticks, totals, counts) in zip(STEPS, side.bucket_tables):
+            expected = {}
+            for ticks in side.prices:
+                index = (ticks - side.offset) // step_ticks
+                expected[index] = expected.get(index, 0) + 1
+            # 没有价位的区间已删除，不留浮点残差
+            assert counts == expected
+            assert set(totals) == set(expected)
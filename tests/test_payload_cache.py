@@ -0,0 +1,122 @@
+import gzip
+import json
+import threading
+
+from app.services.payload_cache import EncodedPayload, PayloadCache
+
+
+def call_with_timeout(func, timeout=5):
+    """
+    在线程中调用，超时说明死锁
+    """
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('value', func()))
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), '调用超时，可能死锁'
+    return result['value']
+
+
+def test_gzip_first_does_not_deadlock():
+    payload = EncodedPayload({'BTC': {'spot': {'last_price': 1.5}}}, 'tag')
+    compressed = call_with_timeout(lambda: payload.body('json', True))
+    assert json.loads(gzip.decompress(compressed)) == payload.data
+    assert payload.body('json') == payload.json.encode()
+
+
+def test_cache_reuses_same_version():
+    cache = PayloadCache()
+    calls = []
+    build = lambda: calls.append(1) or {'value': len(calls)}
+    first = cache.get(('depth', 'BTCUSDT'), (1, 2), build)
+    assert cache.get(('depth', 'BTCUSDT'), (1, 2), build) is first
+    assert cache.get(('depth', 'BTCUSDT'), (1, 3), build) is not first
+    assert len(calls) == 2
+
+
+def test_depth_route_gzip_first_request():
+    import main
+    client = main.app.test_client()
+    response = call_with_timeout(lambda: client.get('/api/depth/BTC', headers={'Accept-Encoding': 'gzip'}))
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    body = json.loads(gzip.decompress(response.data))
+    assert body['symbol'] == 'BTC'
+    cached = client.get('/api/depth/BTC', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+
+def test_delta_is_encoded_once_per_version_pair():
+    cache = PayloadCache()
+    calls = []
+    build = lambda: calls.append(1) or {'seq': 2}
+    first = cache.get_delta(('room', 'BTC', 'spot', 10), 1, 2, build)
+    assert cache.get_delta(('room', 'BTC', 'spot', 10), 1, 2, build) is first
+    assert len(calls) == 1
+    assert cache.get_delta_chain(('room', 'BTC', 'spot', 10), [1, 2]) == [first]
+    # 缺少任何一段时不能只重放增量
+    assert cache.get_delta_chain(('room', 'BTC', 'spot', 10), [0, 1, 2]) is None
+
+
+def test_delta_history_is_bounded():
+    cache = PayloadCache()
+    key = ('room', 'BTC', 'spot', 10)
+    for seq in range(cache.MAX_DELTAS + 5):
+        cache.get_delta(key, seq, seq + 1, lambda: {})
+    assert len(cache.deltas[key]) == cache.MAX_DELTAS
+    assert cache.get_delta_chain(key, [0, 1]) is None
+    cache.discard(lambda key: key[1] == 'BTC')
+    assert cache.deltas == {}
+
+
+class RecordingEmitter:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((event, data, to))
+
+
+def make_pushing_service():
+    from app.services.websocket_service import WebSocketService
+    service = WebSocketService()
+    service.socketio_instance = RecordingEmitter()
+    service.load_order_book_snapshot('BTCUSDT', 'spot', {
+        'lastUpdateId': 1, 'bids': [['59990', '1']], 'asks': [['60010', '1']]
+    })
+    service.subscribe('sid', 'BTC', 'spot', 10)
+    return service
+
+
+def push_change(service, quantity):
+    service.update_order_book('BTCUSDT', 'spot', {'a': [['60010', str(quantity)]]})
+    service.publish_pending()
+    service.push_updated_data(['BTCUSDT'])
+
+
+def test_resync_replays_cached_deltas():
+    service = make_pushing_service()
+    emitter = service.socketio_instance
+    for quantity in (2, 3, 4):
+        push_change(service, quantity)
+    deltas = [frame for event, frame, _ in emitter.emitted if event == 'depth_delta']
+    assert [frame.data['seq'] for frame in deltas] == [1, 2, 3]
+    emitter.emitted.clear()
+    service.send_full_frame('sid', 'BTC:spot:10', 1)
+    # 客户端已应用序号1，只补发2和3，且复用推送时的编码结果
+    assert [(event, frame) for event, frame, _ in emitter.emitted] == [('depth_delta', deltas[1]), ('depth_delta', deltas[2])]
+
+
+def test_resync_falls_back_to_full_frame():
+    service = make_pushing_service()
+    emitter = service.socketio_instance
+    push_change(service, 2)
+    for since in (None, -1, 5, 'x', True):
+        emitter.emitted.clear()
+        service.send_full_frame('sid', 'BTC:spot:10', since)
+        assert [event for event, _, _ in emitter.emitted] == ['depth_full']
+    service.payload_cache.discard(lambda key: True)
+    emitter.emitted.clear()
+    service.send_full_frame('sid', 'BTC:spot:10', 0)
+    assert [event for event, _, _ in emitter.emitted] == ['depth_full']
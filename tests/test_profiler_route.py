@@ -0,0 +1,33 @@
+import pytest
+
+from app.services.metrics import profiler
+
+
+@pytest.fixture
+def client():
+    import main
+    yield main.app.test_client()
+    profiler.stop()
+
+
+@pytest.mark.parametrize('action', ['start', 'stop'])
+def test_get_cannot_toggle_profiler(client, action):
+    response = client.get(f'/debug/profiler?action={action}')
+    assert response.status_code == 405
+    assert not profiler.is_running()
+
+
+def test_post_starts_and_stops_profiler(client):
+    response = client.post('/debug/profiler', data={'action': 'start', 'interval': '0.01'})
+    assert response.status_code == 200
+    assert response.get_json()['running']
+    # GET只查看状态，不改变采样
+    assert client.get('/debug/profiler').get_json()['running']
+    response = client.post('/debug/profiler?action=stop')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert not profiler.is_running()
+
+
+def test_unknown_action_is_rejected(client):
+    assert client.post('/debug/profiler', data={'action': 'restart'}).status_code == 400
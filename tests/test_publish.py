@@ -0,0 +1,72 @@
+import threading
+import time
+
+from app.services.websocket_service import WebSocketService
+
+BOOK_A = ('BTCUSDT', 'spot')
+BOOK_B = ('ETHUSDT', 'spot')
+
+
+def make_service():
+    service = WebSocketService()
+    for symbol, market, price in (BOOK_A + (60000,), BOOK_B + (3000,)):
+        service.load_order_book_snapshot(symbol, market, {
+            'lastUpdateId': 1,
+            'bids': [[str(price - 1), '1']],
+            'asks': [[str(price + 1), '1']]
+        })
+    service.take_dirty()
+    return service
+
+
+def best_ask_quantity(service, key):
+    symbol, market = key
+    return service.depth_data[symbol][market].snapshot.asks.to_list()[0][1]
+
+
+def test_change_published_by_another_write_is_still_pushed():
+    service = make_service()
+    # 推送间隔内写入A，只记录为未发布
+    service.last_publish_time = time.perf_counter()
+    service.update_order_book(*BOOK_A, {'a': [['60001', '5']]})
+    assert best_ask_quantity(service, BOOK_A) == 1.0
+    # 写入方正持有锁，推送线程这一节拍不能发布，也不能把A当作已推送
+    with service.lock:
+        assert service.take_dirty() == {}
+    # 之后写入B时超过推送间隔，A和B一起发布，两者都要在下一节拍推送
+    service.last_publish_time = 0
+    service.update_order_book(*BOOK_B, {'a': [['3001', '7']]})
+    dirty = service.take_dirty()
+    assert set(dirty) == {BOOK_A, BOOK_B}
+    assert best_ask_quantity(service, BOOK_A) == 5.0
+    assert best_ask_quantity(service, BOOK_B) == 7.0
+
+
+def test_unpublished_change_is_published_by_next_free_tick():
+    service = make_service()
+    service.last_publish_time = time.perf_counter()
+    service.update_order_book(*BOOK_A, {'a': [['60001', '5']]})
+    with service.lock:
+        assert service.take_dirty() == {}
+    assert set(service.take_dirty()) == {BOOK_A}
+    assert best_ask_quantity(service, BOOK_A) == 5.0
+
+
+def test_marks_are_not_lost_while_dirty_is_swapped():
+    service = WebSocketService()
+    keys = [(f"S{i}", 'spot') for i in range(20000)]
+    taken = {}
+    done = threading.Event()
+
+    def publisher():
+        while not done.is_set():
+            taken.update(service.take_dirty())
+        taken.update(service.take_dirty())
+
+    thread = threading.Thread(target=publisher)
+    thread.start()
+    for key in keys:
+        service.mark_dirty(*key)
+    done.set()
+    thread.join()
+    assert len(taken) == len(keys)
@@ -0,0 +1,38 @@
+import pytest
+
+
+@pytest.mark.parametrize('event', ['subscribe', 'unsubscribe', 'depth_resync'])
+@pytest.mark.parametrize('args', [(), ('BTC',), ([1, 2],), (None,), (42,)])
+def test_handlers_ignore_non_object_payloads(event, args):
+    import main
+    client = main.socketio.test_client(main.app)
+    try:
+        client.emit(event, *args)
+        assert [message['name'] for message in client.get_received()] == []
+        # 之后的正常请求不受影响
+        client.emit('subscribe', {'symbol': 'BTC', 'market': 'spot', 'step': 10})
+        assert [message['name'] for message in client.get_received()] == ['depth_full']
+    finally:
+        client.disconnect()
+
+
+@pytest.mark.parametrize('seq', [None, 0, 'x'])
+def test_resync_sends_room_data(seq):
+    import main
+    client = main.socketio.test_client(main.app)
+    try:
+        client.emit('subscribe', {'symbol': 'BTC', 'market': 'spot', 'step': 10})
+        client.get_received()
+        client.emit('depth_resync', {'room': 'BTC:spot:10', 'seq': seq})
+        # 还没有推送过增量，只能发送完整数据
+        assert [message['name'] for message in client.get_received()] == ['depth_full']
+    finally:
+        client.disconnect()
+
+
+def test_async_handlers_ignore_non_object_payloads():
+    import asyncio
+    async_main = pytest.importorskip('async_main')
+    for handler in (async_main.subscribe, async_main.unsubscribe, async_main.depth_resync):
+        for data in (None, 'BTC', [1, 2], 42):
+            assert asyncio.run(handler('sid', data)) is None
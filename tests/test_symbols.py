@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from app.blueprints.ob import routes
+from app.config import CONFIG
+from app.services.websocket_service import WebSocketService
+
+AUTH = {'Authorization': 'Bearer secret'}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import main
+    monkeypatch.setattr(routes, 'ADMIN_TOKEN', 'secret')
+    yield main.app.test_client()
+    for symbol in ('SOLUSDT', 'XRPUSDT'):
+        if symbol in CONFIG:
+            main.websocket_service.remove_symbol(symbol)
+
+
+def test_admin_routes_require_token(client, monkeypatch):
+    body = {'symbol': 'SOLUSDT', 'markets': {'spot': {'1': 500}}}
+    assert client.post('/api/symbols', json=body).status_code == 401
+    assert client.post('/api/symbols', json=body, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    monkeypatch.setattr(routes, 'ADMIN_TOKEN', None)
+    assert client.post('/api/symbols', json=body, headers=AUTH).status_code == 403
+    assert 'SOLUSDT' not in CONFIG
+
+
+def test_add_and_remove_symbol(client):
+    response = client.post('/api/symbols', json={'symbol': 'solusdt', 'markets': {'spot': {'1': 500, '0.5': 200}}},
+                           headers=AUTH)
+    assert response.status_code == 201
+    assert CONFIG['SOLUSDT'] == {'spot': {1: 500.0, 0.5: 200.0}}
+    assert client.get('/api/config').get_json()['SOLUSDT'] == {'spot': {'1': 500.0, '0.5': 200.0}}
+    assert client.post('/api/symbols', json={'symbol': 'SOLUSDT', 'markets': {'spot': {'1': 1}}},
+                       headers=AUTH).status_code == 409
+    assert client.delete('/api/symbols/SOL', headers=AUTH).status_code == 200
+    assert 'SOLUSDT' not in CONFIG
+    assert client.delete('/api/symbols/SOL', headers=AUTH).status_code == 404
+
+
+@pytest.mark.parametrize('markets', [None, {}, {'spot': {}}, {'spot': {'abc': 1}}, {'spot': {'1': -5}},
+                                     {'options': {'1': 5}}, {'spot': {'0.000000001': 5}}])
+def test_invalid_market_config_is_rejected(client, markets):
+    response = client.post('/api/symbols', json={'symbol': 'XRPUSDT', 'markets': markets}, headers=AUTH)
+    assert response.status_code == 400
+    assert 'XRPUSDT' not in CONFIG
+
+
+def test_feed_tasks_are_kept_and_cancelled_with_their_shard():
+    service = WebSocketService()
+    service.streams_per_connection = 1
+    started = []
+
+    async def fake_feed(market, index, replica=0):
+        started.append((market, index, replica))
+        await asyncio.Event().wait()
+
+    service.create_websocket_async = fake_feed
+
+    async def run():
+        service.shards = {'spot': [{'BTCUSDT'}]}
+        service.start_shard_feeds('spot', 0)
+        await service.add_symbol_async('SOLUSDT', {'spot': {1: 500}})
+        await asyncio.sleep(0)
+        assert set(service.feed_tasks) == {('spot', 0, 0), ('spot', 1, 0)}
+        task = service.feed_tasks[('spot', 1, 0)]
+        await service.remove_symbol_async('SOLUSDT', ['spot'])
+        await asyncio.sleep(0)
+        assert task.cancelled()
+        assert set(service.feed_tasks) == {('spot', 0, 0)}
+        # 再次添加时复用空分片并重新启动连接
+        await service.add_symbol_async('SOLUSDT', {'spot': {1: 500}})
+        await asyncio.sleep(0)
+        assert set(service.feed_tasks) == {('spot', 0, 0), ('spot', 1, 0)}
+        for task in service.feed_tasks.values():
+            task.cancel()
+
+    asyncio.run(run())
+    assert started == [('spot', 0, 0), ('spot', 1, 0), ('spot', 1, 0)]
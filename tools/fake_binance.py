@@ -0,0 +1,175 @@
+"""
+本地模拟币安深度行情服务，用于离线验证快照+增量同步
+
+用法:
+    python tools/fake_binance.py --port 8765 --gap-every 50
+
+然后将WebSocketService指向本地地址:
+    websocket_service.ws_urls = {'spot': 'ws://127.0.0.1:8765/ws/spot', 'futures': 'ws://127.0.0.1:8765/ws/futures'}
+    websocket_service.snapshot_fetcher = BinanceSnapshotFetcher({
+        'spot': 'http://127.0.0.1:8765/api/v3/depth',
+        'futures': 'http://127.0.0.1:8765/fapi/v1/depth'
+    }, get_session=websocket_service.get_http_session)
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from aiohttp import web, WSMsgType
+
+BASE_PRICES = {'BTCUSDT': 60000.0, 'ETHUSDT': 3000.0}
+TICK_SIZES = {'BTCUSDT': 0.1, 'ETHUSDT': 0.01}
+
+
+class FakeBook:
+    def __init__(self, symbol, market, levels=200):
+        """
+        模拟单个交易对的订单簿和更新序号
+        """
+        self.symbol = symbol
+        self.market = market
+        self.tick = TICK_SIZES.get(symbol, 0.01)
+        self.mid = BASE_PRICES.get(symbol, 100.0)
+        self.update_id = 1000
+        self.bids = {}
+        self.asks = {}
+        for i in range(1, levels + 1):
+            self.bids[round(self.mid - i * self.tick, 8)] = round(random.uniform(0.1, 5), 3)
+            self.asks[round(self.mid + i * self.tick, 8)] = round(random.uniform(0.1, 5), 3)
+
+    def snapshot(self, limit):
+        bids = sorted(self.bids.items(), reverse=True)[:limit]
+        asks = sorted(self.asks.items())[:limit]
+        return {
+            'lastUpdateId': self.update_id,
+            'bids': [[str(p), str(q)] for p, q in bids],
+            'asks': [[str(p), str(q)] for p, q in asks]
+        }
+
+    def next_event(self, changes=10):
+        """
+        随机修改若干价位，返回一条depthUpdate消息
+        """
+        bids = []
+        asks = []
+        for _ in range(changes):
+            offset = random.randint(1, 60) * self.tick
+            quantity = 0.0 if random.random() < 0.2 else round(random.uniform(0.1, 5), 3)
+            if random.random() < 0.5:
+                price = round(self.mid - offset, 8)
+                self._set(self.bids, price, quantity)
+                bids.append([str(price), str(quantity)])
+            else:
+                price = round(self.mid + offset, 8)
+                self._set(self.asks, price, quantity)
+                asks.append([str(price), str(quantity)])
+        prev_id = self.update_id
+        first_id = prev_id + 1
+        self.update_id = prev_id + random.randint(1, 3)
+        event = {
+            'e': 'depthUpdate',
+            'E': int(time.time() * 1000),
+            's': self.symbol,
+            'U': first_id,
+            'u': self.update_id,
+            'b': bids,
+            'a': asks
+        }
+        if self.market == 'futures':
+            event['T'] = event['E']
+            event['pu'] = prev_id
+        return event
+
+    @staticmethod
+    def _set(side, price, quantity):
+        if quantity > 0:
+            side[price] = quantity
+        else:
+            side.pop(price, None)
+
+
+class FakeBinanceServer:
+    def __init__(self, symbols, interval=0.1, gap_every=0):
+        self.books = {
+            (symbol, market): FakeBook(symbol, market)
+            for symbol in symbols for market in ('spot', 'futures')
+        }
+        self.interval = interval
+        self.gap_every = gap_every
+        self.clients = {'spot': {}, 'futures': {}}
+        self.sent = 0
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get('/api/v3/depth', self.handle_snapshot('spot'))
+        app.router.add_get('/fapi/v1/depth', self.handle_snapshot('futures'))
+        app.router.add_get('/ws/spot', self.handle_ws('spot'))
+        app.router.add_get('/ws/futures', self.handle_ws('futures'))
+        app.on_startup.append(self.start_generator)
+        return app
+
+    def handle_snapshot(self, market):
+        async def handler(request):
+            symbol = request.query.get('symbol', '').upper()
+            limit = int(request.query.get('limit', 1000))
+            book = self.books.get((symbol, market))
+            if book is None:
+                return web.json_response({'code': -1121, 'msg': 'Invalid symbol.'}, status=400)
+            return web.json_response(book.snapshot(limit))
+        return handler
+
+    def handle_ws(self, market):
+        async def handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            subscriptions = set()
+            self.clients[market][ws] = subscriptions
+            try:
+                async for msg in ws:
+                    if msg.type != WSMsgType.TEXT:
+                        continue
+                    data = json.loads(msg.data)
+                    streams = {p.split('@')[0].upper() for p in data.get('params', [])}
+                    if data.get('method') == 'SUBSCRIBE':
+                        subscriptions.update(streams)
+                    elif data.get('method') == 'UNSUBSCRIBE':
+                        subscriptions.difference_update(streams)
+                    await ws.send_json({'result': None, 'id': data.get('id')})
+            finally:
+                self.clients[market].pop(ws, None)
+            return ws
+        return handler
+
+    async def start_generator(self, app):
+        app['generator'] = asyncio.create_task(self.generate())
+
+    async def generate(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            for (symbol, market), book in self.books.items():
+                event = book.next_event()
+                self.sent += 1
+                if self.gap_every and self.sent % self.gap_every == 0:
+                    # 故意丢弃一条增量，制造序号缺口
+                    continue
+                payload = json.dumps(event)
+                for ws, subscriptions in list(self.clients[market].items()):
+                    if symbol in subscriptions and not ws.closed:
+                        await ws.send_str(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟币安深度行情服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--interval', type=float, default=0.1, help='增量推送间隔（秒）')
+    parser.add_argument('--gap-every', type=int, default=0, help='每N条增量丢弃一条，0表示不丢弃')
+    parser.add_argument('--symbols', default='BTCUSDT,ETHUSDT')
+    args = parser.parse_args()
+    server = FakeBinanceServer(args.symbols.split(','), args.interval, args.gap_every)
+    web.run_app(server.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
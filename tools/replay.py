@@ -0,0 +1,35 @@
+"""
+离线回放行情录制文件
+
+用法:
+    python tools/replay.py data/capture.obcap --speed 0     # 最快速度
+    python tools/replay.py data/capture.obcap --speed 1     # 实时
+    python tools/replay.py data/capture.obcap --speed 10    # 10倍速
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.capture import replay  # noqa: E402
+from app.services.websocket_service import WebSocketService  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线回放行情录制文件')
+    parser.add_argument('path')
+    parser.add_argument('--speed', type=float, default=0, help='0为最快，1为实时，大于1为加速')
+    args = parser.parse_args()
+    service = WebSocketService()
+    stats = asyncio.run(replay(args.path, service, args.speed))
+    print(f"回放 {stats['frames']} 帧，用时 {stats['elapsed']:.3f}s，{stats['frames_per_second']:.0f} 帧/秒")
+    for symbol in service.depth_data:
+        for market, market_data in service.get_symbol_depth(symbol).items():
+            print(f"{symbol} {market}: 最新价 {market_data['last_price']}，"
+                  f"买单 {len(market_data['bids'])} 档，卖单 {len(market_data['asks'])} 档")
+
+
+if __name__ == '__main__':
+    main()